@@ -1,4 +1,3 @@
-from pylsl import StreamInfo, StreamOutlet
 import asyncio
 import aioconsole 
 import os
@@ -6,168 +5,200 @@ import signal
 import sys
 import getopt
 
-from bleak import BleakClient
-from bleak.uuids import uuid16_dict
-
-
-""" Predefined UUID (Universal Unique Identifier) mapping are based on Heart Rate GATT service Protocol that most
-Fitness/Heart Rate device manufacturer follow (Polar H10 in this case) to obtain a specific response input from 
-the device acting as an API """
-
-uuid16_dict = {v: k for k, v in uuid16_dict.items()}
-
-## UUID for model number ##
-MODEL_NBR_UUID = "0000{0:x}-0000-1000-8000-00805f9b34fb".format(
-    uuid16_dict.get("Model Number String")
-)
-
-
-## UUID for manufacturer name ##
-MANUFACTURER_NAME_UUID = "0000{0:x}-0000-1000-8000-00805f9b34fb".format(
-    uuid16_dict.get("Manufacturer Name String")
-)
-
-## UUID for battery level ##
-BATTERY_LEVEL_UUID = "0000{0:x}-0000-1000-8000-00805f9b34fb".format(
-    uuid16_dict.get("Battery Level")
-)
-
-## UUID for connection establishment with device ##
-PMD_SERVICE = "FB005C80-02E7-F387-1CAD-8ACD2D8DF0C8"
-
-## UUID for Request of stream settings ##
-PMD_CONTROL = "FB005C81-02E7-F387-1CAD-8ACD2D8DF0C8"
-
-## UUID for Request of start stream ##
-PMD_DATA = "FB005C82-02E7-F387-1CAD-8ACD2D8DF0C8"
-
-## UUID for Request of ECG Stream ##
-ECG_WRITE = bytearray([0x02, 0x00, 0x00, 0x01, 0x82, 0x00, 0x01, 0x01, 0x0E, 0x00])
-
-## For Polar H10  sampling frequency ##
-ECG_SAMPLING_FREQ = 130
-
-OUTLET = []
-
-
-def StartStream(STREAMNAME):
-
-    info = StreamInfo(STREAMNAME, 'ECG', 1,ECG_SAMPLING_FREQ, 'float32', 'myuid2424')
-
-    info.desc().append_child_value("manufacturer", "Polar")
-    channels = info.desc().append_child("channels")
-    for c in ["ECG"]:
-        channels.append_child("channel")\
-            .append_child_value("name", c)\
-            .append_child_value("unit", "microvolts")\
-            .append_child_value("type", "ECG")
-    
-    # next make an outlet; we set the transmission chunk size to 74 samples and
-    # the outgoing buffer size to 360 seconds (max.)
-    return StreamOutlet(info, 74, 360)
-
-
-
-## Bit conversion of the Hexadecimal stream
-def data_conv(sender, data: bytearray):
-    #global OUTLET
-    if data[0] == 0x00:
-        print(".", end = '', flush=True)
-        step = 3
-        samples = data[10:]
-        offset = 0
-        while offset < len(samples):
-            ecg = convert_array_to_signed_int(samples, offset, step)
-            offset += step
-            OUTLET.push_sample([ecg])
-            
-
-def convert_array_to_signed_int(data, offset, length):
-    return int.from_bytes(
-        bytearray(data[offset : offset + length]), byteorder="little", signed=True,
-    )
-
-
-def convert_to_unsigned_long(data, offset, length):
-    return int.from_bytes(
-        bytearray(data[offset : offset + length]), byteorder="little", signed=False,
-    )
-
-
-## ASynchronous task to start the data stream for ECG ##
-async def run(client, debug=False):
-
-    print("---------Looking for Device------------ ", flush=True)
-
-    await client.is_connected()
-    print("---------Device connected--------------", flush=True)
-
-    model_number = await client.read_gatt_char(MODEL_NBR_UUID)
-    print("Model Number: {0}".format("".join(map(chr, model_number))), flush=True)
-
-    manufacturer_name = await client.read_gatt_char(MANUFACTURER_NAME_UUID)
-    print("Manufacturer Name: {0}".format("".join(map(chr, manufacturer_name))), flush=True)
-
-    battery_level = await client.read_gatt_char(BATTERY_LEVEL_UUID)
-    print("Battery Level: {0}%".format(int(battery_level[0])), flush=True)
-
-    
-    await client.read_gatt_char(PMD_CONTROL)
-    print("Collecting GATT data...", flush=True)
-
-    await client.write_gatt_char(PMD_CONTROL, ECG_WRITE)
-    print("Writing GATT data...", flush=True)
-
-    ## ECG stream started
-    await client.start_notify(PMD_DATA, data_conv)
-
-    print("Collecting ECG data...", flush=True)
-
-    await aioconsole.ainput('Running: Press a key to quit')
-    await client.stop_notify(PMD_DATA)
-    print("Stopping ECG data...", flush=True)
+from polarband.devicecache import DeviceCache
+from polarband.pmd import ACC_RATES, ECG_SAMPLING_FREQ
+from polarband.filters import design, parse_filters
+from polarband.profiles import parse_profiles, apply_lsl_profile
+from polarband.session import PolarSession, MEASUREMENTS as ALL_MEASUREMENTS
+from polarband.transport import get_transport, parse_options
+from polarband.status import StatusReporter
+from polarband.worker import QueuedPipeline
+from polarband.metrics import Metrics, MetricsLogger
+from polarband.recorder import Recorder
+
+
+# the GATT handling, decoding and pushing live in polarband.session;
+# this script only parses the command line and runs the sessions
+
+
+async def main(SESSIONS, METRICS=None, METRICSLOG=0):
+    # every band is a task on this one event loop; each is supervised,
+    # reconnecting into the same outlets when its link drops
+    stop = asyncio.Event()
+    tasks = [asyncio.ensure_future(s.run(stop)) for s in SESSIONS]
+    # one status line every few seconds instead of a dot per notification
+    statuses = [("{0} {1}".format(s.name, m), status) for s in SESSIONS for m, status in s.statuses]
+    queues = [(s.name, s.pipeline) for s in SESSIONS if isinstance(s.pipeline, QueuedPipeline)]
+    reporter = asyncio.ensure_future(StatusReporter(
+        statuses, log=lambda text: print(text, flush=True), queues=queues).run(stop))
+    if METRICS is not None and METRICSLOG:
+        tasks.append(asyncio.ensure_future(MetricsLogger(
+            METRICS, METRICSLOG, log=lambda text: print(text, flush=True)).run(stop)))
+
+    async def wait_for_key():
+        await aioconsole.ainput('Running: Press a key to quit')
+        stop.set()
+
+    keyboard = asyncio.ensure_future(wait_for_key())
+    await asyncio.gather(*tasks)
+    keyboard.cancel()
+    await reporter
     print("[CLOSED] application closed.", flush=True)
-    sys.exit(0)
-
 
-async def main(ADDRESS, OUTLET):
-    try:
-        async with BleakClient(ADDRESS) as client:
-            tasks = [
-                asyncio.ensure_future(run(client, True)),
-            ]
 
-            await asyncio.gather(*tasks)
-    except:
-        pass
+def stream_names(STREAMNAME, n):
+    # -s A,B,C names the streams one by one; a single name is numbered
+    names = STREAMNAME.split(",")
+    if len(names) == n:
+        return names
+    if n == 1:
+        return [STREAMNAME]
+    return ["{0}{1}".format(names[0], i + 1) for i in range(n)]
 
 
 if __name__ == "__main__":
+    USAGE = ('Polar2LSL.py -a <MACADDRESS>[,<MACADDRESS>...] -s <STREAMNAME>[,<STREAMNAME>...] -b <BATCH>'
+             ' -m <ecg,acc,hr> -r <ACCRATE> -g -o <FILE.xdf> --FSYNC=<SECONDS> -q <QUEUESIZE>'
+             ' -p <PROFILE>[,<ecg|acc|hr|hrv|markers>=<PROFILE>...]'
+             ' -f --PREVIEW --FILTERS=<highpass=Hz,notch=Hz,bandpass=LOW-HIGH> --HRV=<SECONDS>'
+             ' --CONNECTS=<N> --CACHE=<FILE|none>'
+             ' --METRICS=<PORT> --METRICSLOG=<SECONDS> -x <NSIMULATED>'
+             ' --SIMOPTS=<jitter=s,drop=p,disconnect=s,replay=file.xdf>')
     try:
-        opts, args = getopt.getopt(sys.argv[1:],"ha:s:",["ADDRESS=","STREAMNAME="])
+        opts, args = getopt.getopt(sys.argv[1:],"ha:s:b:m:r:go:q:p:fx:",
+                                   ["ADDRESS=","STREAMNAME=","BATCH=","MEASUREMENTS=","ACCRATE=",
+                                    "MARKERS","RECORD=","FSYNC=","QUEUE=","PROFILE=","FILTERED","PREVIEW","FILTERS=","HRV=","CONNECTS=","CACHE=","METRICS=","METRICSLOG=","SIMULATE=","SIMOPTS="])
     except getopt.GetoptError:
-        print ('Polar2LSL.py -a <MACADDRESS> -s <STREAMNAME>', flush=True)
+        print (USAGE, flush=True)
         sys.exit(2)
     # Defaults:
     STREAMNAME = 'PolarBand'
+    BATCH = None    # notifications per LSL chunk (default: from the profile)
+    MEASUREMENTS = 'ecg'
+    ACCRATE = 200
+    MARKERS = False # marker stream with gaps and reconnects
+    RECORD = ''     # also record ECG/ACC to this local XDF file
+    FSYNC = 1.0     # seconds between flushes of the recording to disk
+    QUEUE = 0       # >0: decode and push on a worker thread, fed by a queue this long
+    PROFILE = 'default' # outlet and lsl_api.cfg tuning profile, see polarband/profiles.py
+    FILTERED = False    # also stream the filtered ECG as STREAMNAME_Filtered
+    PREVIEW = False     # and a 10 Hz version of it as STREAMNAME_Preview
+    FILTERS = ''        # filter settings, see polarband/filters.py
+    HRV = 0             # >0: HRV over this many seconds as STREAMNAME_HRV
+    CONNECTS = 4        # bands connecting at the same time
+    CACHE = ''          # device cache file (default: see polarband/devicecache.py), 'none': off
+    METRICSPORT = 0 # >0: serve metrics on http://127.0.0.1:PORT/metrics
+    METRICSLOG = 0  # >0: log the metrics as a JSON line every this many seconds
+    SIMULATE = 0    # number of simulated bands, instead of real ones
+    SIMOPTS = ''
     ADDRESS = "C7:4C:DA:51:37:51"
     #ADDRESS = "C9:09:F1:4C:AA:4D"
     
     for opt, arg in opts:
         if opt == '-h':
-            print ('Polar2LSL.py -a <MACADDRESS> -s <STREAMNAME>', flush=True)
+            print (USAGE, flush=True)
             sys.exit()
         elif opt in ("-a", "--ADDRESS"):
             ADDRESS = arg
         elif opt in ("-s", "--STREAMNAME"):
             STREAMNAME = arg
-            
-    print ('MACADDRESS is ', ADDRESS, flush=True)
-    print ('STREAMNAME is ', STREAMNAME, flush=True)
+        elif opt in ("-b", "--BATCH"):
+            BATCH = int(arg)
+        elif opt in ("-m", "--MEASUREMENTS"):
+            MEASUREMENTS = arg
+        elif opt in ("-r", "--ACCRATE"):
+            ACCRATE = int(arg)
+        elif opt in ("-g", "--MARKERS"):
+            MARKERS = True
+        elif opt in ("-o", "--RECORD"):
+            RECORD = arg
+        elif opt == "--FSYNC":
+            FSYNC = float(arg)
+        elif opt in ("-q", "--QUEUE"):
+            QUEUE = int(arg)
+        elif opt in ("-p", "--PROFILE"):
+            PROFILE = arg
+        elif opt in ("-f", "--FILTERED"):
+            FILTERED = True
+        elif opt == "--PREVIEW":
+            PREVIEW = True
+        elif opt == "--FILTERS":
+            FILTERS = arg
+        elif opt == "--HRV":
+            HRV = float(arg)
+        elif opt == "--CONNECTS":
+            CONNECTS = int(arg)
+        elif opt == "--CACHE":
+            CACHE = arg
+        elif opt == "--METRICS":
+            METRICSPORT = int(arg)
+        elif opt == "--METRICSLOG":
+            METRICSLOG = float(arg)
+        elif opt in ("-x", "--SIMULATE"):
+            SIMULATE = int(arg)
+        elif opt == "--SIMOPTS":
+            SIMOPTS = arg
+
+    MEASUREMENTS = [m.strip().lower() for m in MEASUREMENTS.split(",")]
+    for m in MEASUREMENTS:
+        if m not in ALL_MEASUREMENTS:
+            print (USAGE, flush=True)
+            sys.exit(2)
+    try:
+        PROFILE, STREAM_PROFILES = parse_profiles(PROFILE)
+        FILTERS = parse_filters(FILTERS)
+        if (FILTERED or PREVIEW) and "ecg" in MEASUREMENTS:
+            design(ECG_SAMPLING_FREQ, **FILTERS)
+    except ValueError as e:
+        print (e, flush=True)
+        sys.exit(2)
+    if HRV and "ecg" not in MEASUREMENTS and "hr" not in MEASUREMENTS:
+        print ('--HRV needs the ecg or hr measurement', flush=True)
+        sys.exit(2)
+    if ACCRATE not in ACC_RATES:
+        print ('ACCRATE must be one of', ACC_RATES, flush=True)
+        sys.exit(2)
 
-    OUTLET = StartStream(STREAMNAME)
+    CLIENT = get_transport(SIMULATE, **parse_options(SIMOPTS))[0]
+    if SIMULATE and not any(opt in ("-a", "--ADDRESS") for opt, arg in opts):
+        from polarband.simulator import simulated_addresses
+        ADDRESS = ",".join(simulated_addresses(SIMULATE))
+
+    ADDRESSES = [a.strip() for a in ADDRESS.split(",") if a.strip()]
+    NAMES = stream_names(STREAMNAME, len(ADDRESSES))
+
+    # the tuning keys must be in place before the first outlet
+    if not apply_lsl_profile(PROFILE):
+        print ('This liblsl cannot be tuned from memory; using lsl_api.cfg as is', flush=True)
+    RECORDER = Recorder(RECORD, FSYNC) if RECORD else None
+    METRICS = Metrics() if METRICSPORT or METRICSLOG else None
+    if RECORDER and RECORDER.dropped_bytes:
+        print ('Recovered', RECORD, ':', RECORDER.dropped_bytes, 'bytes of an unfinished chunk removed', flush=True)
+    DEVICES = DeviceCache(CACHE or None) if CACHE.lower() != 'none' else None
+    # created before the loop runs; asyncio binds it on first use
+    SLOTS = asyncio.Semaphore(max(CONNECTS, 1))
+    SESSIONS = []
+    for a, n in zip(ADDRESSES, NAMES):
+        print ('MACADDRESS is ', a, ', STREAMNAME is ', n, flush=True)
+        # each band its own outlets (identified by its address) and pipelines
+        SESSION = PolarSession(CLIENT, a, n, MEASUREMENTS, ACCRATE, batch=BATCH,
+                               profile=PROFILE, stream_profiles=STREAM_PROFILES,
+                               markers=MARKERS, filtered=FILTERED, preview=PREVIEW,
+                               filters=FILTERS, hrv=HRV, queue=QUEUE, recorder=RECORDER,
+                               cache=DEVICES, connect_slots=SLOTS,
+                               log=lambda text: print(text, flush=True))
+        SESSIONS.append(SESSION)
+        if METRICS:
+            METRICS.add(n, SESSION.pipeline)
+    print ('PROFILE is ', PROFILE, ', MEASUREMENTS are ', ",".join(MEASUREMENTS), flush=True)
     
     os.environ["PYTHONASYNCIODEBUG"] = str(1)
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    loop.run_until_complete(main(ADDRESS, OUTLET))
+    if METRICSPORT:
+        METRICS.serve(METRICSPORT)
+        print ('Metrics on http://127.0.0.1:{0}/metrics'.format(METRICSPORT), flush=True)
+    loop.run_until_complete(main(SESSIONS, METRICS, METRICSLOG))
+    if RECORDER:
+        RECORDER.close()
+        print ('Recorded to', RECORD, flush=True)
@@ -0,0 +1,52 @@
+"""
+Headless Polar H10 to LSL service (see polarband/daemon.py for the
+config file and the control commands).
+
+Run the daemon:              python PolarDaemon.py -c polardaemon.cfg
+Control the running daemon:  python PolarDaemon.py -c polardaemon.cfg status
+                             python PolarDaemon.py -c polardaemon.cfg stop PolarBand1
+"""
+
+import asyncio
+import getopt
+import json
+import sys
+
+from polarband.daemon import Daemon, read_config, send_command
+
+
+if __name__ == "__main__":
+    USAGE = 'PolarDaemon.py -c <CONFIG> [status [NAME] | start NAME|all | stop NAME|all | reload | shutdown]'
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hc:", ["CONFIG="])
+    except getopt.GetoptError:
+        print (USAGE, flush=True)
+        sys.exit(2)
+    CONFIG = 'polardaemon.cfg'
+
+    for opt, arg in opts:
+        if opt == '-h':
+            print (USAGE, flush=True)
+            sys.exit()
+        elif opt in ("-c", "--CONFIG"):
+            CONFIG = arg
+
+    try:
+        SETTINGS, BANDS = read_config(CONFIG)
+    except ValueError as e:
+        print ('Invalid config:', e, flush=True)
+        sys.exit(2)
+
+    if args:
+        # a command for the daemon that is already running
+        try:
+            REPLY = send_command(SETTINGS["control"], " ".join(args))
+        except OSError as e:
+            print ('No daemon on', SETTINGS["control"], '(', e, ')', flush=True)
+            sys.exit(1)
+        print (json.dumps(REPLY, indent=2), flush=True)
+        sys.exit(0 if REPLY.get("ok") else 1)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(Daemon(CONFIG, log=lambda text: print(text, flush=True)).run())
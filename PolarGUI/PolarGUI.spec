@@ -3,14 +3,21 @@
 
 a = Analysis(
     ['PolarGUI.py'],
-    pathex=[],
+    pathex=['..'],
     binaries=[],
     datas=[],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # pulled in by kivy/bleak/pkg_resources but never used by the GUI
+    # (see build/PolarGUI/xref-PolarGUI.html); keeps the bundle small
+    # and its unpacking at startup short
+    excludes=['pygments', 'docutils', 'PIL', 'cv2', 'ffpyplayer', 'gi',
+              'tkinter', 'IPython', 'matplotlib', 'scipy', 'trio',
+              'win32com', 'pywin', 'pythonwin', 'xmlrpc', 'pydoc_data',
+              'kivy.core.audio', 'kivy.core.video', 'kivy.core.camera',
+              'kivy.core.spelling', 'kivy.lib.gstplayer'],
     noarchive=False,
 )
 pyz = PYZ(a.pure)
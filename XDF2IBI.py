@@ -0,0 +1,78 @@
+"""
+Batch extraction of IBIs from recorded XDF files (the Python version
+of getIBI.m, see polarband/ibi.py). Every recording FILE.xdf gives a
+FILE_IBI.csv with the R-top times and IBIs in ms; several recordings
+are processed in parallel.
+
+Usage: python XDF2IBI.py [-s STREAMNAME] [-o OUTDIR] [-j JOBS] [-w DETREND_S] [-i] FILE.xdf ...
+"""
+
+import concurrent.futures
+import getopt
+import glob
+import os
+import sys
+
+from polarband.ibi import process_file
+
+
+def out_path(path, out_dir):
+    base = os.path.splitext(os.path.basename(path))[0] + "_IBI.csv"
+    return os.path.join(out_dir or os.path.dirname(path), base)
+
+
+if __name__ == "__main__":
+    USAGE = 'XDF2IBI.py [-s <STREAMNAME>] [-o <OUTDIR>] [-j <JOBS>] [-w <DETREND_S>] [-i] <FILE.xdf> ...'
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hs:o:j:w:i",
+                                   ["STREAMNAME=", "OUTDIR=", "JOBS=", "WINDOW=", "INVERTED"])
+    except getopt.GetoptError:
+        print (USAGE, flush=True)
+        sys.exit(2)
+    STREAMNAME = None   # default: the first ECG stream
+    OUTDIR = ''         # default: next to the recording
+    JOBS = os.cpu_count()
+    WINDOW = 1.0        # seconds of the moving-average detrend
+    INVERTED = False    # ECG recorded with the band upside down
+
+    for opt, arg in opts:
+        if opt == '-h':
+            print (USAGE, flush=True)
+            sys.exit()
+        elif opt in ("-s", "--STREAMNAME"):
+            STREAMNAME = arg
+        elif opt in ("-o", "--OUTDIR"):
+            OUTDIR = arg
+        elif opt in ("-j", "--JOBS"):
+            JOBS = arg
+        elif opt in ("-w", "--WINDOW"):
+            WINDOW = arg
+        elif opt in ("-i", "--INVERTED"):
+            INVERTED = True
+    try:
+        JOBS, WINDOW = int(JOBS), float(WINDOW)
+    except ValueError:
+        JOBS = WINDOW = 0
+    if JOBS < 1 or not 0 < WINDOW < float("inf"):
+        print ('JOBS must be a whole number and DETREND_S a number of seconds, both above 0', flush=True)
+        print (USAGE, flush=True)
+        sys.exit(2)
+
+    # the Windows shell does not expand wildcards
+    FILES = [f for a in args for f in (sorted(glob.glob(a)) or [a])]
+    if not FILES:
+        print (USAGE, flush=True)
+        sys.exit(2)
+    if OUTDIR:
+        os.makedirs(OUTDIR, exist_ok=True)
+
+    # one process per recording; each streams its file chunk by chunk
+    with concurrent.futures.ProcessPoolExecutor(min(JOBS, len(FILES))) as pool:
+        futures = {pool.submit(process_file, f, out_path(f, OUTDIR), name=STREAMNAME,
+                               window=WINDOW, inverted=INVERTED): f for f in FILES}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                path, count = future.result()
+                print ('{0}: {1} IBIs -> {2}'.format(path, count, out_path(path, OUTDIR)), flush=True)
+            except Exception as e:
+                print ('{0}: failed ({1})'.format(futures[future], e), flush=True)
@@ -0,0 +1,117 @@
+"""
+Time to first sample when bringing up many bands.
+
+Connects BANDS simulated bands (polarband.simulator) and reports the
+time from the start of each session to its first ECG sample, with the
+median per phase (see polarband.session). The simulated link takes
+CONNECT_DELAY, each GATT round trip GATT_DELAY and the discovery of
+each service DISCOVERY_DELAY seconds, and the adapter takes ADAPTER
+connection attempts at once. The modes:
+
+  legacy     the start sequence Polar2LSL.py had: all services
+             discovered, model, manufacturer and battery read and the
+             PMD control point read before the start command (these
+             reads show as part of connect), all bands at once
+  unbounded  the current sequence (only the services needed, static
+             reads after streaming started), all bands at once
+  cold       the current sequence, at most ADAPTER bands connecting
+  warm       the same with the device cache filled by the cold run
+             (no device information service; on Windows the GATT table
+             cached by the system, as the simulator models it)
+
+Usage: python benchmarks/bench_connect.py [--bands 8] [--adapter 2] [--gatt-delay 0.06]
+                                          [--discovery-delay 0.15] [--connect-delay 1.0]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from polarband.devicecache import DeviceCache
+from polarband.gatt import MODEL_NBR_UUID, MANUFACTURER_NAME_UUID, BATTERY_LEVEL_UUID, PMD_CONTROL
+from polarband.session import PolarSession
+from polarband.simulator import simulated_addresses
+from polarband.transport import get_transport
+
+
+class LegacySession(PolarSession):
+    # the full discovery and the reads that came before the start command
+    def _client_options(self, failures):
+        return {}
+
+    async def _start(self, client, first):
+        if first:
+            await client.is_connected()
+            for uuid in (MODEL_NBR_UUID, MANUFACTURER_NAME_UUID, BATTERY_LEVEL_UUID):
+                await client.read_gatt_char(uuid)
+        await client.read_gatt_char(PMD_CONTROL)
+        await PolarSession._start(self, client, first)
+
+
+async def bring_up(session_class, bands, connects, cache, options, timeout=60.0):
+    client_class = get_transport(bands, **options)[0]
+    slots = asyncio.Semaphore(connects) if connects else None
+    sessions = [session_class(client_class, a, "bench_connect_{0}".format(i), cache=cache,
+                              connect_slots=slots, log=lambda text: None)
+                for i, a in enumerate(simulated_addresses(bands))]
+    stop = asyncio.Event()
+    tasks = [asyncio.ensure_future(s.run(stop)) for s in sessions]
+    loop = asyncio.get_event_loop()
+    t0 = loop.time()
+    while loop.time() - t0 < timeout:
+        if all(s.statuses[0][1].connect_time is not None for s in sessions):
+            break
+        await asyncio.sleep(0.05)
+    # give the background reads of the last band time to finish
+    await asyncio.sleep(1.0)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return sessions
+
+
+def report(mode, sessions):
+    times = [s.statuses[0][1].connect_time for s in sessions]
+    done = [t for t in times if t is not None]
+    # median per phase over the bands
+    phases = {}
+    for s in sessions:
+        for k, v in s.phases.items():
+            phases.setdefault(k, []).append(v)
+    print("{0:<10} {1:>8.2f} {2:>8.2f} {3:>6} {4}".format(
+        mode, np.median(done) if done else float("nan"), max(done) if done else float("nan"),
+        "{0}/{1}".format(len(done), len(times)),
+        "  ".join("{0} {1:.2f}".format(k, np.median(v)) for k, v in phases.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bands", type=int, default=8)
+    parser.add_argument("--adapter", type=int, default=2, help="parallel connection attempts")
+    parser.add_argument("--gatt-delay", type=float, default=0.06, help="s per GATT round trip")
+    parser.add_argument("--discovery-delay", type=float, default=0.15, help="s per service")
+    parser.add_argument("--connect-delay", type=float, default=1.0, help="s per connection")
+    args = parser.parse_args()
+    options = {"gatt_delay": args.gatt_delay, "connect_delay": args.connect_delay,
+               "discovery_delay": args.discovery_delay, "adapter_connects": args.adapter}
+    print("{0} bands, {1} connection attempts at once, {2:.0f} ms per GATT round trip".format(
+        args.bands, args.adapter, 1000 * args.gatt_delay))
+    print("time to first sample (s); median phases")
+    print("{0:<10} {1:>8} {2:>8} {3:>6}".format("mode", "median", "max", "bands"))
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = DeviceCache(os.path.join(tmp, "devices.json"))
+        for mode, session_class, connects, cached in (
+                ("legacy", LegacySession, 0, None),
+                ("unbounded", PolarSession, 0, None),
+                ("cold", PolarSession, args.adapter, cache),
+                ("warm", PolarSession, args.adapter, cache)):
+            sessions = asyncio.run(bring_up(session_class, args.bands, connects, cached, options))
+            report(mode, sessions)
+
+
+if __name__ == "__main__":
+    main()
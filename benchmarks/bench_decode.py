@@ -0,0 +1,59 @@
+"""
+Micro-benchmark of the ECG notification decoder.
+
+Compares the original per-sample int.from_bytes loop (as it was in
+Polar2LSL.py, Polar2LSL2.py and PolarGUI.py) against the vectorized
+polarband.pmd.decode_ecg, and checks that both give the same samples.
+
+Usage: python benchmarks/bench_decode.py [FRAMES]
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from polarband.pmd import decode_ecg, encode_ecg
+
+
+def convert_array_to_signed_int(data, offset, length):
+    return int.from_bytes(
+        bytearray(data[offset : offset + length]), byteorder="little", signed=True,
+    )
+
+
+def legacy_decode(data):
+    step = 3
+    samples = data[10:]
+    offset = 0
+    out = []
+    while offset < len(samples):
+        out.append(convert_array_to_signed_int(samples, offset, step))
+        offset += step
+    return out
+
+
+def main(frames=2000):
+    rng = np.random.default_rng(0)
+    data = [encode_ecg(rng.integers(-2**23, 2**23, 73), i)
+            for i in range(frames)]
+
+    for d in data[:50]:
+        assert legacy_decode(d) == decode_ecg(d).tolist()
+
+    out = np.empty(73, dtype=np.int32)
+    cases = [
+        ("legacy int.from_bytes loop", lambda: [legacy_decode(d) for d in data]),
+        ("decode_ecg", lambda: [decode_ecg(d) for d in data]),
+        ("decode_ecg (out=)", lambda: [decode_ecg(d, out) for d in data]),
+    ]
+    print("frames: {0}, samples/frame: 73".format(frames))
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=1, repeat=5))
+        print("{0:<28} {1:10.0f} ns/frame".format(name, best / frames * 1e9))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
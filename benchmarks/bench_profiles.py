@@ -0,0 +1,174 @@
+"""
+Latency and memory of the outlet profiles (polarband/profiles.py).
+
+Each profile runs in a fresh interpreter, because the lsl_api.cfg
+tuning holds for the whole process. There it measures
+
+- memory: the resident set growth when OUTLETS bands (ECG, IBI and HR
+  outlets each) are created, and after a recorder in another process
+  has connected to all of them and SECONDS of data are pushed. Every
+  connection gets a queue of max_buffered seconds (or the inlet's
+  request, when smaller), allocated up front.
+- latency: the time from the arrival of a notification (the timestamp
+  of its samples) until an inlet has its last sample, pushing through
+  a ChunkPusher with the batch of the profile. Notifications come
+  SPEED times faster than real, so the wait for a full batch is 1/SPEED
+  of what it is with a band.
+
+Usage: python benchmarks/bench_profiles.py [--outlets 24] [--seconds 10] [--speed 10]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from polarband.profiles import PROFILES, get_profile, apply_lsl_profile
+from polarband.pmd import ECG_FRAME_SAMPLES, ECG_SAMPLING_FREQ
+
+
+def rss():
+    # resident set size in bytes (Linux), else the peak from getrusage
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+# the inlets of a recorder in another process, with LabRecorder's 360 s
+# buffer requests; each connection makes the outlet allocate its queue
+RECORDER = """
+import sys
+from pylsl import StreamInlet, resolve_bypred
+infos = resolve_bypred("starts-with(name,'{0}')", {1}, 10.0)
+inlets = [StreamInlet(info, max_buflen=360) for info in infos]
+for inlet in inlets:
+    inlet.open_stream(5.0)
+print(len(inlets), flush=True)
+sys.stdin.read()
+"""
+
+
+def memory(profile, outlets, seconds):
+    from pylsl import local_clock
+    from polarband.outlet import (outlet_chunk_size, start_ecg_stream, start_ibi_stream,
+                                  start_hr_stream)
+    p = get_profile(profile)
+    before = rss()
+    prefix = "bench_profiles_{0}_".format(os.getpid())
+    streams = []
+    for i in range(outlets):
+        name = prefix + str(i)
+        streams.append(start_ecg_stream(name, name, p.chunk_size or outlet_chunk_size(p.batch),
+                                        p.max_buffered))
+        streams.append(start_ibi_stream(name + "_IBI", name + "_IBI", p.max_buffered))
+        streams.append(start_hr_stream(name + "_HR", name + "_HR", p.max_buffered))
+    created = rss()
+    recorder = subprocess.Popen([sys.executable, "-c", RECORDER.format(prefix, len(streams))],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True)
+    recorder.stdout.readline()
+    chunk = np.zeros((ECG_FRAME_SAMPLES, 1), np.float32)
+    beat = [800.0]
+    for frame in range(int(seconds * ECG_SAMPLING_FREQ / ECG_FRAME_SAMPLES)):
+        now = local_clock()
+        for i in range(0, len(streams), 3):
+            streams[i].push_chunk(chunk, now)
+            streams[i + 1].push_sample(beat, now)
+            streams[i + 2].push_sample(beat, now)
+    time.sleep(0.5)
+    connected = rss()
+    recorder.communicate("")
+    return created - before, connected - before
+
+
+def latency(profile, speed, frames=200):
+    from pylsl import StreamInlet, local_clock, resolve_byprop
+    from polarband.outlet import ChunkPusher, outlet_chunk_size, start_ecg_stream
+    p = get_profile(profile)
+    name = "bench_profiles_latency_{0}".format(os.getpid())
+    outlet = start_ecg_stream(name, name, p.chunk_size or outlet_chunk_size(p.batch),
+                              p.max_buffered)
+    inlet = StreamInlet(resolve_byprop("name", name, timeout=5.0)[0], max_buflen=p.max_buffered)
+    inlet.open_stream(5.0)
+    latencies = []
+    done = threading.Event()
+
+    def pull():
+        while not done.is_set():
+            # pull_chunk would wait for more; a sample is returned at once
+            sample, stamp = inlet.pull_sample(timeout=0.2)
+            if stamp is not None:
+                latencies.append(local_clock() - stamp)
+
+    reader = threading.Thread(target=pull)
+    reader.start()
+    pusher = ChunkPusher(outlet, p.batch)
+    interval = ECG_FRAME_SAMPLES / ECG_SAMPLING_FREQ / speed
+    samples = np.zeros(ECG_FRAME_SAMPLES, np.float32)
+    stamps = np.empty(ECG_FRAME_SAMPLES)
+    start = time.perf_counter()
+    for frame in range(frames):
+        # the notification of this frame arrives now
+        stamps.fill(local_clock())
+        pusher.push(samples, stamps)
+        time.sleep(max(0.0, start + (frame + 1) * interval - time.perf_counter()))
+    pusher.flush()
+    time.sleep(0.5)
+    done.set()
+    reader.join()
+    return 1000.0 * np.percentile(latencies, [50, 95]) if latencies else [float("nan")] * 2
+
+
+def child(profile, outlets, seconds, speed):
+    tuned = apply_lsl_profile(profile)
+    p50, p95 = latency(profile, speed)
+    created, connected = memory(profile, outlets, seconds)
+    print(json.dumps({"profile": profile, "tuned": tuned, "created": created,
+                      "connected": connected, "p50": p50, "p95": p95}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--outlets", type=int, default=24, help="bands (3 outlets each)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="seconds of data pushed")
+    parser.add_argument("--speed", type=float, default=10.0, help="notifications faster than real")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("profiles", nargs="*", default=list(PROFILES))
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.outlets, args.seconds, args.speed)
+        return
+
+    print("{0} bands x 3 outlets, {1:.0f} s pushed to a recorder; latency at {2:g}x speed".format(
+        args.outlets, args.seconds, args.speed))
+    print("{0:<16} {1:>5} {2:>8} {3:>12} {4:>12} {5:>9} {6:>9}".format(
+        "profile", "batch", "buffer s", "outlets MB", "connected MB", "p50 ms", "p95 ms"))
+    for profile in args.profiles:
+        p = get_profile(profile)
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", profile,
+                               "--outlets", str(args.outlets), "--seconds", str(args.seconds),
+                               "--speed", str(args.speed)],
+                              capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+        if proc.returncode or not lines:
+            print("{0:<16} failed: {1}".format(profile, proc.stderr.strip().splitlines()[-1:]))
+            continue
+        r = json.loads(lines[-1])
+        print("{0:<16} {1:>5} {2:>8} {3:>12.1f} {4:>12.1f} {5:>9.1f} {6:>9.1f}{7}".format(
+            profile, p.batch, p.max_buffered, r["created"] / 2**20, r["connected"] / 2**20,
+            r["p50"], r["p95"], "" if r["tuned"] else "  (untuned liblsl)"))
+
+
+if __name__ == "__main__":
+    main()
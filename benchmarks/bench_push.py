@@ -0,0 +1,66 @@
+"""
+Benchmark of the LSL push path.
+
+Pushes synthetic ECG notifications through a real pylsl outlet, once
+with the original one-push_sample-per-sample loop and once through
+polarband.outlet.ChunkPusher at several batch sizes, and reports the
+CPU time per notification and the number of liblsl calls.
+
+Usage: python benchmarks/bench_push.py [FRAMES]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+from pylsl import StreamInfo, StreamOutlet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from polarband.pmd import decode_ecg, encode_ecg, ECG_FRAME_SAMPLES
+from polarband.outlet import ChunkPusher, outlet_chunk_size
+
+
+def make_outlet(name, chunk_size):
+    info = StreamInfo(name, 'ECG', 1, 130, 'float32', name)
+    return StreamOutlet(info, chunk_size, 360)
+
+
+def push_samples(outlet, frames):
+    for data in frames:
+        for ecg in decode_ecg(data).tolist():
+            outlet.push_sample([ecg])
+    return len(frames) * ECG_FRAME_SAMPLES
+
+
+def push_chunks(outlet, frames, batch):
+    pusher = ChunkPusher(outlet, batch)
+    for data in frames:
+        pusher.push(decode_ecg(data))
+    pusher.flush()
+    return -(-len(frames) // batch)
+
+
+def main(frames=5000):
+    rng = np.random.default_rng(0)
+    data = [encode_ecg(rng.integers(-2000, 2000, ECG_FRAME_SAMPLES), i)
+            for i in range(frames)]
+
+    cases = [("push_sample per sample", 1, push_samples)]
+    for batch in (1, 4, 8, 16):
+        cases.append(("push_chunk, batch {0}".format(batch), batch,
+                      lambda o, f, b=batch: push_chunks(o, f, b)))
+
+    print("frames: {0}, samples/frame: {1}".format(frames, ECG_FRAME_SAMPLES))
+    for i, (name, batch, fn) in enumerate(cases):
+        outlet = make_outlet("bench_push_{0}".format(i), outlet_chunk_size(batch))
+        t0 = time.process_time()
+        calls = fn(outlet, data)
+        cpu = time.process_time() - t0
+        print("{0:<24} {1:8.1f} us/frame  {2:7d} liblsl calls".format(
+            name, cpu / frames * 1e6, calls))
+        del outlet
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
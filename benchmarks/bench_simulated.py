@@ -0,0 +1,64 @@
+"""
+Load test of the acquisition pipeline on simulated bands.
+
+Runs N simulated H10s (polarband.simulator) on one event loop, each
+streaming ECG through its own EcgPipeline into a real LSL outlet, and
+reports notifications and samples per second and the CPU use of the
+process.
+
+Usage: python benchmarks/bench_simulated.py [BANDS] [SECONDS] [SIMOPTS]
+       e.g. python benchmarks/bench_simulated.py 64 20 jitter=0.02,drop=0.01
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from polarband.gatt import PMD_CONTROL, PMD_DATA
+from polarband.outlet import outlet_chunk_size, start_ecg_stream
+from polarband.pipeline import EcgPipeline
+from polarband.pmd import ecg_start_command
+from polarband.simulator import FakeBleakClient, simulated_addresses
+from polarband.transport import parse_options
+
+
+async def band(address, seconds, counts, options):
+    pipeline = EcgPipeline(start_ecg_stream("sim_" + address, address, outlet_chunk_size()))
+
+    def callback(sender, data):
+        counts[0] += 1
+        counts[1] += pipeline.process(data)
+
+    async with FakeBleakClient(address, **options) as client:
+        await client.write_gatt_char(PMD_CONTROL, ecg_start_command())
+        await client.start_notify(PMD_DATA, callback)
+        await asyncio.sleep(seconds)
+        await client.stop_notify(PMD_DATA)
+    pipeline.flush()
+
+
+async def main(bands, seconds, options, quiet=False):
+    counts = [0, 0]
+    t0, c0 = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(band(a, seconds, counts, options)
+                           for a in simulated_addresses(bands)))
+    wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+    stats = {"bands": bands, "seconds": wall,
+             "notifications_per_s": counts[0] / wall, "samples_per_s": counts[1] / wall,
+             "cpu_percent": 100 * cpu / wall, "cpu_percent_per_band": 100 * cpu / wall / bands}
+    if not quiet:
+        print("bands: {0}, {1:.0f} s".format(bands, wall))
+        print("notifications/s: {0:.1f}, samples/s: {1:.0f}".format(
+            stats["notifications_per_s"], stats["samples_per_s"]))
+        print("CPU: {0:.1f}% total, {1:.2f}% per band".format(
+            stats["cpu_percent"], stats["cpu_percent_per_band"]))
+    return stats
+
+
+if __name__ == "__main__":
+    bands = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    options = parse_options(sys.argv[3]) if len(sys.argv) > 3 else {}
+    asyncio.run(main(bands, seconds, options))
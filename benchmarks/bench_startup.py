@@ -0,0 +1,136 @@
+"""
+Startup time of the GUI: to its first frame, and per module imported.
+
+Starts the GUI (polarband.gui) in a fresh interpreter and measures the
+wall time from the start of the process to the first frame drawn in
+its window (Kivy's on_flip), checks it against a budget (--budget
+seconds, 3 by default; the exit status is 1 when over) and that pylsl
+and bleak are not loaded by then, as they are only needed at the first
+scan or connect. Then imports each module in a fresh interpreter with
+`python -X importtime` and reports the wall time of the import and the
+slowest modules it pulled in (cumulative, including their own imports).
+The GUI is started with KIVY_NO_ARGS set; opening its window needs a
+display.
+
+Usage: python benchmarks/bench_startup.py [MODULE ...] [--top 15] [--budget 3]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+MODULES = ["numpy", "pylsl", "bleak", "kivy.app", "polarband.ring",
+           "polarband.pipeline", "polarband.transport", "polarband.gui", "PolarGUI"]
+
+# seconds from starting the GUI to its first frame, from source
+BUDGET = 3.0
+
+# runs the GUI until its window has drawn one frame
+FIRST_FRAME = """
+import sys
+from kivy.core.window import Window
+from polarband import gui
+
+class BluetoothApp(gui.BluetoothApp):
+    def on_start(self):
+        super().on_start()
+        Window.bind(on_flip=self.first_frame)
+
+    def first_frame(self, window):
+        Window.unbind(on_flip=self.first_frame)
+        print("ready", "pylsl" in sys.modules, "bleak" in sys.modules, flush=True)
+        self.stop()
+
+BluetoothApp().run()
+"""
+
+
+def _env():
+    return dict(os.environ, KIVY_NO_ARGS="1", KIVY_NO_CONSOLELOG="1")
+
+
+def first_frame_time(timeout=60.0):
+    """
+    Returns (wall seconds to the first frame, modules loaded early), or
+    (None, error text) when the GUI does not start.
+    """
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", FIRST_FRAME], cwd=ROOT, env=_env(),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    wall = time.perf_counter() - t0
+    try:
+        stderr = proc.communicate(timeout=timeout)[1]
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        stderr = proc.communicate()[1]
+    words = line.split()
+    if not words or words[0] != "ready":
+        return None, stderr.strip().splitlines()[-1:]
+    early = [m for m, loaded in zip(("pylsl", "bleak"), words[1:]) if loaded == "True"]
+    return wall, early
+
+
+def import_time(module, top=15):
+    """
+    Returns (wall seconds, [(cumulative us, name), ...] slowest first),
+    or (None, error text) when the import fails.
+    """
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                          cwd=ROOT, env=_env(), capture_output=True, text=True)
+    wall = time.perf_counter() - t0
+    if proc.returncode:
+        return None, proc.stderr.strip().splitlines()[-1:]
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.rstrip()))
+    rows.sort(reverse=True)
+    return wall, rows[:top]
+
+
+def main(modules, top=15, budget=BUDGET):
+    result = {}
+    wall, early = first_frame_time()
+    if wall is None:
+        print("first frame: failed ({0})".format(" ".join(early)))
+        result["first_frame"] = None
+    else:
+        within = wall <= budget and not early
+        print("first frame: {0:.0f} ms (budget {1:.0f} ms){2} {3}".format(
+            wall * 1000, budget * 1000,
+            ", loaded before it: " + ", ".join(early) if early else "",
+            "ok" if within else "OVER"))
+        result["first_frame"] = {"wall_ms": wall * 1000, "budget_ms": budget * 1000,
+                                 "loaded_early": early, "within_budget": within}
+    for module in modules:
+        wall, rows = import_time(module, top)
+        if wall is None:
+            print("{0}: failed ({1})".format(module, " ".join(rows)))
+            result[module] = None
+            continue
+        print("{0}: {1:.0f} ms".format(module, wall * 1000))
+        for cumulative, name in rows:
+            print("  {0:8.1f} ms {1}".format(cumulative / 1000, name))
+        result[module] = {"wall_ms": wall * 1000,
+                          "slowest": [[name.strip(), us / 1000] for us, name in rows]}
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget", type=float, default=BUDGET)
+    args = parser.parse_args()
+    result = main(args.modules, args.top, args.budget)
+    if result["first_frame"] is not None and not result["first_frame"]["within_budget"]:
+        sys.exit(1)
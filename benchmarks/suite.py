@@ -0,0 +1,254 @@
+"""
+End-to-end benchmark suite.
+
+Measures, with synthetic PMD frames:
+  decode     ns per ECG notification (legacy loop and decode_ecg)
+  push       notifications and samples per second through EcgPipeline
+             into a real LSL outlet
+  alloc      memory allocated while pushing, for the bare ECG pipeline
+             and the default one of PolarSession (IBI stream and
+             quality): the peak over the run, what stays allocated, and
+             the most a single notification allocates at once (its
+             temporaries), which stays small when the notification path
+             reuses its buffers
+  callback   time spent in the BLE callback per notification, inline
+             and with the queue + worker (polarband.worker), percentiles
+             in us
+  latency    frame arrival (local_clock at the BLE callback) to receipt
+             by a local StreamInlet, percentiles in ms
+  bands      CPU % of the process (total and per band) with 1, 4, 16
+             and 64 simulated bands streaming ECG at the real rate
+
+and writes the results as JSON, to compare between releases.
+
+Usage: python benchmarks/suite.py [--out results.json] [--seconds 10]
+                                  [--bands 1,4,16,64] [--skip latency,...]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+import pylsl
+from pylsl import StreamInfo, StreamOutlet, StreamInlet, local_clock, resolve_byprop
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+from polarband.outlet import outlet_chunk_size, start_ibi_stream, start_quality_stream
+from polarband.pipeline import EcgPipeline, BandPipeline
+from polarband.quality import QualityEstimator
+from polarband.simulator import SimulatedBand
+from polarband.worker import QueuedPipeline
+from polarband.pmd import ECG_FRAME_SAMPLES, ECG_SAMPLING_FREQ, decode_ecg, encode_ecg
+from bench_decode import legacy_decode
+from bench_simulated import main as simulate_bands
+
+FRAME_NS = int(ECG_FRAME_SAMPLES * 1e9 / ECG_SAMPLING_FREQ)
+
+
+def make_frames(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [encode_ecg(rng.integers(-2000, 2000, ECG_FRAME_SAMPLES), (k + 1) * FRAME_NS)
+            for k in range(count)]
+
+
+def make_ecg_frames(count, seed=0):
+    # simulated ECG with beats, so the R-top and quality paths do work
+    band = SimulatedBand("bench", seed=seed)
+    return [encode_ecg(band.ecg(ECG_FRAME_SAMPLES), (k + 1) * FRAME_NS) for k in range(count)]
+
+
+def make_outlet(name, chunk_size=outlet_chunk_size()):
+    info = StreamInfo(name, 'ECG', 1, ECG_SAMPLING_FREQ, 'float32', name)
+    return StreamOutlet(info, chunk_size, 360)
+
+
+def bench_decode(frames=2000):
+    data = make_frames(frames)
+    out = np.empty(ECG_FRAME_SAMPLES, dtype=np.int32)
+    result = {}
+    for name, fn in (("legacy_ns_per_frame", lambda: [legacy_decode(d) for d in data]),
+                     ("decode_ecg_ns_per_frame", lambda: [decode_ecg(d, out) for d in data])):
+        result[name] = min(timeit.repeat(fn, number=1, repeat=5)) / frames * 1e9
+    return result
+
+
+def bench_push(frames=5000):
+    data = make_frames(frames)
+    pipeline = EcgPipeline(make_outlet("bench_suite_push"))
+    t0, c0 = time.perf_counter(), time.process_time()
+    arrival = local_clock()
+    for k, d in enumerate(data):
+        pipeline.process(d, arrival + k * FRAME_NS * 1e-9)
+    pipeline.flush()
+    wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+    return {"frames_per_s": frames / wall,
+            "samples_per_s": frames * ECG_FRAME_SAMPLES / wall,
+            "cpu_us_per_frame": cpu / frames * 1e6}
+
+
+def bench_alloc(frames=2000):
+    data = make_ecg_frames(frames)
+    result = {}
+    for mode in ("bare", "default"):
+        name = "bench_suite_alloc_" + mode
+        if mode == "bare":
+            pipeline = EcgPipeline(make_outlet(name))
+        else:
+            # as PolarSession streams ECG by default
+            pipeline = EcgPipeline(make_outlet(name), ibi_outlet=start_ibi_stream(
+                name + "_IBI", name + "_IBI"), quality=QualityEstimator(start_quality_stream(
+                    name + "_Quality", name + "_Quality")))
+        arrival = local_clock()
+        for k, d in enumerate(data[:100]):
+            pipeline.process(d, arrival + k * FRAME_NS * 1e-9)
+        tracemalloc.start()
+        frame_peak = 0
+        for k, d in enumerate(data[100:], 100):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            pipeline.process(d, arrival + k * FRAME_NS * 1e-9)
+            frame_peak = max(frame_peak, tracemalloc.get_traced_memory()[1] - before)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result[mode] = {"peak_bytes": peak, "retained_bytes": current,
+                        "frame_peak_bytes": frame_peak, "frames": frames - 100}
+    return result
+
+
+def bench_callback(frames=2000):
+    data = make_frames(frames)
+    result = {}
+    for mode in ("inline", "queued"):
+        pipeline = BandPipeline([EcgPipeline(make_outlet("bench_suite_cb_" + mode),
+                                             ibi_outlet=make_outlet("bench_suite_cb_ibi_" + mode))])
+        if mode == "queued":
+            pipeline = QueuedPipeline(pipeline, 64)
+        times = np.empty(frames)
+        arrival = local_clock()
+        for k, d in enumerate(data):
+            t0 = time.perf_counter()
+            pipeline.process(d, arrival + k * FRAME_NS * 1e-9)
+            times[k] = time.perf_counter() - t0
+            if k % 8 == 7:
+                time.sleep(0.001)   # let the worker run, as between notifications
+        pipeline.flush()
+        us = times * 1e6
+        result[mode] = {"p50_us": float(np.percentile(us, 50)), "p99_us": float(np.percentile(us, 99)),
+                        "max_us": float(us.max())}
+        if mode == "queued":
+            result[mode].update(pipeline.stats())
+            pipeline.close()
+    return result
+
+
+def bench_latency(frames=200, interval=0.02):
+    # the last sample of frame k carries k, so receipt can be matched
+    # to the arrival time of the frame
+    outlet = make_outlet("bench_suite_latency")
+    pipeline = EcgPipeline(outlet)
+    inlet = StreamInlet(resolve_byprop("name", "bench_suite_latency", timeout=5)[0])
+    inlet.open_stream(timeout=5)
+    arrivals = {}
+    latencies = []
+    done = threading.Event()
+
+    def consume():
+        # pull_sample returns as soon as a sample is in (pull_chunk
+        # would wait for its timeout)
+        while not done.is_set():
+            sample, stamp = inlet.pull_sample(timeout=0.1)
+            if sample is None:
+                continue
+            now = local_clock()
+            k = int(sample[0])
+            if k in arrivals:
+                latencies.append(now - arrivals.pop(k))
+
+    thread = threading.Thread(target=consume)
+    thread.start()
+    time.sleep(0.5)
+    data = make_frames(frames)
+    for k, d in enumerate(data):
+        values = decode_ecg(d)
+        values[:] = -1
+        values[-1] = k + 1
+        frame = encode_ecg(values, (k + 1) * FRAME_NS)
+        arrivals[k + 1] = local_clock()
+        pipeline.process(frame, arrivals[k + 1])
+        time.sleep(interval)
+    time.sleep(0.5)
+    done.set()
+    thread.join()
+    ms = np.array(latencies) * 1000.0
+    if not len(ms):
+        return {"received": 0}
+    return {"received": len(ms), "p50_ms": float(np.percentile(ms, 50)),
+            "p90_ms": float(np.percentile(ms, 90)), "p99_ms": float(np.percentile(ms, 99)),
+            "max_ms": float(ms.max())}
+
+
+def bench_bands(counts, seconds):
+    result = {}
+    for n in counts:
+        stats = asyncio.run(simulate_bands(n, seconds, {}, quiet=True))
+        result[str(n)] = stats
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit,
+            "python": platform.python_version(), "platform": platform.platform(),
+            "numpy": np.__version__, "liblsl": pylsl.library_version()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--bands", default="1,4,16,64")
+    parser.add_argument("--skip", default="")
+    args = parser.parse_args()
+    skip = set(args.skip.split(","))
+
+    results = {"environment": environment()}
+    if "decode" not in skip:
+        results["decode"] = bench_decode()
+        print("decode:", results["decode"], flush=True)
+    if "push" not in skip:
+        results["push"] = bench_push()
+        print("push:", results["push"], flush=True)
+    if "alloc" not in skip:
+        results["alloc"] = bench_alloc()
+        print("alloc:", results["alloc"], flush=True)
+    if "callback" not in skip:
+        results["callback"] = bench_callback()
+        print("callback:", results["callback"], flush=True)
+    if "latency" not in skip:
+        results["latency"] = bench_latency()
+        print("latency:", results["latency"], flush=True)
+    if "bands" not in skip:
+        results["bands"] = bench_bands([int(n) for n in args.bands.split(",")], args.seconds)
+        print("bands:", results["bands"], flush=True)
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print("written to", args.out)
+
+
+if __name__ == "__main__":
+    main()
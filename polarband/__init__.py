@@ -0,0 +1,10 @@
+"""
+Shared acquisition code for streaming Polar H10 data to
+labstreaminglayer (https://github.com/sccn/labstreaminglayer).
+
+Used by Polar2LSL.py (command line), PolarGUI.py (Kivy GUI) and
+PolarDaemon.py (service), which all stream through
+polarband.session.PolarSession.
+
+https://github.com/markspan/PolarBand2lsl/
+"""
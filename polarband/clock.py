@@ -0,0 +1,135 @@
+"""
+Sensor-clock based timestamps for PMD frames.
+
+Every PMD frame carries the sensor time (ns) of its last sample.
+SensorClock rebuilds a time for each sample from those frame times
+and maps it onto pylsl.local_clock() with an exponentially weighted
+linear regression of frame arrival time on sensor time. The slope
+of the regression absorbs the drift between the two clocks. Because
+BLE delivery only ever adds delay, the offset is then taken from the
+lower envelope of the drift-corrected arrival times, which follows
+the fastest deliveries; connection-interval jitter thus does not end
+up in the sample times.
+"""
+
+import numpy as np
+
+
+class SensorClock:
+    """
+    Online offset/drift estimate between a sensor clock and the local
+    clock, for one device.
+    """
+
+    # a frame interval further than this from the nominal one is
+    # treated as a gap, not as a measure of the sample rate
+    RATE_TOLERANCE = 0.05
+    # sensor time jumps larger than this (s) restart the regression;
+    # shorter gaps (e.g. a reconnect) keep the model, as the sensor
+    # clock runs on
+    MAX_GAP = 3600.0
+    # the drift is only estimated once the frames span this much
+    # sensor time (s), and is limited to MAX_DRIFT (relative)
+    MIN_SPAN = 10.0
+    MAX_DRIFT = 1e-3
+    # how fast (s per s) the lower envelope may rise again, so that it
+    # follows a drift the regression has not caught up with yet; while
+    # the drift estimate is still young (short span) it may rise by
+    # SETTLE / span instead
+    ENVELOPE_RISE = 5e-6
+    SETTLE = 0.05
+
+    def __init__(self, srate, halflife=120.0):
+        self.srate = srate
+        self.halflife = halflife
+        self.ramps = {}         # n -> [n-1, ..., 1, 0], per frame length
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the clock model, e.g. after the sensor restarted.
+        """
+        self.x0 = None          # sensor time of the first frame (s)
+        self.y0 = None          # arrival time of the first frame (s)
+        self.last_sensor = None
+        self.sample_interval = 1.0 / self.srate
+        self.sw = self.sx = self.sy = self.sxx = self.sxy = 0.0
+        self.envelope = 0.0
+        self.slope = 1.0
+        self.frames = 0
+        self.gap = 0.0
+        self.gap_start = 0.0
+
+    def update(self, sensor_ns, arrival, n, out=None):
+        """
+        Adds the frame with sensor time `sensor_ns` (of its last sample)
+        that arrived at local time `arrival`, and returns the local
+        timestamps of its `n` samples (written to `out` if given).
+        """
+        t = sensor_ns * 1e-9
+        self.gap = 0.0
+        if self.x0 is None or t <= self.last_sensor or t - self.last_sensor > self.MAX_GAP:
+            self.reset()
+            self.x0, self.y0 = t, arrival
+            dt = 0.0
+        else:
+            dt = t - self.last_sensor
+            nominal = n / self.srate
+            if abs(dt - nominal) < self.RATE_TOLERANCE * nominal:
+                self.sample_interval = dt / n
+            elif dt - n * self.sample_interval > 1.5 * self.sample_interval:
+                # samples missing between the previous frame and this one
+                self.gap = dt - n * self.sample_interval
+                self.gap_start = self.to_local(int((self.last_sensor + self.sample_interval) * 1e9))
+        self.last_sensor = t
+
+        x = t - self.x0
+        y = arrival - self.y0
+        decay = 0.5 ** (dt / self.halflife)
+        self.sw = self.sw * decay + 1.0
+        self.sx = self.sx * decay + x
+        self.sy = self.sy * decay + y
+        self.sxx = self.sxx * decay + x * x
+        self.sxy = self.sxy * decay + x * y
+        self.frames += 1
+
+        det = self.sw * self.sxx - self.sx * self.sx
+        if x >= self.MIN_SPAN and det > 0.0:
+            slope = (self.sw * self.sxy - self.sx * self.sy) / det
+            self.slope = min(max(slope, 1.0 - self.MAX_DRIFT), 1.0 + self.MAX_DRIFT)
+        # lower envelope of the arrivals, carried forward along the
+        # regression slope between frames; it may rise slowly so it
+        # can follow a drift the slope has not picked up yet
+        rise = max(self.ENVELOPE_RISE, self.SETTLE / max(x, self.MIN_SPAN))
+        if self.frames == 1:
+            self.envelope = y
+        else:
+            self.envelope = min(self.envelope + (self.slope + rise) * dt, y)
+
+        last = self.y0 + self.envelope
+        ramp = self.ramps.get(n)
+        if ramp is None:
+            ramp = self.ramps[n] = np.arange(n - 1, -1, -1, dtype=np.float64)
+        out = np.multiply(ramp, -self.slope * self.sample_interval, out=None if out is None else out[:n])
+        out += last
+        return out
+
+    @property
+    def drift(self):
+        """
+        Relative rate difference of the local clock against the sensor clock.
+        """
+        return self.slope - 1.0
+
+    @property
+    def offset(self):
+        """
+        Local time minus sensor time (s) under the current model.
+        """
+        return self.y0 + self.envelope - self.last_sensor
+
+    def to_local(self, sensor_ns):
+        """
+        Local time of a sensor timestamp under the current model.
+        """
+        return self.y0 + self.envelope + self.slope * (sensor_ns * 1e-9 - self.last_sensor)
@@ -0,0 +1,351 @@
+"""
+Headless service: bands from a config file, controlled over a socket.
+
+The config file (INI) has a [daemon] section and one section per band,
+named after its stream:
+
+    [daemon]
+    control = 127.0.0.1:8765    ; or the path of a Unix socket
+    record = session.xdf        ; optional, see polarband.recorder
+    metrics = 9100              ; optional, see polarband.metrics
+    profile = low-memory        ; lsl_api.cfg tuning, see polarband.profiles
+    connects = 4                ; bands connecting at the same time
+    cache = none                ; device cache file, see polarband.devicecache
+
+    [PolarBand1]
+    address = C7:4C:DA:51:37:51
+    measurements = ecg,hr
+    profile = low-memory,ecg=low-latency
+    chunk_size = 0              ; outlet chunk size (0: as pushed)
+    max_buffered = 360          ; outlet buffer (s)
+    filtered = yes              ; PolarBand1_Filtered, see polarband.filters
+    preview = yes               ; PolarBand1_Preview (10 Hz)
+    filters = highpass=0.5,notch=60
+    hrv = 120                   ; PolarBand1_HRV over 120 s, see polarband.hrv
+
+A band's profile defaults to the one of the daemon; chunk_size,
+max_buffered and batch override it for all streams of the band.
+
+Every band runs as a PolarSession task on the one event loop of the
+daemon. The control socket takes one command per line and answers each
+with one line of JSON:
+
+    status [NAME]       state of one or all bands
+    start NAME|all      connects and streams
+    stop NAME|all       halts the band and closes its outlets
+    reload              rereads the config; applies on the next start
+                        (except profile, connects and cache of the daemon)
+    shutdown            stops all bands and exits
+"""
+
+import asyncio
+import configparser
+import json
+import os
+import signal
+import socket
+
+from .filters import design, parse_filters
+from .devicecache import DeviceCache
+from .metrics import Metrics, MetricsLogger
+from .pmd import ACC_RATES, ECG_SAMPLING_FREQ
+from .profiles import get_profile, parse_profiles, apply_lsl_profile
+from .recorder import Recorder
+from .session import PolarSession, MEASUREMENTS
+from .status import StatusReporter
+from .transport import get_transport, parse_options
+
+DEFAULT_CONTROL = "127.0.0.1:8765"
+
+
+def read_config(path):
+    """
+    Returns (daemon settings, {band name: PolarSession options}) read
+    from the INI file `path`; raises ValueError on an invalid entry.
+    """
+    parser = configparser.ConfigParser(inline_comment_prefixes=(";", "#"))
+    try:
+        if not parser.read(path):
+            raise ValueError("cannot read {0}".format(path))
+    except configparser.Error as e:
+        raise ValueError(str(e))
+    if not parser.has_section("daemon"):
+        parser.add_section("daemon")
+    d = parser["daemon"]
+    settings = {"control": d.get("control", DEFAULT_CONTROL),
+                "simulate": d.getint("simulate", 0),
+                "simopts": d.get("simopts", ""),
+                "record": d.get("record", ""),
+                "fsync": d.getfloat("fsync", 1.0),
+                "metrics": d.getint("metrics", 0),
+                "metricslog": d.getfloat("metricslog", 0),
+                "status_interval": d.getfloat("status_interval", 30.0),
+                "profile": d.get("profile", "default"),
+                "connects": max(d.getint("connects", 4), 1),
+                "cache": d.get("cache", "")}
+    get_profile(settings["profile"])
+    bands = {}
+    for name in parser.sections():
+        if name == "daemon":
+            continue
+        s = parser[name]
+        if "address" not in s:
+            raise ValueError("[{0}]: no address".format(name))
+        measurements = [m.strip().lower() for m in s.get("measurements", "ecg").split(",") if m.strip()]
+        for m in measurements:
+            if m not in MEASUREMENTS:
+                raise ValueError("[{0}]: unknown measurement {1}".format(name, m))
+        try:
+            profile, stream_profiles = parse_profiles(s.get("profile", settings["profile"]))
+            filters = parse_filters(s.get("filters", ""))
+            if s.getboolean("filtered", False) or s.getboolean("preview", False):
+                design(ECG_SAMPLING_FREQ, **filters)
+        except ValueError as e:
+            raise ValueError("[{0}]: {1}".format(name, e))
+        acc_rate = s.getint("acc_rate", 200)
+        if acc_rate not in ACC_RATES:
+            raise ValueError("[{0}]: acc_rate must be one of {1}".format(name, ACC_RATES))
+        hrv = s.getfloat("hrv", 0)
+        if hrv < 0:
+            raise ValueError("[{0}]: hrv must be 0 (off) or a window in seconds".format(name))
+        if hrv and "ecg" not in measurements and "hr" not in measurements:
+            raise ValueError("[{0}]: hrv needs the ecg or hr measurement".format(name))
+        bands[name] = {"address": s["address"].strip(),
+                       "measurements": measurements,
+                       "acc_rate": acc_rate,
+                       "batch": s.getint("batch", None),
+                       "chunk_size": s.getint("chunk_size", None),
+                       "max_buffered": s.getint("max_buffered", None),
+                       "profile": profile,
+                       "stream_profiles": stream_profiles,
+                       "markers": s.getboolean("markers", False),
+                       "quality": s.getboolean("quality", True),
+                       "filtered": s.getboolean("filtered", False),
+                       "preview": s.getboolean("preview", False),
+                       "filters": filters,
+                       "hrv": hrv,
+                       "queue": s.getint("queue", 0),
+                       "autostart": s.getboolean("autostart", True)}
+    return settings, bands
+
+
+def _is_unix(control):
+    return os.sep in control or ":" not in control
+
+
+def send_command(control, command, timeout=10.0):
+    """
+    Sends one command to a running daemon; returns its decoded reply.
+    """
+    if _is_unix(control):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = control
+    else:
+        host, _, port = control.rpartition(":")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = (host, int(port))
+    with sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        sock.sendall(command.encode("utf-8") + b"\n")
+        reply = b""
+        while not reply.endswith(b"\n"):
+            data = sock.recv(65536)
+            if not data:
+                break
+            reply += data
+    return json.loads(reply.decode("utf-8"))
+
+
+class Daemon:
+    """
+    Runs the bands of the config file `path` until shut down.
+    """
+
+    def __init__(self, path, log=print):
+        self.path = path
+        self.log = log
+        self.settings, self.bands = read_config(path)
+        self.client_class = get_transport(self.settings["simulate"],
+                                          **parse_options(self.settings["simopts"]))[0]
+        self.sessions = {}      # name -> (PolarSession, stop event, task)
+        self.recorder = None
+        self.metrics = None
+        cache = self.settings["cache"]
+        self.cache = DeviceCache(cache or None) if cache.lower() != "none" else None
+        self.slots = asyncio.Semaphore(self.settings["connects"])
+        self.reporter = StatusReporter([], self.settings["status_interval"], log=log)
+        self.shutdown = None
+
+    def start(self, name):
+        if name in self.sessions:
+            raise ValueError("{0} is running".format(name))
+        if name not in self.bands:
+            raise ValueError("unknown band: {0}".format(name))
+        options = dict(self.bands[name])
+        del options["autostart"]
+        session = PolarSession(self.client_class, name=name, recorder=self.recorder,
+                               cache=self.cache, connect_slots=self.slots, log=self.log, **options)
+        stop = asyncio.Event()
+        try:
+            if self.metrics is not None:
+                self.metrics.add(name, session.pipeline)
+            task = asyncio.ensure_future(session.run(stop))
+            self.sessions[name] = (session, stop, task)
+        except Exception:
+            # all or nothing: a band is never left half registered
+            self.sessions.pop(name, None)
+            if self.metrics is not None:
+                self.metrics.remove(name)
+            raise
+        self._report()
+        self.log("Started {0} ({1})".format(name, session.address))
+
+    async def stop(self, name):
+        if name not in self.sessions:
+            raise ValueError("{0} is not running".format(name))
+        session, stop, task = self.sessions[name]
+        stop.set()
+        try:
+            await task
+        finally:
+            # a session that failed is gone all the same
+            del self.sessions[name]
+            if self.metrics is not None:
+                self.metrics.remove(name)
+            self._report()
+        self.log("Stopped {0}".format(name))
+
+    def status(self, name=None):
+        names = [name] if name else sorted(set(self.bands) | set(self.sessions))
+        status = {}
+        for n in names:
+            if n in self.sessions:
+                status[n] = dict(self.sessions[n][0].status(), running=True)
+            elif n in self.bands:
+                status[n] = {"address": self.bands[n]["address"], "running": False}
+            else:
+                raise ValueError("unknown band: {0}".format(n))
+        return status
+
+    def _report(self):
+        self.reporter.statuses = [("{0} {1}".format(n, m), s)
+                                  for n, (session, stop, task) in self.sessions.items()
+                                  for m, s in session.statuses]
+
+    async def command(self, line):
+        """
+        Executes one control command; returns the reply as a dict.
+        """
+        words = line.split()
+        if not words:
+            return {"ok": False, "error": "empty command"}
+        verb, args = words[0].lower(), words[1:]
+        try:
+            if verb == "status":
+                return {"ok": True, "bands": self.status(args[0] if args else None)}
+            if verb in ("start", "stop"):
+                if not args:
+                    raise ValueError("{0} needs a band name or 'all'".format(verb))
+                if args[0] == "all":
+                    names = [n for n in self.bands if n not in self.sessions] if verb == "start" \
+                        else list(self.sessions)
+                else:
+                    names = args
+                for n in names:
+                    if verb == "start":
+                        self.start(n)
+                    else:
+                        await self.stop(n)
+                return {"ok": True, verb: names}
+            if verb == "reload":
+                self.settings, self.bands = read_config(self.path)
+                return {"ok": True, "bands": sorted(self.bands)}
+            if verb == "shutdown":
+                self.shutdown.set()
+                return {"ok": True}
+            return {"ok": False, "error": "unknown command: {0}".format(verb)}
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}
+        except Exception as e:
+            # a client gets a reply whatever fails, and the daemon runs on
+            self.log("Command {0!r} failed: {1}: {2}".format(line.strip(), type(e).__name__, e))
+            return {"ok": False, "error": "{0}: {1}".format(type(e).__name__, e)}
+
+    async def _client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = await self.command(line.decode("utf-8", "replace"))
+                writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve(self):
+        control = self.settings["control"]
+        if _is_unix(control):
+            if os.path.exists(control):
+                os.unlink(control)
+            return await asyncio.start_unix_server(self._client, control)
+        host, _, port = control.rpartition(":")
+        return await asyncio.start_server(self._client, host, int(port))
+
+    async def run(self):
+        """
+        Starts the autostart bands and serves the control socket until a
+        shutdown command or SIGTERM/SIGINT.
+        """
+        self.shutdown = asyncio.Event()
+        loop = asyncio.get_event_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.shutdown.set)
+            except (NotImplementedError, AttributeError, ValueError):
+                pass    # Windows: Ctrl-C still raises KeyboardInterrupt
+
+        s = self.settings
+        if not apply_lsl_profile(s["profile"]):
+            self.log("This liblsl cannot be tuned from memory; using lsl_api.cfg as is")
+        if s["record"]:
+            self.recorder = Recorder(s["record"], s["fsync"])
+            if self.recorder.dropped_bytes:
+                self.log("Recovered {0}: {1} bytes of an unfinished chunk removed".format(
+                    s["record"], self.recorder.dropped_bytes))
+        tasks = [asyncio.ensure_future(self.reporter.run(self.shutdown))]
+        http = None
+        if s["metrics"] or s["metricslog"]:
+            self.metrics = Metrics()
+            if s["metrics"]:
+                http = self.metrics.serve(s["metrics"])
+            if s["metricslog"]:
+                tasks.append(asyncio.ensure_future(
+                    MetricsLogger(self.metrics, s["metricslog"], log=self.log).run(self.shutdown)))
+
+        server = await self._serve()
+        self.log("Control on {0}".format(s["control"]))
+        for name, band in self.bands.items():
+            if band["autostart"]:
+                try:
+                    self.start(name)
+                except Exception as e:
+                    # one band that cannot start leaves the others running
+                    self.log("Not started {0}: {1}".format(name, e))
+
+        await self.shutdown.wait()
+        server.close()
+        await server.wait_closed()
+        for name in list(self.sessions):
+            await self.stop(name)
+        await asyncio.gather(*tasks)
+        if http is not None:
+            http.shutdown()
+        if self.recorder is not None:
+            self.recorder.close()
+        if _is_unix(s["control"]) and os.path.exists(s["control"]):
+            os.unlink(s["control"])
+        self.log("[CLOSED] daemon stopped.")
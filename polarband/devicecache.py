@@ -0,0 +1,76 @@
+"""
+On-disk cache of what is known about each band, by address.
+
+A connection used to read the model, manufacturer and battery level
+before it started the ECG, each a GATT round trip. With the cache a
+PolarSession knows these values from the start and reads them only
+after streaming has started (the model and manufacturer not at all
+once known). A band in the cache is also one the system has connected
+before, so on Windows the session asks for the GATT table the system
+cached instead of discovering the services again. The file is JSON,
+small and rewritten whole (atomically) when a band was read, so several
+front-ends may share it.
+"""
+
+import json
+import os
+import time
+
+
+def default_path():
+    """
+    $POLARBAND_CACHE, else devices.json in the user's cache directory.
+    """
+    path = os.environ.get("POLARBAND_CACHE")
+    if path:
+        return path
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "polarband", "devices.json")
+
+
+class DeviceCache:
+    """
+    The bands in the file `path` (see default_path()); each entry holds
+    model, manufacturer, battery and seen (time).
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        self.devices = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                devices = json.load(f)
+            return devices if isinstance(devices, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, address):
+        """
+        What is known about `address` (a dict, empty if nothing).
+        """
+        return dict(self.devices.get(address.upper(), {}))
+
+    def update(self, address, **info):
+        """
+        Stores `info` for `address` and writes the file. Entries that
+        other processes wrote meanwhile are kept.
+        """
+        address = address.upper()
+        devices = self._load()
+        entry = devices.get(address, {})
+        entry.update(info, seen=time.time())
+        devices[address] = entry
+        self.devices = devices
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            temp = "{0}.{1}.tmp".format(self.path, os.getpid())
+            with open(temp, "w", encoding="utf-8") as f:
+                json.dump(devices, f, indent=1, sort_keys=True)
+            os.replace(temp, self.path)
+        except OSError:
+            pass    # a cache only; the next connect reads the band again
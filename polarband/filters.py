@@ -0,0 +1,303 @@
+"""
+Online filtering and decimation of the ECG, for derived outlets.
+
+Where getIBI.m removes the baseline of a whole recording afterwards,
+this filters every notification as it arrives: a Butterworth high-pass
+for baseline wander, a mains notch and optionally a Butterworth
+band-pass, as second-order sections (designed here with the bilinear
+transform, numpy only). The filter state carries from one notification
+to the next, so the output is the same as filtering the recording in
+one go.
+
+An IIR filter runs sample by sample, which in Python would cost a loop
+iteration per sample and section. SosFilter instead precomputes, once
+per block length, the matrices that map (state, block of input) onto
+(block of output, next state) of the whole cascade; every notification
+is then two small matrix products in numpy, exact up to rounding.
+
+Decimator low-pass filters and downsamples with a linear phase FIR,
+computing only the outputs it keeps (the polyphase form). FilterStage
+combines both behind an EcgPipeline and pushes to the optional
+NAME_Filtered (full rate) and NAME_Preview (10 Hz) outlets.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .outlet import ChunkPusher
+
+# 130 Hz / 13: the rate of the preview stream
+PREVIEW_FACTOR = 13
+# longest block handled with one matrix product; longer ones are split
+MAX_BLOCK = 256
+
+
+def _biquad(kind, freq, fs, q):
+    # RBJ audio EQ cookbook biquads (bilinear transform, prewarped at freq)
+    w0 = 2.0 * np.pi * freq / fs
+    cos, alpha = np.cos(w0), np.sin(w0) / (2.0 * q)
+    if kind == "lowpass":
+        b = [(1.0 - cos) / 2.0, 1.0 - cos, (1.0 - cos) / 2.0]
+    elif kind == "highpass":
+        b = [(1.0 + cos) / 2.0, -(1.0 + cos), (1.0 + cos) / 2.0]
+    elif kind == "notch":
+        b = [1.0, -2.0 * cos, 1.0]
+    else:
+        raise ValueError("unknown filter: {0}".format(kind))
+    a = [1.0 + alpha, -2.0 * cos, 1.0 - alpha]
+    return [b[0] / a[0], b[1] / a[0], b[2] / a[0], 1.0, a[1] / a[0], a[2] / a[0]]
+
+
+def butter_sections(kind, freq, fs, order=2):
+    """
+    Second-order sections (n, 6) of an even order Butterworth low-pass
+    or high-pass at `freq` Hz.
+    """
+    if order < 2 or order % 2:
+        raise ValueError("order must be even")
+    n = order // 2
+    return np.array([_biquad(kind, freq, fs, 1.0 / (2.0 * np.sin((2 * k + 1) * np.pi / (2 * order))))
+                     for k in range(n)])
+
+
+def notch_section(freq, fs, q=30.0):
+    """
+    Second-order section of a notch at `freq` Hz, -3 dB width freq / q.
+    """
+    return np.array([_biquad("notch", freq, fs, q)])
+
+
+def design(fs, highpass=0.5, notch=50.0, bandpass=None, order=2):
+    """
+    The sections of the ECG filter: high-pass (Hz, 0 for none), notch
+    (Hz, 0 for none) and band-pass ((low, high) Hz, or None). Raises
+    ValueError for a frequency outside 0 to fs/2, where the sections
+    would be unstable.
+    """
+    nyquist = fs / 2.0
+    sections = []
+    if highpass:
+        if not 0 < highpass < nyquist:
+            raise ValueError("highpass must be between 0 and {0:g} Hz: {1:g}".format(nyquist, highpass))
+        sections.append(butter_sections("highpass", highpass, fs, order))
+    if notch:
+        if not 0 < notch < nyquist:
+            raise ValueError("notch must be between 0 and {0:g} Hz: {1:g}".format(nyquist, notch))
+        sections.append(notch_section(notch, fs))
+    if bandpass:
+        low, high = bandpass
+        if not 0 < low < high < nyquist:
+            raise ValueError("bandpass must be LOW-HIGH with 0 < LOW < HIGH < {0:g} Hz: "
+                             "{1:g}-{2:g}".format(nyquist, low, high))
+        sections.append(butter_sections("highpass", low, fs, order))
+        sections.append(butter_sections("lowpass", high, fs, order))
+    if not sections:
+        raise ValueError("no filter selected")
+    return np.concatenate(sections)
+
+
+def parse_filters(text):
+    """
+    Parses the filter settings given as 'highpass=0.5,notch=60,bandpass=5-15'
+    into keyword arguments of design(); missing ones keep their default,
+    0 or 'none' disables one.
+    """
+    options = {}
+    for item in filter(None, (t.strip() for t in text.split(","))):
+        key, _, value = item.partition("=")
+        key, value = key.strip().lower(), value.strip().lower()
+        if key not in ("highpass", "notch", "bandpass"):
+            raise ValueError("unknown filter: {0}".format(key))
+        if value in ("", "0", "none", "off"):
+            options[key] = None
+        elif key == "bandpass":
+            low, _, high = value.partition("-")
+            try:
+                options[key] = (float(low), float(high))
+            except ValueError:
+                raise ValueError("bandpass must be LOW-HIGH (Hz): {0}".format(value))
+        else:
+            try:
+                options[key] = float(value)
+            except ValueError:
+                raise ValueError("{0} must be a frequency (Hz): {1}".format(key, value))
+    return options
+
+
+def describe(highpass=0.5, notch=50.0, bandpass=None):
+    """
+    The filter settings in words, for the stream description.
+    """
+    parts = []
+    if highpass:
+        parts.append("highpass {0:g} Hz".format(highpass))
+    if notch:
+        parts.append("notch {0:g} Hz".format(notch))
+    if bandpass:
+        parts.append("bandpass {0:g}-{1:g} Hz".format(*bandpass))
+    return ", ".join(parts)
+
+
+def _run(sos, x, z):
+    # reference cascade, transposed direct form II; z is updated in place
+    y = np.array(x, dtype=np.float64)
+    for s, (b0, b1, b2, a0, a1, a2) in enumerate(sos):
+        z1, z2 = z[2 * s], z[2 * s + 1]
+        for i in range(len(y)):
+            xi = y[i]
+            yi = b0 * xi + z1
+            z1 = b1 * xi - a1 * yi + z2
+            z2 = b2 * xi - a2 * yi
+            y[i] = yi
+        z[2 * s], z[2 * s + 1] = z1, z2
+    return y
+
+
+class SosFilter:
+    """
+    A cascade of second-order sections (n, 6) that keeps its state
+    between blocks.
+    """
+
+    def __init__(self, sos):
+        self.sos = np.asarray(sos, dtype=np.float64)
+        self.order = 2 * len(self.sos)
+        self.blocks = {}    # block length -> (T, O, A^N, K)
+        # the state that a constant input of 1 settles into, for a
+        # start without the step response of the high-pass
+        a, b = self._matrices(1)[2:]
+        self.zi = np.linalg.solve(np.eye(self.order) - a, b[:, 0])
+        self.reset()
+
+    def reset(self):
+        self.z = None
+
+    def _matrices(self, n):
+        m = self.blocks.get(n)
+        if m is not None:
+            return m
+        d = self.order
+        # impulse response and the state it leaves after 1..n samples
+        h = np.empty(n)
+        states = np.empty((n + 1, d))
+        states[0] = 0.0
+        z = np.zeros(d)
+        for i in range(n):
+            h[i] = _run(self.sos, [1.0 if i == 0 else 0.0], z)[0]
+            states[i + 1] = z
+        rows = np.arange(n)
+        lag = rows[:, None] - rows[None, :]
+        t = np.where(lag >= 0, h[np.clip(lag, 0, None)], 0.0)
+        k = states[n - rows].T                  # input j -> state after the block
+        # the response to each unit initial state
+        o = np.empty((n, d))
+        an = np.empty((d, d))
+        for i in range(d):
+            z = np.zeros(d)
+            z[i] = 1.0
+            o[:, i] = _run(self.sos, np.zeros(n), z)
+            an[:, i] = z
+        m = self.blocks[n] = (t, o, an, k)
+        return m
+
+    def process(self, x):
+        """
+        Filters one block; returns the output (float64).
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if self.z is None:
+            self.z = self.zi * (x[0] if len(x) else 0.0)
+        if len(x) > MAX_BLOCK:
+            return np.concatenate([self.process(x[i:i + MAX_BLOCK])
+                                   for i in range(0, len(x), MAX_BLOCK)])
+        t, o, an, k = self._matrices(len(x))
+        y = t @ x + o @ self.z
+        self.z = an @ self.z + k @ x
+        return y
+
+
+def lowpass_fir(factor, taps_per_phase=8):
+    """
+    Linear phase anti-alias FIR for decimation by `factor`: a Hamming
+    windowed sinc at 0.8 times the new Nyquist frequency.
+    """
+    n = taps_per_phase * factor + 1
+    cutoff = 0.8 * 0.5 / factor     # cycles per input sample
+    m = np.arange(n) - (n - 1) / 2.0
+    h = 2.0 * cutoff * np.sinc(2.0 * cutoff * m) * np.hamming(n)
+    return h / h.sum()
+
+
+class Decimator:
+    """
+    Keeps every `factor`-th sample of the low-pass filtered input. The
+    output is timestamped at the centre of the FIR, so it is not delayed
+    against the input.
+    """
+
+    def __init__(self, factor, taps=None):
+        self.factor = factor
+        self.taps = lowpass_fir(factor) if taps is None else np.asarray(taps, dtype=np.float64)
+        self.kernel = self.taps[::-1].copy()
+        self.reset()
+
+    def reset(self):
+        self.history = np.empty(0)
+        self.history_t = np.empty(0)
+        self.next = len(self.taps) - 1      # index of the next output's newest sample
+
+    def process(self, x, t):
+        """
+        Takes a block of samples and their timestamps; returns the
+        decimated samples and timestamps completed by it.
+        """
+        buf = np.concatenate((self.history, x))
+        buf_t = np.concatenate((self.history_t, t))
+        n = len(self.taps)
+        idx = np.arange(self.next, len(buf), self.factor)
+        if len(idx):
+            y = sliding_window_view(buf, n)[idx - (n - 1)] @ self.kernel
+            y_t = buf_t[idx - (n - 1) // 2]
+            self.next = idx[-1] + self.factor
+        else:
+            y, y_t = buf[:0], buf_t[:0]
+        drop = max(len(buf) - (n - 1), 0)
+        self.history, self.history_t = buf[drop:], buf_t[drop:]
+        self.next -= drop
+        return y, y_t
+
+
+class FilterStage:
+    """
+    Filters the ECG of a pipeline and feeds the derived outlets:
+    `filtered` at the full rate (pushed like the raw ECG, per `batch`
+    notifications) and `preview` decimated by `factor`.
+    """
+
+    def __init__(self, sos, filtered=None, preview=None, factor=PREVIEW_FACTOR, batch=1):
+        self.filter = SosFilter(sos)
+        self.filtered = ChunkPusher(filtered, batch) if filtered is not None else None
+        self.preview = preview
+        self.decimator = Decimator(factor) if preview is not None else None
+
+    def process(self, samples, stamps):
+        y = self.filter.process(samples)
+        if self.filtered is not None:
+            self.filtered.push(y, stamps)
+        if self.decimator is not None:
+            y, y_t = self.decimator.process(y, stamps)
+            if len(y):
+                self.preview.push_chunk(y.reshape(-1, 1), y_t.tolist())
+        return y
+
+    def reset(self):
+        """
+        Starts over, after a gap.
+        """
+        self.filter.reset()
+        if self.decimator is not None:
+            self.decimator.reset()
+
+    def flush(self):
+        if self.filtered is not None:
+            self.filtered.flush()
@@ -0,0 +1,16 @@
+"""
+GATT characteristics of the Polar H10 used by the front-ends.
+"""
+
+# Device Information and Battery services (Bluetooth SIG 16 bit UUIDs)
+DEVICE_INFORMATION_SERVICE = "0000180a-0000-1000-8000-00805f9b34fb"
+BATTERY_SERVICE = "0000180f-0000-1000-8000-00805f9b34fb"
+HEART_RATE_SERVICE = "0000180d-0000-1000-8000-00805f9b34fb"
+MODEL_NBR_UUID = "00002a24-0000-1000-8000-00805f9b34fb"
+MANUFACTURER_NAME_UUID = "00002a29-0000-1000-8000-00805f9b34fb"
+BATTERY_LEVEL_UUID = "00002a19-0000-1000-8000-00805f9b34fb"
+
+# Polar Measurement Data service, courtesy N. Pareek
+PMD_SERVICE = "FB005C80-02E7-F387-1CAD-8ACD2D8DF0C8"
+PMD_CONTROL = "FB005C81-02E7-F387-1CAD-8ACD2D8DF0C8"
+PMD_DATA = "FB005C82-02E7-F387-1CAD-8ACD2D8DF0C8"
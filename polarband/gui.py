@@ -0,0 +1,367 @@
+"""
+The Kivy GUI shared by PolarGUI.py and the frozen build in PolarGUI/.
+
+BluetoothApp scans for Polar H10 bands, lists each as a button that
+connects it, and runs every connected band as a PolarSession
+(polarband.session) on one BackgroundLoop, with its status on the
+button and a live ECG/IBI view (TraceWidget) below it. The entry points
+only add what differs between them (console, splash screen, window
+size). Set the KIVY_* and BLEAK_LOGGING environment variables before
+importing this module.
+"""
+
+import os
+# only probe the providers we use (SDL2 ships with Kivy on all desktops)
+for _provider in ("KIVY_WINDOW", "KIVY_TEXT", "KIVY_IMAGE"):
+    os.environ.setdefault(_provider, "sdl2")
+
+from kivy.app import App
+from kivy.core.window import Window
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.label import Label
+from kivy.uix.widget import Widget
+from kivy.graphics import Color, Line
+from kivy.uix.scrollview import ScrollView
+from kivy.clock import Clock, mainthread
+
+import logging
+import asyncio
+import concurrent.futures
+
+import numpy as np
+
+# pylsl and bleak (through .session and .transport) are imported on
+# the first scan or connect, not at startup
+from .loop import BackgroundLoop
+from .pmd import ECG_SAMPLING_FREQ
+from .ring import Scope
+from .scanner import DeviceScanner
+
+# the status display is redrawn at this rate, never per notification
+STATUS_FPS = 4
+# frame rate and time span of the live ECG views
+PLOT_FPS = 20
+PLOT_SECONDS = 5
+SCAN_SECONDS = 5
+# bands connecting at the same time
+CONNECTS = 4
+# button colour per ECG quality state (polarband/quality.py)
+QUALITY_COLORS = {None: (1, 1, 1, 1), "good": (1, 1, 1, 1),
+                  "irregular beats": (1, 0.8, 0.3, 1), "no beats": (1, 0.8, 0.3, 1),
+                  "noisy": (1, 0.8, 0.3, 1), "poor contact": (1, 0.3, 0.3, 1)}
+
+bleak_logger = logging.getLogger("bleak")
+bleak_logger.setLevel(10000)
+
+class TraceWidget(Widget):
+    """
+    Live view of one band: the last seconds of ECG (top) and the
+    recent inter-beat intervals (bottom), drawn from its Scope.
+    """
+
+    def __init__(self, scope, **kwargs):
+        super().__init__(**kwargs)
+        self.scope = scope
+        with self.canvas:
+            Color(0.3, 1, 0.3, 1)
+            self.ecg_line = Line(width=1)
+            Color(1, 0.6, 0.2, 1)
+            self.ibi_line = Line(width=1)
+
+    def redraw(self):
+        """
+        Redraws both traces; the ECG is reduced to the widget width first,
+        so the cost does not depend on the sample rate.
+        """
+        ecg = self.scope.ecg.envelope(max(int(self.width), 2))
+        self.ecg_line.points = self.trace(ecg, self.y + 0.3 * self.height, 0.7 * self.height)
+        ibi = self.scope.ibi.latest()
+        self.ibi_line.points = self.trace(ibi, self.y, 0.3 * self.height)
+
+    def trace(self, values, bottom, height):
+        if len(values) < 2:
+            return []
+        lo, hi = float(values.min()), float(values.max())
+        points = np.empty((len(values), 2))
+        points[:, 0] = np.linspace(self.x, self.right, len(values))
+        points[:, 1] = bottom + (values - lo) * (height / ((hi - lo) or 1.0))
+        return points.ravel().tolist()
+
+
+class BluetoothApp(App):
+    """
+    Kivy application for Bluetooth communication with Polar H10 device.
+    """
+    window_size = (400, 200)
+    # Build the GUI
+    busychars = ["o...", ".o..", "..o.", "...o"]
+    def build(self):
+        """
+        Build the Kivy GUI.
+        """
+        Window.size = self.window_size
+
+        self.stop_event = asyncio.Event()
+        self.busyLabel = None
+        self.busyvalue = 0
+        self.seen_packets = 0
+        # all band sessions run as tasks on this one loop/thread
+        self.ble = BackgroundLoop()
+        self.device_buttons = {}
+        self.all_button = None
+        self.sessions = {}      # address -> future of the running PolarSession
+        self.statuses = {}
+        self.traces = []
+        Clock.schedule_interval(self.refresh_status, 1.0 / STATUS_FPS)
+        Clock.schedule_interval(self.refresh_traces, 1.0 / PLOT_FPS)
+        # POLARBAND_SIMULATE=N runs the GUI on N simulated bands (no radio)
+        self.client_class = None
+        self.scanner = None
+        # outlet and lsl_api.cfg tuning profile, see polarband/profiles.py
+        self.profile = os.environ.get("POLARBAND_PROFILE", "default")
+        # 'Connect all' brings the bands up a few at a time
+        self.connect_slots = asyncio.Semaphore(CONNECTS)
+        self.devices = None
+
+        self.devices_layout = BoxLayout(orientation='vertical')
+        self.devices_scrollview = ScrollView()
+        self.devices_scrollview.add_widget(self.devices_layout)
+
+        self.scan_button = Button(text="Scan for Devices", size_hint=(1, 0.1))
+        self.scan_button.bind(on_press=self.scan_for_devices)
+
+        self.cancel_button = Button(text="Cancel", size_hint=(1, 0.1))
+        self.cancel_button.bind(on_press=self.stop_scanning)
+        
+        self.root_layout = BoxLayout(orientation='vertical')
+        self.root_layout.add_widget(self.scan_button)
+        self.root_layout.add_widget(self.devices_scrollview)
+        self.root_layout.add_widget(self.cancel_button)
+
+        return self.root_layout
+
+    def scan_for_devices(self, instance):
+        """
+        Callback for the device scanner: clears the bands not connected and starts scanning.
+        """
+        self.scan_button.disabled = True
+        # connected bands keep their button and live view; the rest is listed anew
+        keep = [self.busyLabel] + self.traces + [self.device_buttons[a][0] for a in self.sessions]
+        for widget in list(self.devices_layout.children):
+            if widget not in keep:
+                self.devices_layout.remove_widget(widget)
+        for address in [a for a in self.device_buttons if a not in self.sessions]:
+            del self.device_buttons[address]
+        self.all_button = None
+        self.add_busy_label()
+        self.busyLabel.text = "Scanning..."
+        self.ble.submit(self.async_scan()).add_done_callback(self.scan_done)
+
+    def load_transport(self):
+        """
+        Imports the BLE transport on first use (on the BLE thread, so
+        the window stays responsive meanwhile).
+        """
+        if self.client_class is not None:
+            return
+        from .transport import get_transport, parse_options
+        client_class, scanner_class = get_transport(
+            int(os.environ.get("POLARBAND_SIMULATE", "0")),
+            **parse_options(os.environ.get("POLARBAND_SIMOPTS", "")))
+        # remembers the bands it saw, so a rescan lists them at once
+        self.scanner = DeviceScanner(scanner_class, cb=dict(use_bdaddr=False),
+                                     scanning_mode='active')
+        self.client_class = client_class
+
+    async def async_scan(self):
+        """
+        Scans for Polar devices on the BLE thread; each one is added to
+        the interface as soon as it is seen.
+        """
+
+        try:
+            self.load_transport()
+            await self.scanner.scan(self.add_device_button, timeout=SCAN_SECONDS)
+            self.add_connect_all_button()
+        except Exception as e:
+            print(f"Error during scanning: {e}")
+
+    @mainthread
+    def scan_done(self, future):
+        """
+        Re-enables the scan button when the scan has finished.
+        """
+
+        self.scan_button.disabled = False
+        if self.busyLabel.text == "Scanning...":
+            self.busyLabel.text = ""
+
+    @mainthread
+    def add_device_button(self, d, a):
+        """
+        Adds a device button to the interface.
+        """
+
+        if d.address in self.sessions:
+            return      # streaming: listed with its live view already
+        if d.address in self.device_buttons and self.device_buttons[d.address][0].parent:
+            return
+
+        device_button = Button(text=d.name, size_hint=(1, 0.2))
+        device_button.bind(on_press=lambda instance, addr=d.address,
+                           nm=d.name: self.connect_to_device(addr, nm, instance))
+        self.devices_layout.add_widget(device_button)
+        self.device_buttons[d.address] = (device_button, d.name)
+
+    @mainthread
+    def add_connect_all_button(self):
+        """
+        Adds a button that connects to all listed devices at once, when
+        more than one is not connected yet.
+        """
+
+        if self.all_button is not None and self.all_button.parent:
+            return
+        if sum(not button.disabled for button, name in self.device_buttons.values()) < 2:
+            return
+        self.all_button = Button(text="Connect all", size_hint=(1, 0.2))
+        self.all_button.bind(on_press=self.connect_to_all)
+        self.devices_layout.add_widget(self.all_button)
+
+    def connect_to_all(self, instance):
+        """
+        Callback for the 'Connect all' button.
+        """
+
+        instance.disabled = True
+        for addr, (button, nm) in self.device_buttons.items():
+            if not button.disabled:
+                self.connect_to_device(addr, nm, button)
+
+    def add_busy_label(self):
+        """
+        Adds a busy label to the interface.
+        """
+
+        if self.busyLabel is not None and self.busyLabel.parent:
+            return
+        self.busyLabel = Label(text = "", valign = 'middle')
+        self.devices_layout.add_widget(self.busyLabel )
+        self.busyvalue = 0;
+    
+    def refresh_status(self, dt):
+        """
+        Redraws the status of the connected bands. Runs on the Kivy
+        clock; the BLE thread only updates the BandStatus counters.
+        """
+        if self.busyLabel is None:
+            return
+        packets = 0
+        for address, status in self.statuses.items():
+            button, name = self.device_buttons[address]
+            button.text = "{0}\n{1}".format(name, status.summary())
+            # the ECG quality shows in the summary, and a bad one in red
+            button.background_color = QUALITY_COLORS.get(status.quality, QUALITY_COLORS[None])
+            packets += status.packets
+        if packets != self.seen_packets:
+            self.seen_packets = packets
+            self.busyvalue = (self.busyvalue + 1) % 4
+            self.busyLabel.text = self.busychars[self.busyvalue]
+
+    def refresh_traces(self, dt):
+        """
+        Redraws the live ECG views.
+        """
+        for trace in self.traces:
+            trace.redraw()
+
+    def add_trace(self, button, scope):
+        """
+        Adds a live view of a band below its button.
+        """
+        trace = TraceWidget(scope, size_hint=(1, 0.4))
+        self.devices_layout.add_widget(trace, index=self.devices_layout.children.index(button))
+        self.traces.append(trace)
+
+    def connect_to_device(self, device_address, name, instance):
+        """
+        Callback for the individual Polar device buttons.
+        Initiates the connection to the selected device.
+        """
+
+        # callback for the individual Polar buttons.
+        if device_address in self.sessions:
+            return      # one session (and one set of outlets) per band
+        scope = Scope(ECG_SAMPLING_FREQ, PLOT_SECONDS)
+        self.add_trace(instance, scope)
+        self.busyLabel.text = "Connecting..."
+        instance.disabled = True
+        # the imports, the transport and the session are set up on the
+        # BLE thread, like in async_scan, so the window does not stall
+        self.sessions[device_address] = self.ble.submit(
+            self.async_connect(device_address, name, scope, first=not self.sessions))
+
+    async def async_connect(self, device_address, name, scope, first):
+        """
+        Creates and runs the PolarSession of one band on the BLE thread.
+        """
+
+        try:
+            from .profiles import parse_profiles, apply_lsl_profile
+            from .session import PolarSession
+
+            profile, stream_profiles = parse_profiles(self.profile)
+            if first:
+                # before the first outlet, or liblsl has read its config already
+                apply_lsl_profile(profile)
+            self.load_transport()
+            if self.devices is None:
+                # known bands stream before their model and battery are read
+                from .devicecache import DeviceCache
+                self.devices = DeviceCache()
+            # every band gets its own outlets (source_id = address) and pipeline;
+            # the session reconnects into them when the connection drops
+            session = PolarSession(self.client_class, device_address, name, profile=profile,
+                                   stream_profiles=stream_profiles, scope=scope,
+                                   cache=self.devices, connect_slots=self.connect_slots)
+        except Exception as e:
+            print(f"Error connecting to {name}: {e}")
+            self.connect_failed(device_address, scope)
+            return
+        self.set_status(device_address, session.statuses[0][1])
+        await session.run(self.stop_event)
+
+    @mainthread
+    def set_status(self, device_address, status):
+        """
+        Shows the status of a band on its button from now on.
+        """
+
+        self.statuses[device_address] = status
+
+    @mainthread
+    def connect_failed(self, device_address, scope):
+        """
+        Makes the button of a band that could not be set up usable
+        again, without its live view.
+        """
+
+        self.sessions.pop(device_address, None)
+        for trace in [t for t in self.traces if t.scope is scope]:
+            self.traces.remove(trace)
+            self.devices_layout.remove_widget(trace)
+        if device_address in self.device_buttons:
+            self.device_buttons[device_address][0].disabled = False
+        if self.busyLabel is not None and self.busyLabel.text == "Connecting...":
+            self.busyLabel.text = ""
+
+    def stop_scanning(self, instance):
+        """
+        Stops the scanningdata aquisition and the application.
+        """
+        self.ble.call(self.stop_event.set)
+        # give the sessions a moment to stop their notifications
+        concurrent.futures.wait(self.sessions.values(), timeout=5)
+        self.ble.stop()
+        App.get_running_app().stop()
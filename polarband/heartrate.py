@@ -0,0 +1,40 @@
+"""
+Decoding of the standard Heart Rate Measurement characteristic.
+
+Flags (byte 0): bit 0 set = 16-bit heart rate, bits 1-2 sensor
+contact, bit 3 energy expended field present, bit 4 RR intervals
+present. RR intervals are uint16 in 1/1024 s.
+"""
+
+import numpy as np
+
+HEART_RATE_MEASUREMENT_UUID = "00002a37-0000-1000-8000-00805f9b34fb"
+
+HR_16BIT = 0x01
+HR_CONTACT_SUPPORTED = 0x04
+HR_CONTACT = 0x02
+HR_ENERGY = 0x08
+HR_RR = 0x10
+
+
+def parse_heart_rate(data):
+    """
+    Returns (heart rate in bpm, RR intervals in ms as a float64 array,
+    sensor contact: True/False, or None when not supported).
+    """
+    flags = data[0]
+    if flags & HR_16BIT:
+        hr = int.from_bytes(data[1:3], "little")
+        offset = 3
+    else:
+        hr = data[1]
+        offset = 2
+    if flags & HR_ENERGY:
+        offset += 2
+    contact = bool(flags & HR_CONTACT) if flags & HR_CONTACT_SUPPORTED else None
+    if flags & HR_RR and len(data) > offset + 1:
+        n = (len(data) - offset) // 2
+        rr = np.frombuffer(data, dtype="<u2", count=n, offset=offset) * (1000.0 / 1024.0)
+    else:
+        rr = np.empty(0)
+    return hr, rr, contact
@@ -0,0 +1,213 @@
+"""
+Heart rate variability over a sliding window, updated every beat.
+
+HrvEngine takes one IBI per beat, from the R-tops of an EcgPipeline or
+the RR intervals of a HrPipeline, and after every beat gives, over the
+last `window` seconds (typically 30 to 300):
+
+    rmssd   root mean square of successive differences (ms)
+    sdnn    standard deviation of the IBIs (ms)
+    pnn50   successive differences over 50 ms (%)
+    lf      power 0.04-0.15 Hz (ms^2)
+    hf      power 0.15-0.4 Hz (ms^2)
+    lf_hf   lf / hf
+
+Nothing is recomputed over the window. The time domain measures come
+from running sums that each beat adds to and each beat leaving the
+window subtracts from. The spectrum is a Lomb-Scargle periodogram,
+which needs no resampling of the unevenly spaced IBIs and is also built
+from sums over the beats (of cos and sin of each frequency times the
+beat time), so a beat costs a fixed number of operations on
+preallocated arrays over the frequency grid, whatever the window
+length. The beats of the window are kept in a preallocated ring, only
+to subtract them again.
+"""
+
+import math
+
+import numpy as np
+
+HRV_CHANNELS = ("rmssd", "sdnn", "pnn50", "lf", "hf", "lf_hf")
+HRV_UNITS = ("ms", "ms", "percent", "ms^2", "ms^2", "")
+
+LF_BAND = (0.04, 0.15)
+HF_BAND = (0.15, 0.4)
+
+
+class HrvEngine:
+    """
+    HRV of one band over the last `window` seconds. IBIs outside
+    `min_ibi` to `max_ibi` (s) are taken as artefacts and skipped; they
+    also break the chain of successive differences. Every beat pushes
+    one sample to `outlet` (see polarband.outlet.start_hrv_stream), once
+    `min_beats` are in the window. lf, hf and lf_hf are NaN until the
+    window spans a full LF period (25 s).
+    """
+
+    def __init__(self, window=60.0, outlet=None, min_ibi=0.3, max_ibi=2.0, min_beats=3,
+                 resolution=0.005):
+        self.window = float(window)
+        self.outlet = outlet
+        self.min_ibi = min_ibi
+        self.max_ibi = max_ibi
+        self.min_beats = min_beats
+        # frequency grid: bin centres over the LF and HF bands
+        self.df = resolution
+        self.freqs = np.arange(LF_BAND[0] + resolution / 2, HF_BAND[1], resolution)
+        self.omega = 2.0 * np.pi * self.freqs
+        self.lf_bins = self.freqs < LF_BAND[1]
+        # ring of (time, IBI) in the window; at most one beat per min_ibi
+        self.capacity = int(math.ceil(self.window / min_ibi)) + 2
+        self.times = np.zeros(self.capacity)
+        self.ibis = np.zeros(self.capacity)
+        self.diffs = np.zeros(self.capacity)    # successive difference, NaN if none
+        f = len(self.freqs)
+        # per frequency: sum cos wt, sin wt, x cos wt, x sin wt, cos 2wt, sin 2wt
+        self.sums = np.zeros((6, f))
+        self.scratch = np.zeros((6, f))
+        self.values = [float("nan")] * len(HRV_CHANNELS)
+        self.reset()
+
+    def reset(self):
+        """
+        Empties the window, after a gap.
+        """
+        self.start = 0
+        self.count = 0
+        self.t0 = None          # beat times are taken relative to this
+        self.x0 = None          # and IBIs relative to this, for precision
+        self.last = None        # previous accepted IBI (ms), None after an artefact
+        self.sum_x = 0.0
+        self.sum_x2 = 0.0
+        self.sum_d2 = 0.0
+        self.n_d = 0
+        self.n_nn50 = 0
+        self.sums.fill(0.0)
+        self.values[:] = [float("nan")] * len(HRV_CHANNELS)
+
+    def _terms(self, t, x):
+        # cos wt, sin wt, x cos wt, x sin wt, cos 2wt, sin 2wt into scratch
+        s = self.scratch
+        np.multiply(self.omega, t, out=s[4])
+        np.cos(s[4], out=s[0])
+        np.sin(s[4], out=s[1])
+        np.multiply(s[0], x, out=s[2])
+        np.multiply(s[1], x, out=s[3])
+        # double angle, from the single one
+        np.multiply(s[0], s[1], out=s[5])
+        s[5] *= 2.0
+        np.multiply(s[0], s[0], out=s[4])
+        s[4] *= 2.0
+        s[4] -= 1.0
+        return s
+
+    def _remove_oldest(self):
+        i = self.start
+        t, x = float(self.times[i]), float(self.ibis[i])
+        self.sum_x -= x
+        self.sum_x2 -= x * x
+        self.sums -= self._terms(t, x)
+        self.start = (i + 1) % self.capacity
+        self.count -= 1
+        if self.count:
+            # the difference to the next beat leaves with this one
+            j = self.start
+            d = float(self.diffs[j])
+            if d == d:
+                self.sum_d2 -= d * d
+                self.n_d -= 1
+                self.n_nn50 -= int(abs(d) > 50.0)
+                self.diffs[j] = float("nan")
+
+    def beat(self, time, ibi):
+        """
+        Takes one beat: its time (s, e.g. the R-top) and the IBI (s)
+        ending there. Returns the HRV values, or None for an artefact.
+        """
+        if not self.min_ibi <= ibi <= self.max_ibi:
+            self.last = None
+            return None
+        ms = float(ibi) * 1000.0
+        if self.t0 is None:
+            self.t0, self.x0 = float(time), ms
+        t, x = float(time) - self.t0, ms - self.x0
+        while self.count and (self.count == self.capacity or
+                              self.times[self.start] <= t - self.window):
+            self._remove_oldest()
+
+        d = ms - self.last if self.last is not None and self.count else float("nan")
+        self.last = ms
+        i = (self.start + self.count) % self.capacity
+        self.times[i], self.ibis[i], self.diffs[i] = t, x, d
+        self.count += 1
+        self.sum_x += x
+        self.sum_x2 += x * x
+        if d == d:
+            self.sum_d2 += d * d
+            self.n_d += 1
+            self.n_nn50 += int(abs(d) > 50.0)
+        self.sums += self._terms(t, x)
+
+        if self.count < self.min_beats:
+            return None
+        self._update(t)
+        if self.outlet is not None:
+            self.outlet.push_sample(self.values, time)
+        return self.values
+
+    def _update(self, t):
+        n = self.count
+        v = self.values
+        mean = self.sum_x / n
+        v[1] = math.sqrt(max(self.sum_x2 - n * mean * mean, 0.0) / (n - 1))
+        if self.n_d:
+            v[0] = math.sqrt(self.sum_d2 / self.n_d)
+            v[2] = 100.0 * self.n_nn50 / self.n_d
+        else:
+            v[0] = v[2] = float("nan")  # no successive pair in the window
+        span = t - float(self.times[self.start])
+        if span < 1.0 / LF_BAND[0]:
+            v[3] = v[4] = v[5] = float("nan")
+            return
+        power = self._periodogram(n, mean)
+        # Lomb-Scargle to ms^2: the periodogram sums to n/2 times the
+        # variance over the natural frequency spacing 1 / span
+        scale = 2.0 * span * self.df / n
+        lf = float(np.dot(power, self.lf_bins)) * scale
+        hf = float(power.sum()) * scale - lf
+        v[3], v[4] = lf, hf
+        v[5] = lf / hf if hf > 0 else float("nan")
+
+    def _periodogram(self, n, mean):
+        # Lomb-Scargle from the sums, with the IBIs taken about their mean
+        c, s, xc, xs, c2, s2 = self.sums
+        w = self.scratch
+        yc, ys, r, cos_t, sin_t, p = w
+        np.multiply(c, mean, out=yc)
+        np.subtract(xc, yc, out=yc)
+        np.multiply(s, mean, out=ys)
+        np.subtract(xs, ys, out=ys)
+        # the time shift tau: tan(2 w tau) = sum sin 2wt / sum cos 2wt
+        np.hypot(c2, s2, out=r)
+        np.arctan2(s2, c2, out=p)
+        p *= 0.5
+        np.cos(p, out=cos_t)
+        np.sin(p, out=sin_t)
+        # C = sum y cos w(t - tau), S = sum y sin w(t - tau), in place
+        np.multiply(yc, cos_t, out=p)
+        yc *= sin_t
+        np.multiply(ys, sin_t, out=sin_t)
+        p += sin_t                          # C
+        ys *= cos_t
+        ys -= yc                            # S
+        # sum cos^2 w(t - tau) = (n + r) / 2, sum sin^2 = (n - r) / 2, so
+        # P = (C^2 / cos^2 + S^2 / sin^2) / 2 = C^2 / (n + r) + S^2 / (n - r)
+        np.add(r, n, out=cos_t)
+        np.subtract(n, r, out=sin_t)
+        np.maximum(sin_t, 1e-12, out=sin_t)
+        p *= p
+        p /= cos_t
+        ys *= ys
+        ys /= sin_t
+        p += ys
+        return p
@@ -0,0 +1,40 @@
+"""
+A single asyncio event loop in a background thread.
+
+The GUI runs all of its BLE work (every band's BleakClient session)
+as tasks on one such loop, instead of one thread and loop per band.
+"""
+
+import asyncio
+import threading
+
+
+class BackgroundLoop:
+    """
+    Runs an event loop forever in a daemon thread.
+    """
+
+    def __init__(self, name="polarband-ble"):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """
+        Schedules a coroutine on the loop from any thread; returns a
+        concurrent.futures.Future.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, callback, *args):
+        """
+        Calls a plain function on the loop thread.
+        """
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
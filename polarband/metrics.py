@@ -0,0 +1,231 @@
+"""
+Metrics of a running acquisition, in Prometheus text format and JSON.
+
+Most numbers are not counted separately but read at collection time
+from what the pipelines keep anyway: the BandStatus counters (packets,
+samples, gaps, lost samples, reconnects, battery, connect time), the SensorClock
+(offset and drift between sensor and host clock) and the queue of a
+QueuedPipeline. The only additions to the notification path are two
+Histograms per PMD pipeline, for decode and push time, filled only
+once Metrics.add() has attached them. Collection runs on the HTTP or
+logging side and only reads (see polarband.status for why that is
+safe without locks).
+
+Metrics.serve() exposes /metrics (Prometheus) and /metrics.json on a
+local HTTP port; MetricsLogger writes one JSON line periodically.
+"""
+
+import asyncio
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds; a notification is decoded in some us and pushed in tens of us
+TIME_BUCKETS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3, 2.5e-2, 0.1)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram; observe() is O(log buckets) and allocates
+    nothing.
+    """
+
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        return {"count": self.count, "sum": self.sum,
+                "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts))}
+
+
+def _labels(labels):
+    return "{" + ",".join('{0}="{1}"'.format(k, v) for k, v in labels.items()) + "}"
+
+
+class Metrics:
+    """
+    Collects the metrics of the bands added to it.
+    """
+
+    def __init__(self):
+        self.bands = []     # (band name, BandPipeline or QueuedPipeline)
+        self.started = time.time()
+
+    def add(self, name, pipeline):
+        """
+        Adds a band, and attaches decode/push histograms to its PMD
+        pipelines.
+        """
+        self.bands.append((name, pipeline))
+        for p in _inner(pipeline).routes.values():
+            if p.timings is None:
+                p.timings = (Histogram(), Histogram())
+
+    def remove(self, name):
+        """
+        Removes a band again.
+        """
+        self.bands = [(band, p) for band, p in self.bands if band != name]
+
+    def _pmd(self):
+        for band, pipeline in self.bands:
+            for p in _inner(pipeline).routes.values():
+                yield {"band": band, "measurement": p.name}, p
+
+    def snapshot(self):
+        """
+        All metrics as a dict, for JSON.
+        """
+        bands = {}
+        for labels, p in self._pmd():
+            s = p.status
+            entry = {"notifications": s.packets, "samples": s.samples, "gaps": s.gaps,
+                     "lost_samples": s.lost_samples, "reconnects": s.reconnects,
+                     "connected": s.connected, "battery": s.battery,
+                     "sample_rate": s.sample_rate, "quality": s.quality,
+                     "connect_seconds": s.connect_time,
+                     "clock_offset_s": p.clock.offset if p.clock.x0 is not None else None,
+                     "clock_drift_ppm": p.clock.drift * 1e6}
+            if p.timings is not None:
+                entry["decode_seconds"] = p.timings[0].snapshot()
+                entry["push_seconds"] = p.timings[1].snapshot()
+            bands.setdefault(labels["band"], {})[labels["measurement"]] = entry
+        for band, pipeline in self.bands:
+            if hasattr(pipeline, "stats"):
+                bands.setdefault(band, {})["queue"] = pipeline.stats()
+        return {"time": time.time(), "uptime_s": time.time() - self.started, "bands": bands}
+
+    def prometheus(self):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def metric(name, kind, help, values):
+            lines.append("# HELP polarband_{0} {1}".format(name, help))
+            lines.append("# TYPE polarband_{0} {1}".format(name, kind))
+            for labels, value in values:
+                if value is not None:
+                    lines.append("polarband_{0}{1} {2}".format(name, _labels(labels), float(value)))
+
+        pmd = list(self._pmd())
+        for name, kind, help, get in (
+                ("notifications_total", "counter", "PMD notifications handled", lambda p: p.status.packets),
+                ("samples_total", "counter", "Samples pushed", lambda p: p.status.samples),
+                ("gaps_total", "counter", "Gaps in the sensor time", lambda p: p.status.gaps),
+                ("lost_samples_total", "counter", "Samples missing in gaps", lambda p: p.status.lost_samples),
+                ("reconnects_total", "counter", "Reconnections", lambda p: p.status.reconnects),
+                ("connected", "gauge", "1 while connected", lambda p: int(p.status.connected)),
+                ("battery_percent", "gauge", "Battery level", lambda p: p.status.battery),
+                ("sample_rate_hz", "gauge", "Sample rate measured in sensor time",
+                 lambda p: p.status.sample_rate),
+                ("connect_seconds", "gauge", "Time from connecting to the first sample",
+                 lambda p: p.status.connect_time),
+                ("quality_score", "gauge", "ECG signal quality (0-1) of the last frame",
+                 lambda p: p.quality.score if getattr(p, "quality", None) is not None else None),
+                ("clock_offset_seconds", "gauge", "Host minus sensor clock",
+                 lambda p: p.clock.offset if p.clock.x0 is not None else None),
+                ("clock_drift_ppm", "gauge", "Host clock rate relative to the sensor clock",
+                 lambda p: p.clock.drift * 1e6)):
+            metric(name, kind, help, [(labels, get(p)) for labels, p in pmd])
+
+        for index, name, help in ((0, "decode_seconds", "Time to decode a notification"),
+                                  (1, "push_seconds", "Time to push a notification to LSL")):
+            lines.append("# HELP polarband_{0} {1}".format(name, help))
+            lines.append("# TYPE polarband_{0} histogram".format(name))
+            for labels, p in pmd:
+                if p.timings is None:
+                    continue
+                h = p.timings[index]
+                cumulative = 0
+                for bound, count in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    cumulative += count
+                    lines.append("polarband_{0}_bucket{1} {2}".format(
+                        name, _labels(dict(labels, le=bound)), cumulative))
+                lines.append("polarband_{0}_sum{1} {2}".format(name, _labels(labels), h.sum))
+                lines.append("polarband_{0}_count{1} {2}".format(name, _labels(labels), h.count))
+
+        queues = [(band, p.stats()) for band, p in self.bands if hasattr(p, "stats")]
+        for key, kind in (("depth", "gauge"), ("high_water", "gauge"), ("overflows", "counter")):
+            metric("queue_" + key + ("_total" if kind == "counter" else ""), kind,
+                   "Notification queue " + key.replace("_", " "),
+                   [({"band": band}, stats[key]) for band, stats in queues])
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serves /metrics and /metrics.json from a daemon thread; returns
+        the server (call shutdown() to stop it).
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, kind = metrics.prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, kind = json.dumps(metrics.snapshot()), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", kind)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="polarband-metrics", daemon=True).start()
+        return server
+
+
+class MetricsLogger:
+    """
+    Logs a JSON snapshot, with notification and sample rates since the
+    previous line, every `interval` seconds.
+    """
+
+    def __init__(self, metrics, interval=60.0, log=print):
+        self.metrics = metrics
+        self.interval = interval
+        self.log = log
+        self.previous = None
+
+    def line(self):
+        snapshot = self.metrics.snapshot()
+        if self.previous is not None:
+            dt = snapshot["time"] - self.previous["time"]
+            for band, measurements in snapshot["bands"].items():
+                for measurement, entry in measurements.items():
+                    before = self.previous["bands"].get(band, {}).get(measurement, {})
+                    for key in ("notifications", "samples"):
+                        if key in entry and key in before and dt > 0:
+                            entry[key + "_per_s"] = (entry[key] - before[key]) / dt
+        self.previous = snapshot
+        return json.dumps(snapshot)
+
+    async def run(self, stop):
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                self.log(self.line())
+
+
+def _inner(pipeline):
+    # the BandPipeline behind a QueuedPipeline
+    return getattr(pipeline, "pipeline", pipeline)
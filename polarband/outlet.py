@@ -0,0 +1,230 @@
+"""
+Chunked pushing of decoded samples to an LSL outlet.
+
+Instead of one push_sample call (and one Python list) per sample,
+samples are copied into a preallocated float32 buffer and handed to
+liblsl with a single push_chunk per notification, or per `batch`
+notifications when batching is enabled. When timestamps are given
+(see polarband.clock) they are passed along per sample; for float32
+outlets they go straight to liblsl from the preallocated timestamp
+buffer, without the list (and ctypes array) that push_chunk builds.
+"""
+
+import ctypes
+
+import numpy as np
+from pylsl import StreamInfo, StreamOutlet, IRREGULAR_RATE
+
+from .pmd import ECG_FRAME_SAMPLES, ECG_SAMPLING_FREQ
+from .hrv import HRV_CHANNELS, HRV_UNITS
+from .quality import QUALITY_CHANNELS
+
+
+def outlet_chunk_size(batch=1, frame_samples=ECG_FRAME_SAMPLES):
+    """
+    Outlet chunk size matching the pushes of a ChunkPusher.
+    """
+    return batch * frame_samples
+
+
+def start_ecg_stream(stream_name, source_id, chunk_size=0, max_buffered=360):
+    """
+    Starts the ECG stream (microvolts). The outlet sends chunks of
+    `chunk_size` samples (0: as pushed) and buffers at most
+    `max_buffered` seconds for slow inlets.
+    """
+    info = StreamInfo(stream_name, 'ECG', 1, ECG_SAMPLING_FREQ, 'float32', source_id)
+    info.desc().append_child_value("manufacturer", "Polar")
+    channels = info.desc().append_child("channels")
+    channels.append_child("channel") \
+            .append_child_value("name", "ECG") \
+            .append_child_value("unit", "microvolts") \
+            .append_child_value("type", "ECG")
+    return StreamOutlet(info, chunk_size, max_buffered)
+
+
+def start_filtered_stream(stream_name, source_id, srate, filters, chunk_size=0, max_buffered=360):
+    """
+    Starts a derived ECG stream (microvolts) at `srate`: the filtered
+    ECG, or its decimated preview (see polarband.filters). `filters`
+    describes the filtering, e.g. "highpass 0.5 Hz, notch 50 Hz".
+    """
+    info = StreamInfo(stream_name, 'ECG', 1, srate, 'float32', source_id)
+    info.desc().append_child_value("manufacturer", "Polar")
+    info.desc().append_child_value("filters", filters)
+    channels = info.desc().append_child("channels")
+    channels.append_child("channel") \
+            .append_child_value("name", "ECG") \
+            .append_child_value("unit", "microvolts") \
+            .append_child_value("type", "ECG")
+    return StreamOutlet(info, chunk_size, max_buffered)
+
+
+def start_ibi_stream(stream_name, source_id, max_buffered=360):
+    """
+    Starts the irregular rate LSL stream carrying one IBI (ms) per
+    detected R-top, timestamped at the R-top.
+    """
+    info = StreamInfo(stream_name, 'IBI', 1, IRREGULAR_RATE, 'float32', source_id)
+    info.desc().append_child_value("manufacturer", "Polar")
+    channels = info.desc().append_child("channels")
+    channels.append_child("channel") \
+            .append_child_value("name", "IBI") \
+            .append_child_value("unit", "ms") \
+            .append_child_value("type", "IBI")
+    return StreamOutlet(info, 1, max_buffered)
+
+
+def start_acc_stream(stream_name, source_id, rate, chunk_size=0, max_buffered=360):
+    """
+    Starts the 3 channel accelerometer stream (mG).
+    """
+    info = StreamInfo(stream_name, 'ACC', 3, rate, 'float32', source_id)
+    info.desc().append_child_value("manufacturer", "Polar")
+    channels = info.desc().append_child("channels")
+    for c in ["X", "Y", "Z"]:
+        channels.append_child("channel") \
+                .append_child_value("name", c) \
+                .append_child_value("unit", "mG") \
+                .append_child_value("type", "ACC")
+    return StreamOutlet(info, chunk_size, max_buffered)
+
+
+def start_hr_stream(stream_name, source_id, max_buffered=360):
+    """
+    Starts the irregular rate heart rate stream (bpm), one sample per
+    Heart Rate Measurement notification.
+    """
+    info = StreamInfo(stream_name, 'HR', 1, IRREGULAR_RATE, 'float32', source_id)
+    info.desc().append_child_value("manufacturer", "Polar")
+    channels = info.desc().append_child("channels")
+    channels.append_child("channel") \
+            .append_child_value("name", "HR") \
+            .append_child_value("unit", "bpm") \
+            .append_child_value("type", "HR")
+    return StreamOutlet(info, 1, max_buffered)
+
+
+def start_rr_stream(stream_name, source_id, max_buffered=360):
+    """
+    Starts the irregular rate stream of the RR intervals (ms) reported
+    by the band in the Heart Rate Measurement notifications.
+    """
+    info = StreamInfo(stream_name, 'RR', 1, IRREGULAR_RATE, 'float32', source_id)
+    info.desc().append_child_value("manufacturer", "Polar")
+    channels = info.desc().append_child("channels")
+    channels.append_child("channel") \
+            .append_child_value("name", "RR") \
+            .append_child_value("unit", "ms") \
+            .append_child_value("type", "IBI")
+    return StreamOutlet(info, 1, max_buffered)
+
+
+def start_quality_stream(stream_name, source_id, max_buffered=360):
+    """
+    Starts the irregular rate ECG quality stream, one sample per
+    notification (see polarband.quality).
+    """
+    info = StreamInfo(stream_name, 'Quality', len(QUALITY_CHANNELS), IRREGULAR_RATE, 'float32',
+                      source_id)
+    info.desc().append_child_value("manufacturer", "Polar")
+    channels = info.desc().append_child("channels")
+    for c, unit in zip(QUALITY_CHANNELS, ("", "fraction", "fraction", "microvolts", "")):
+        channels.append_child("channel") \
+                .append_child_value("name", c) \
+                .append_child_value("unit", unit) \
+                .append_child_value("type", "Quality")
+    return StreamOutlet(info, 1, max_buffered)
+
+
+def start_hrv_stream(stream_name, source_id, window, max_buffered=360):
+    """
+    Starts the irregular rate HRV stream, one sample per beat over the
+    last `window` seconds (see polarband.hrv).
+    """
+    info = StreamInfo(stream_name, 'HRV', len(HRV_CHANNELS), IRREGULAR_RATE, 'float32', source_id)
+    info.desc().append_child_value("manufacturer", "Polar")
+    info.desc().append_child_value("window", str(window))
+    channels = info.desc().append_child("channels")
+    for c, unit in zip(HRV_CHANNELS, HRV_UNITS):
+        channels.append_child("channel") \
+                .append_child_value("name", c) \
+                .append_child_value("unit", unit) \
+                .append_child_value("type", "HRV")
+    return StreamOutlet(info, 1, max_buffered)
+
+
+def start_marker_stream(stream_name, source_id, max_buffered=360):
+    """
+    Starts the irregular rate string stream with connection events and
+    data gaps of a band.
+    """
+    info = StreamInfo(stream_name, 'Markers', 1, IRREGULAR_RATE, 'string', source_id)
+    info.desc().append_child_value("manufacturer", "Polar")
+    return StreamOutlet(info, 1, max_buffered)
+
+
+class ChunkPusher:
+    """
+    Collects the samples of `batch` notifications and pushes them
+    to `outlet` as one chunk.
+    """
+
+    def __init__(self, outlet, batch=1, channels=1, frame_samples=ECG_FRAME_SAMPLES):
+        self.outlet = outlet
+        self.batch = max(int(batch), 1)
+        self.buffer = np.zeros((self.batch * frame_samples, channels), dtype=np.float32)
+        self.stamps = np.zeros(self.batch * frame_samples)
+        self.stamped = False
+        self.fill = 0
+        self.frames = 0
+        # liblsl's push_chunk with per-sample timestamps, called on the
+        # buffers directly (pylsl >= 1.16 outlets; stand-ins fall back)
+        self.push_chunk_n = None
+        if getattr(outlet, "np_dtype", None) == np.float32 and hasattr(outlet, "do_push_chunk_n"):
+            self.push_chunk_n = outlet.do_push_chunk_n
+            self.buffer_ptr = ctypes.c_void_p(self.buffer.ctypes.data)
+            self.stamps_ptr = ctypes.c_void_p(self.stamps.ctypes.data)
+
+    def push(self, samples, timestamps=None):
+        """
+        Adds the samples of one notification (1-D for a single channel,
+        samples x channels otherwise), with optional local_clock()
+        timestamps per sample, and pushes when the batch is full.
+        """
+        n = len(samples)
+        if self.fill + n > len(self.buffer):
+            self.flush()
+            if n > len(self.buffer):
+                # larger than the whole buffer (bigger MTU): push directly
+                self.outlet.push_chunk(np.asarray(samples, dtype=np.float32)
+                                       .reshape(n, self.buffer.shape[1]),
+                                       0.0 if timestamps is None else list(timestamps))
+                return
+        self.buffer[self.fill:self.fill + n] = np.reshape(samples, (n, -1))
+        if timestamps is not None:
+            self.stamps[self.fill:self.fill + n] = timestamps
+            self.stamped = True
+        self.fill += n
+        self.frames += 1
+        if self.frames >= self.batch:
+            self.flush()
+
+    def flush(self):
+        """
+        Pushes whatever is buffered.
+        """
+        if self.fill:
+            if self.stamped and self.push_chunk_n is not None:
+                err = self.push_chunk_n(self.outlet.obj, self.buffer_ptr,
+                                        ctypes.c_long(self.fill * self.buffer.shape[1]),
+                                        self.stamps_ptr, ctypes.c_int(1))
+                if err < 0:
+                    raise RuntimeError("liblsl push_chunk failed ({0})".format(err))
+            elif self.stamped:
+                self.outlet.push_chunk(self.buffer[:self.fill], self.stamps[:self.fill].tolist())
+            else:
+                self.outlet.push_chunk(self.buffer[:self.fill])
+        self.stamped = False
+        self.fill = 0
+        self.frames = 0
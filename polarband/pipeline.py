@@ -0,0 +1,262 @@
+"""
+Per-device processing of notifications: decode, timestamp, push.
+
+EcgPipeline and AccPipeline handle the PMD data notifications of one
+measurement type (ECG optionally with online R-top detection for an
+IBI stream), HrPipeline the standard Heart Rate Measurement
+notifications. BandPipeline bundles the pipelines selected for one
+band, all running on the same BLE connection. Gaps in the sensor time
+(lost notifications, reconnects) are reported on an optional marker
+outlet. Each pipeline keeps a BandStatus that a user interface can poll,
+and an EcgPipeline fills an optional Scope for a live view and rates
+each frame with an optional QualityEstimator; an optional FilterStage
+(polarband.filters) feeds filtered and preview outlets. The R-tops, or
+the RR intervals of a HrPipeline, can feed an HrvEngine (polarband.hrv).
+With a recorder Track, the PMD pipelines also record to a local file. When
+polarband.metrics attaches `timings` (decode and push Histograms),
+they time those two steps.
+"""
+
+import time
+
+import numpy as np
+from pylsl import local_clock
+
+from .clock import SensorClock
+from .outlet import ChunkPusher
+from .rpeak import RPeakDetector
+from .status import BandStatus
+from .heartrate import parse_heart_rate
+from .pmd import (MEASUREMENT_ECG, MEASUREMENT_ACC, ECG_SAMPLING_FREQ, ECG_FRAME_SAMPLES,
+                  ACC_CHANNELS, decode_ecg, decode_acc, sensor_timestamp, ecg_sample_count,
+                  ecg_start_command, acc_start_command)
+
+
+def mark_gap(markers, name, clock):
+    """
+    Pushes a 'gap' marker when the last frame did not follow on the
+    previous one, timestamped at the first missing sample.
+    """
+    if markers is not None and clock.gap:
+        markers.push_sample(["{0} gap {1:.3f} s".format(name, clock.gap)], clock.gap_start)
+
+
+class EcgPipeline:
+    """
+    Turns the ECG notifications of one band into timestamped LSL chunks.
+    """
+
+    measurement = MEASUREMENT_ECG
+    name = "ECG"
+
+    def __init__(self, outlet, batch=1, srate=ECG_SAMPLING_FREQ, ibi_outlet=None, markers=None,
+                 status=None, scope=None, track=None, quality=None, filters=None, hrv=None):
+        self.clock = SensorClock(srate)
+        self.markers = markers
+        self.status = BandStatus() if status is None else status
+        self.scope = scope
+        self.track = track
+        self.pusher = ChunkPusher(outlet, batch)
+        self.ibi_outlet = ibi_outlet
+        self.quality = quality
+        self.filters = filters
+        self.hrv = hrv
+        # R-tops are needed for the IBI stream, to rate the beats and for HRV
+        self.detector = RPeakDetector(srate) if (ibi_outlet is not None or quality is not None or
+                                                 hrv is not None) else None
+        self.start_command = ecg_start_command()
+        self.timings = None
+        # decode and timestamp buffers, reused for every notification
+        self._buffers(ECG_FRAME_SAMPLES)
+
+    def _buffers(self, n):
+        self.samples = np.empty(n, dtype=np.int32)
+        self.scratch = np.zeros((n, 4), dtype=np.uint8)
+        self.stamps = np.empty(n)
+
+    def process(self, data, arrival=None):
+        """
+        Handles one notification; `arrival` is its local_clock() time
+        (taken now if not given). Returns the number of ECG samples.
+        """
+        if arrival is None:
+            arrival = local_clock()
+        if data[0] != MEASUREMENT_ECG:
+            return 0
+        n = ecg_sample_count(data)
+        if n > len(self.samples):
+            self._buffers(n)    # larger MTU than expected
+        timings = self.timings
+        if timings is not None:
+            t0 = time.perf_counter()
+        samples = decode_ecg(data, self.samples, self.scratch)
+        if timings is not None:
+            t1 = time.perf_counter()
+            timings[0].observe(t1 - t0)
+        sensor_ns = sensor_timestamp(data)
+        stamps = self.clock.update(sensor_ns, arrival, n, self.stamps)
+        if self.clock.gap:
+            mark_gap(self.markers, "ECG", self.clock)
+            if self.detector is not None:
+                self.detector.reset()   # no IBI across a gap
+            if self.quality is not None:
+                self.quality.reset()
+            if self.filters is not None:
+                self.filters.reset()    # the filter state is stale
+            if self.hrv is not None:
+                self.hrv.reset()
+        self.status.update(len(samples), self.clock, arrival)
+        if timings is not None:
+            t1 = time.perf_counter()
+        self.pusher.push(samples, stamps)
+        if timings is not None:
+            timings[1].observe(time.perf_counter() - t1)
+        if self.track is not None:
+            self.track.write(stamps, samples, sensor_ns)
+        if self.filters is not None:
+            self.filters.process(samples, stamps)
+        if self.scope is not None:
+            self.scope.ecg.write(samples)
+        if self.detector is not None:
+            # IBIs go out right away, regardless of the ECG batching
+            for rtop, ibi in self.detector.process(samples, stamps):
+                if self.ibi_outlet is not None:
+                    self.ibi_outlet.push_sample([ibi * 1000.0], rtop)
+                if self.scope is not None:
+                    self.scope.ibi.append(ibi * 1000.0)
+                if self.quality is not None:
+                    self.quality.beat(rtop, ibi)
+                if self.hrv is not None:
+                    self.hrv.beat(rtop, ibi)
+        if self.quality is not None:
+            self.quality.process(samples, stamps)
+            self.status.quality = self.quality.state
+        return len(samples)
+
+    def flush(self):
+        self.pusher.flush()
+        if self.filters is not None:
+            self.filters.flush()
+
+
+class AccPipeline:
+    """
+    Turns the accelerometer notifications of one band into timestamped
+    3 channel LSL chunks.
+    """
+
+    measurement = MEASUREMENT_ACC
+    name = "ACC"
+
+    def __init__(self, outlet, rate=200, batch=1, markers=None, status=None, track=None):
+        self.clock = SensorClock(rate)
+        self.markers = markers
+        self.status = BandStatus() if status is None else status
+        self.track = track
+        # compressed frames vary in length; one second per frame is ample
+        self.pusher = ChunkPusher(outlet, batch, channels=ACC_CHANNELS, frame_samples=rate)
+        self.start_command = acc_start_command(rate)
+        self.timings = None
+
+    def process(self, data, arrival=None):
+        if arrival is None:
+            arrival = local_clock()
+        if data[0] != MEASUREMENT_ACC:
+            return 0
+        timings = self.timings
+        if timings is not None:
+            t0 = time.perf_counter()
+        samples = decode_acc(data)
+        if timings is not None:
+            timings[0].observe(time.perf_counter() - t0)
+        sensor_ns = sensor_timestamp(data)
+        stamps = self.clock.update(sensor_ns, arrival, len(samples))
+        if self.clock.gap:
+            mark_gap(self.markers, "ACC", self.clock)
+        self.status.update(len(samples), self.clock, arrival)
+        if timings is not None:
+            t1 = time.perf_counter()
+        self.pusher.push(samples, stamps)
+        if timings is not None:
+            timings[1].observe(time.perf_counter() - t1)
+        if self.track is not None:
+            self.track.write(stamps, samples, sensor_ns)
+        return len(samples)
+
+    def flush(self):
+        self.pusher.flush()
+
+
+class HrPipeline:
+    """
+    Pushes heart rate and RR intervals from the Heart Rate Measurement
+    characteristic. These notifications carry no sensor time: the last
+    RR interval is taken to end at the arrival of the notification. An
+    optional HrvEngine gets every RR interval.
+    """
+
+    def __init__(self, hr_outlet, rr_outlet=None, hrv=None):
+        self.hr_outlet = hr_outlet
+        self.rr_outlet = rr_outlet
+        self.hrv = hrv
+
+    def process(self, data, arrival=None):
+        if arrival is None:
+            arrival = local_clock()
+        hr, rr, contact = parse_heart_rate(data)
+        self.hr_outlet.push_sample([hr], arrival)
+        if len(rr) and (self.rr_outlet is not None or self.hrv is not None):
+            ends = arrival - np.concatenate((np.cumsum(rr[:0:-1])[::-1], [0.0])) / 1000.0
+            if self.rr_outlet is not None:
+                self.rr_outlet.push_chunk(rr.reshape(-1, 1), ends.tolist())
+            if self.hrv is not None:
+                for end, interval in zip(ends.tolist(), rr.tolist()):
+                    self.hrv.beat(end, interval / 1000.0)
+        return len(rr)
+
+    def flush(self):
+        pass
+
+
+class BandPipeline:
+    """
+    All pipelines of one band: routes PMD data notifications by their
+    measurement type and holds the optional heart rate pipeline.
+    """
+
+    def __init__(self, pmd=(), hr=None):
+        self.routes = {p.measurement: p for p in pmd}
+        self.hr = hr
+
+    @property
+    def statuses(self):
+        """
+        (measurement name, BandStatus) of the PMD pipelines.
+        """
+        return [(p.name, p.status) for p in self.routes.values()]
+
+    @property
+    def start_commands(self):
+        """
+        PMD control point commands that start the selected measurements.
+        """
+        return [p.start_command for p in self.routes.values()]
+
+    def process(self, data, arrival=None):
+        """
+        Handles one PMD data notification.
+        """
+        pipeline = self.routes.get(data[0])
+        if pipeline is None:
+            return 0
+        return pipeline.process(data, arrival)
+
+    def process_hr(self, data, arrival=None):
+        """
+        Handles one Heart Rate Measurement notification.
+        """
+        return self.hr.process(data, arrival)
+
+    def flush(self):
+        for p in self.routes.values():
+            p.flush()
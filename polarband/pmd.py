@@ -0,0 +1,200 @@
+"""
+Decoding of Polar Measurement Data (PMD) notifications.
+
+A PMD data notification starts with a 10 byte header:
+    byte 0     measurement type (0x00 = ECG, 0x02 = ACC)
+    bytes 1-8  sensor timestamp (uint64, little endian, nanoseconds)
+    byte 9     frame type
+For ECG the header is followed by packed 24-bit little endian
+signed samples (microvolts), 73 of them in a full notification.
+For ACC (mG, 3 axes) the frame type gives the layout: 0x00, 0x01 and
+0x02 hold plain 8, 16 and 24-bit samples; with bit 7 set (0x80) the
+frame is delta compressed (see decode_acc).
+
+Measurements are started by writing a start command (see
+start_command) to the PMD control point.
+"""
+
+import struct
+
+import numpy as np
+
+PMD_HEADER_SIZE = 10
+MEASUREMENT_ECG = 0x00
+MEASUREMENT_ACC = 0x02
+ECG_SAMPLE_SIZE = 3
+ECG_FRAME_SAMPLES = 73
+ECG_SAMPLING_FREQ = 130
+ECG_RESOLUTION = 14
+
+ACC_RATES = (25, 50, 100, 200)
+ACC_RESOLUTION = 16
+ACC_RANGE = 8           # G
+ACC_CHANNELS = 3
+FRAME_COMPRESSED = 0x80
+
+# PMD control point
+PMD_START = 0x02
+SETTING_SAMPLE_RATE = 0x00
+SETTING_RESOLUTION = 0x01
+SETTING_RANGE = 0x02
+
+
+def start_command(measurement, settings):
+    """
+    PMD control point command starting `measurement` with the given
+    {setting type: value} settings.
+    """
+    command = bytearray([PMD_START, measurement])
+    for setting, value in settings.items():
+        command += bytes([setting, 0x01]) + int(value).to_bytes(2, "little")
+    return command
+
+
+def ecg_start_command():
+    return start_command(MEASUREMENT_ECG, {SETTING_SAMPLE_RATE: ECG_SAMPLING_FREQ,
+                                           SETTING_RESOLUTION: ECG_RESOLUTION})
+
+
+def acc_start_command(rate=200, acc_range=ACC_RANGE):
+    if rate not in ACC_RATES:
+        raise ValueError("ACC sample rate must be one of {0}".format(ACC_RATES))
+    return start_command(MEASUREMENT_ACC, {SETTING_SAMPLE_RATE: rate,
+                                           SETTING_RESOLUTION: ACC_RESOLUTION,
+                                           SETTING_RANGE: acc_range})
+
+
+def sensor_timestamp(data):
+    """
+    Sensor time (ns) of the last sample in a PMD notification.
+    """
+    return struct.unpack_from("<Q", data, 1)[0]
+
+
+def ecg_sample_count(data):
+    """
+    Number of complete ECG samples in a PMD notification.
+    """
+    return max(len(data) - PMD_HEADER_SIZE, 0) // ECG_SAMPLE_SIZE
+
+
+def decode_ecg(data, out=None, scratch=None):
+    """
+    Decodes all ECG samples of a PMD notification into an int32 array.
+
+    The packed samples are copied into the upper three bytes of an
+    int32 scratch array, after which one arithmetic right shift
+    sign-extends every sample at once; no per-sample Python work.
+    If `out` is given (int32, at least ecg_sample_count(data) long)
+    the samples are written there and a view on it is returned; with
+    a reused uint8 `scratch` of at least (n, 4) as well, decoding
+    allocates no buffers at all.
+    """
+    n = ecg_sample_count(data)
+    if out is None:
+        out = np.empty(n, dtype=np.int32)
+    else:
+        out = out[:n]
+    if n == 0:
+        return out
+    raw = np.frombuffer(data, dtype=np.uint8,
+                        count=n * ECG_SAMPLE_SIZE, offset=PMD_HEADER_SIZE)
+    if scratch is None:
+        scratch = np.zeros((n, 4), dtype=np.uint8)
+    else:
+        scratch = scratch[:n]   # column 0 stays zero
+    scratch[:, 1:] = raw.reshape(n, ECG_SAMPLE_SIZE)
+    np.right_shift(scratch.view("<i4").reshape(n), 8, out=out)
+    return out
+
+
+def encode_ecg(samples, timestamp_ns=0):
+    """
+    Builds an ECG PMD notification from integer samples (microvolts),
+    the inverse of decode_ecg. Used to synthesize frames.
+    """
+    samples = np.asarray(samples, dtype="<i4")
+    header = bytes([MEASUREMENT_ECG]) + int(timestamp_ns).to_bytes(8, "little") + bytes([0x00])
+    body = samples.view(np.uint8).reshape(-1, 4)[:, :ECG_SAMPLE_SIZE]
+    return bytearray(header + body.tobytes())
+
+
+def encode_acc(samples, timestamp_ns=0, compressed=False, resolution=ACC_RESOLUTION):
+    """
+    Builds an ACC PMD notification from a (samples x 3) integer array,
+    the inverse of decode_acc: plain 16 bit values, or with `compressed`
+    a reference sample and one block of deltas as narrow as they allow.
+    Used to synthesize frames.
+    """
+    samples = np.asarray(samples, dtype=np.int64).reshape(-1, ACC_CHANNELS)
+    if not compressed:
+        header = bytes([MEASUREMENT_ACC]) + int(timestamp_ns).to_bytes(8, "little") + b"\x01"
+        return bytearray(header + samples.astype("<i2").tobytes())
+    header = bytes([MEASUREMENT_ACC]) + int(timestamp_ns).to_bytes(8, "little") + \
+        bytes([FRAME_COMPRESSED])
+    ref_size = -(-resolution // 8)
+    ref = samples[0].astype("<i8").view(np.uint8).reshape(ACC_CHANNELS, 8)[:, :ref_size]
+    body = header + ref.tobytes()
+    deltas = np.diff(samples, axis=0).reshape(-1)
+    if len(deltas):
+        bits = max(int(np.abs(deltas).max()).bit_length() + 1, 2)
+        unsigned = deltas & ((1 << bits) - 1)
+        packed = (unsigned[:, None] >> np.arange(bits)) & 1
+        body += bytes([bits, len(deltas) // ACC_CHANNELS])
+        body += np.packbits(packed.astype(np.uint8).reshape(-1), bitorder="little").tobytes()
+    return bytearray(body)
+
+
+def _sign_extend(values, bits):
+    # two's complement of `bits` wide unsigned values
+    return values - ((values >> (bits - 1)) & 1) * (1 << bits)
+
+
+def decode_acc(data, resolution=ACC_RESOLUTION):
+    """
+    Decodes an ACC PMD notification into a (samples x 3) int32 array.
+
+    Plain frames are decoded with a single view on the buffer. Delta
+    compressed frames hold one reference sample (resolution bits per
+    axis) followed by blocks of [delta bits, sample count, packed
+    deltas]; every block is unpacked with np.unpackbits and summed with
+    one cumsum, so there is no loop over samples or bits.
+    """
+    frame_type = data[PMD_HEADER_SIZE - 1]
+    payload = np.frombuffer(data, dtype=np.uint8, offset=PMD_HEADER_SIZE)
+    if not frame_type & FRAME_COMPRESSED:
+        width = (frame_type & 0x7F) + 1           # bytes per value
+        n = len(payload) // (width * ACC_CHANNELS)
+        raw = payload[:n * width * ACC_CHANNELS]
+        if width == 1:
+            return raw.view(np.int8).astype(np.int32).reshape(n, ACC_CHANNELS)
+        if width == 2:
+            return raw.view("<i2").astype(np.int32).reshape(n, ACC_CHANNELS)
+        scratch = np.zeros((n * ACC_CHANNELS, 4), dtype=np.uint8)
+        scratch[:, 4 - width:] = raw.reshape(-1, width)
+        return (scratch.view("<i4").reshape(-1) >> (8 * (4 - width))).reshape(n, ACC_CHANNELS)
+
+    ref_size = -(-resolution // 8)
+    if len(payload) < ref_size * ACC_CHANNELS:
+        return np.empty((0, ACC_CHANNELS), np.int32)      # truncated: no reference sample
+    ref = payload[:ref_size * ACC_CHANNELS].reshape(ACC_CHANNELS, ref_size).astype(np.int64)
+    ref = _sign_extend((ref << (8 * np.arange(ref_size))).sum(axis=1), 8 * ref_size)
+
+    blocks = []
+    offset = ref_size * ACC_CHANNELS
+    while offset + 2 <= len(payload):
+        bits, count = int(payload[offset]), int(payload[offset + 1])
+        offset += 2
+        nbytes = -(-(bits * count * ACC_CHANNELS) // 8)
+        if count == 0 or bits == 0 or offset + nbytes > len(payload):
+            break
+        packed = np.unpackbits(payload[offset:offset + nbytes], bitorder="little")
+        packed = packed[:bits * count * ACC_CHANNELS].reshape(-1, bits).astype(np.int64)
+        deltas = _sign_extend(packed @ (1 << np.arange(bits, dtype=np.int64)), bits)
+        blocks.append(deltas.reshape(count, ACC_CHANNELS))
+        offset += nbytes
+
+    if not blocks:
+        return ref.reshape(1, ACC_CHANNELS).astype(np.int32)
+    deltas = np.concatenate([np.zeros((1, ACC_CHANNELS), dtype=np.int64)] + blocks)
+    return (ref + np.cumsum(deltas, axis=0)).astype(np.int32)
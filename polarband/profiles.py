@@ -0,0 +1,133 @@
+"""
+Named outlet and liblsl tuning profiles.
+
+A profile sets together what decides latency and memory of a stream:
+the notifications per push (batch), the outlet chunk size, the seconds
+the outlet buffers for slow inlets, and the [tuning] keys of
+lsl_api.cfg. The outlet settings are per stream. The tuning keys hold
+for the whole process and must be set before liblsl is first used, so
+apply_lsl_profile() is called once at startup.
+
+    default           as before: batch 1, 360 s buffers, lsl_api.cfg as is
+    low-latency       one push per notification, 10 s buffers
+    high-throughput   8 notifications per push, large socket buffers
+    low-memory        4 notifications per push, 30 s buffers, small reserves
+
+liblsl preallocates max_buffered * sample rate samples per outlet (100
+samples per second for irregular rate streams), so with dozens of
+outlets the default 360 s is most of the memory of the process.
+benchmarks/bench_profiles.py measures both sides.
+"""
+
+import configparser
+import ctypes
+import io
+import os
+
+
+class Profile:
+    """
+    Outlet settings and lsl_api.cfg [tuning] keys; chunk_size 0 makes
+    the outlet chunk match the pushes.
+    """
+
+    def __init__(self, batch, chunk_size, max_buffered, tuning):
+        self.batch = batch
+        self.chunk_size = chunk_size
+        self.max_buffered = max_buffered
+        self.tuning = tuning
+
+
+PROFILES = {
+    "default": Profile(1, 0, 360, {}),
+    "low-latency": Profile(1, 0, 10, {
+        "OutletBufferReserveMs": 1000,
+        "InletBufferReserveMs": 1000,
+        "TimerResolution": 1}),
+    "high-throughput": Profile(8, 0, 360, {
+        "OutletBufferReserveMs": 10000,
+        "OutletBufferReserveSamples": 1024,
+        "SendSocketBufferSize": 1 << 20,
+        "ReceiveSocketBufferSize": 1 << 20}),
+    "low-memory": Profile(4, 0, 30, {
+        "OutletBufferReserveMs": 500,
+        "OutletBufferReserveSamples": 32,
+        "InletBufferReserveMs": 500,
+        "InletBufferReserveSamples": 32,
+        "SendSocketBufferSize": 1 << 16}),
+}
+
+
+# the streams that can have a profile of their own; the IBI, quality
+# and filtered streams follow the ECG
+STREAMS = ("ecg", "acc", "hr", "hrv", "markers")
+
+
+def get_profile(name):
+    """
+    The Profile called `name`; raises ValueError for an unknown name.
+    """
+    try:
+        return PROFILES[name or "default"]
+    except KeyError:
+        raise ValueError("unknown profile: {0} (one of {1})".format(name, ", ".join(PROFILES)))
+
+
+def parse_profiles(text):
+    """
+    Parses 'low-memory,ecg=low-latency' into the band profile and the
+    per-stream profiles ('low-memory', {'ecg': 'low-latency'}); raises
+    ValueError for an unknown profile or stream.
+    """
+    profile = "default"
+    streams = {}
+    for item in filter(None, (t.strip() for t in (text or "").split(","))):
+        key, _, value = item.partition("=")
+        if value:
+            key, value = key.strip().lower(), value.strip()
+            if key not in STREAMS:
+                raise ValueError("unknown stream: {0} (one of {1})".format(key, ", ".join(STREAMS)))
+            get_profile(value)
+            streams[key] = value
+        else:
+            get_profile(key)
+            profile = key
+    return profile, streams
+
+
+def lsl_config(profile, base=None):
+    """
+    The contents of an lsl_api.cfg: the file `base` (by default the one
+    liblsl would read from the working directory or $LSLAPICFG) with
+    the [tuning] keys of `profile` replacing its own.
+    """
+    parser = configparser.ConfigParser(inline_comment_prefixes=(";",), interpolation=None)
+    parser.optionxform = str    # liblsl keys are case sensitive
+    if base is None:
+        base = os.environ.get("LSLAPICFG", "lsl_api.cfg")
+    if base and os.path.exists(base):
+        parser.read(base)
+    if not parser.has_section("tuning"):
+        parser.add_section("tuning")
+    for key, value in get_profile(profile).tuning.items():
+        parser.set("tuning", key, str(value))
+    out = io.StringIO()
+    parser.write(out)
+    return out.getvalue()
+
+
+def apply_lsl_profile(profile, base=None):
+    """
+    Makes liblsl use the tuning keys of `profile`. Has to run before
+    the first outlet is created; returns False when the liblsl in use
+    cannot take its configuration from memory (before 1.16).
+    """
+    if not get_profile(profile).tuning:
+        return True
+    from pylsl.lib import lib
+    set_content = getattr(lib, "lsl_set_config_content", None)
+    if set_content is None:
+        return False
+    set_content.argtypes = [ctypes.c_char_p]
+    set_content(lsl_config(profile, base).encode("utf-8"))
+    return True
@@ -0,0 +1,121 @@
+"""
+Online signal quality of the ECG, per notification.
+
+A loose strap shows in the ECG as clipping (samples at the end of the
+input range), flatlines (the same value sample after sample), broadband
+noise (muscle activity, a dry or moving electrode) or beats that stop
+or come at implausible intervals. QualityEstimator measures all four on
+each decoded frame with a few vectorised numpy operations, so the cost
+per frame is constant whatever the recording length or the number of
+bands, and in work arrays allocated once:
+
+    clipping    fraction of samples at or beyond `clip_uv`
+    flatline    fraction of successive samples that are equal
+    noise       noise level (uV) from the median absolute second
+                difference; QRS complexes cover too few samples of a
+                frame to move the median
+    beats       1 when the last R-top (from the pipeline's detector) is
+                recent and its IBI plausible, 0.5 when recent but not
+                plausible, 0 when there is none
+
+and combines them into a score, the fraction of contact, noise and
+beats that is fine (0 to 1), and a short state for display. With an
+outlet, every frame gives one sample of the irregular rate quality
+stream (about 1.8 per second).
+"""
+
+import numpy as np
+
+from .rpeak import median_inplace
+
+QUALITY_CHANNELS = ("score", "clipping", "flatline", "noise", "beats")
+
+# the scale factor of the median absolute deviation, times sqrt(6): the
+# second difference of white noise has 6 times its variance
+_NOISE_SCALE = 1.0 / (0.6745 * 6.0 ** 0.5)
+
+
+class QualityEstimator:
+    """
+    Quality of one band's ECG. beat() takes the R-tops of the detector,
+    process() each decoded frame.
+    """
+
+    def __init__(self, outlet=None, clip_uv=20000, max_clipping=0.01, max_flatline=0.5,
+                 noise_uv=50.0, beat_timeout=3.0, min_ibi=0.3, max_ibi=2.0, max_ibi_change=0.3):
+        self.outlet = outlet
+        self.clip_uv = clip_uv
+        self.max_clipping = max_clipping
+        self.max_flatline = max_flatline
+        self.noise_uv = noise_uv
+        self.beat_timeout = beat_timeout
+        self.min_ibi = min_ibi
+        self.max_ibi = max_ibi
+        self.max_ibi_change = max_ibi_change
+        self.score = None
+        self.state = "no data"
+        self._buffers(256)
+        self.reset()
+
+    def _buffers(self, n):
+        self.flags = np.empty(n, dtype=bool)
+        self.flags2 = np.empty(n, dtype=bool)
+        self.diffs = np.empty(n)
+        self.diffs2 = np.empty(n)
+
+    def reset(self):
+        """
+        Forgets the beats, after a gap.
+        """
+        self.last_beat = None
+        self.last_ibi = None
+        self.plausible = False
+
+    def beat(self, rtop, ibi):
+        """
+        Takes one R-top (s) and its IBI (s).
+        """
+        self.plausible = (self.min_ibi <= ibi <= self.max_ibi and
+                          (self.last_ibi is None or
+                           abs(ibi - self.last_ibi) <= self.max_ibi_change * self.last_ibi))
+        self.last_beat = rtop
+        self.last_ibi = ibi
+
+    def process(self, samples, stamps):
+        """
+        Rates one frame of ECG (uV) with its timestamps; returns the
+        score.
+        """
+        n = len(samples)
+        if n < 3:
+            return self.score
+        if n > len(self.flags):
+            self._buffers(n)
+        high, low = self.flags[:n], self.flags2[:n]
+        np.greater_equal(samples, self.clip_uv, out=high)
+        np.less_equal(samples, -self.clip_uv, out=low)
+        clipping = int(np.count_nonzero(np.logical_or(high, low, out=high))) / n
+        d = np.subtract(samples[1:], samples[:-1], out=self.diffs[:n - 1])
+        flatline = int(np.count_nonzero(np.equal(d, 0, out=high[:n - 1]))) / (n - 1)
+        dd = np.subtract(d[1:], d[:-1], out=self.diffs2[:n - 2])
+        noise = float(median_inplace(np.abs(dd, out=dd))) * _NOISE_SCALE
+        now = stamps[-1]
+        if self.last_beat is None or now - self.last_beat > self.beat_timeout:
+            beats = 0.0
+        else:
+            beats = 1.0 if self.plausible else 0.5
+
+        contact = clipping <= self.max_clipping and flatline <= self.max_flatline
+        quiet = noise <= self.noise_uv
+        self.score = (contact + quiet + beats) / 3.0
+        if not contact:
+            self.state = "poor contact"
+        elif not quiet:
+            self.state = "noisy"
+        elif beats < 1.0:
+            self.state = "no beats" if beats == 0.0 else "irregular beats"
+        else:
+            self.state = "good"
+        if self.outlet is not None:
+            self.outlet.push_sample([self.score, clipping, flatline, noise, beats], now)
+        return self.score
@@ -0,0 +1,214 @@
+"""
+Local, crash-safe recording to an XDF file next to the LSL outlets.
+
+The pipelines hand their decoded blocks (samples with their local
+timestamps, plus the sensor time of the frame) to a Track; the Track
+only queues them, and a background thread encodes them as XDF Samples
+chunks, appends them to the file and fsyncs it every `fsync_interval`
+seconds. The file is only ever appended to, chunk by chunk, so after a
+power loss everything up to the last fsync is intact and at most the
+last chunk is cut short: recover() (also run when a Recorder reopens
+an existing file) truncates that, and the file reads as a normal XDF
+file (pyxdf, LabRecorder tools, polarband.xdf) again.
+
+The sensor time of every frame is recorded as a separate int64 stream
+<name>_SensorTime (ns since 2000-01-01, as sent by the band), with one
+sample per frame, stamped at the local time of the last sample.
+"""
+
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+from pylsl import StreamInfo, IRREGULAR_RATE, local_clock
+
+from .xdf import (StreamHeader, FORMATS, TAG_FILE_HEADER, TAG_STREAM_HEADER,
+                  TAG_SAMPLES, TAG_STREAM_FOOTER, _read_varlen)
+
+FILE_HEADER = b'<?xml version="1.0"?><info><version>1.0</version></info>'
+
+
+def _varlen(n):
+    if n < 256:
+        return struct.pack("<BB", 1, n)
+    if n < 2**32:
+        return struct.pack("<BI", 4, n)
+    return struct.pack("<BQ", 8, n)
+
+
+def _chunk(tag, content):
+    return _varlen(len(content) + 2) + struct.pack("<H", tag) + content
+
+
+def samples_chunk(stream_id, fmt, stamps, values):
+    """
+    Encodes a Samples chunk in which every sample carries its timestamp.
+    """
+    n = len(stamps)
+    record = np.dtype([("flag", "u1"), ("t", "<f8"), ("x", fmt, values.shape[1:])])
+    rec = np.empty(n, record)
+    rec["flag"] = 8
+    rec["t"] = stamps
+    rec["x"] = values
+    return _chunk(TAG_SAMPLES, struct.pack("<I", stream_id) + _varlen(n) + rec.tobytes())
+
+
+def recover(path):
+    """
+    Truncates the file after its last whole chunk. Returns the number
+    of bytes cut off and the highest stream id in the file.
+    """
+    last_id = 0
+    with open(path, "r+b") as f:
+        if f.read(4) != b"XDF:":
+            raise ValueError("{0} is not an XDF file".format(path))
+        end = f.tell()
+        while True:
+            length = _read_varlen(f)
+            if length is None or length < 2:
+                break
+            content = f.read(length)
+            if len(content) < length:
+                break
+            tag = struct.unpack("<H", content[:2])[0]
+            if tag == TAG_STREAM_HEADER:
+                last_id = max(last_id, struct.unpack("<I", content[2:6])[0])
+            end = f.tell()
+        size = f.seek(0, os.SEEK_END)
+        if size > end:
+            f.truncate(end)
+    return size - end, last_id
+
+
+class Track:
+    """
+    One recorded stream (and its sensor time stream). write() only
+    queues the block, so it is safe to call from the BLE callback.
+    """
+
+    def __init__(self, recorder, stream_id, header, sensor_id=None):
+        self.queue = recorder.queue
+        self.stream_id = stream_id
+        self.sensor_id = sensor_id
+        self.dtype = FORMATS[header.channel_format]
+        self.channels = header.channel_count
+
+    def write(self, stamps, values, sensor_ns=None):
+        values = np.array(values, self.dtype).reshape(len(stamps), self.channels)
+        self.queue.put((self.stream_id, np.array(stamps, np.float64), values))
+        if sensor_ns is not None and self.sensor_id is not None and len(stamps):
+            self.queue.put((self.sensor_id, np.array(stamps[-1:], np.float64),
+                            np.array([[sensor_ns]], np.int64)))
+
+
+class Recorder:
+    """
+    Appends streams to the XDF file `path` from a background writer.
+    """
+
+    def __init__(self, path, fsync_interval=1.0):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.queue = queue.SimpleQueue()
+        self.headers = {}
+        self.footers = {}       # stream id -> [first stamp, last stamp, count]
+        self.dropped_bytes = 0
+        self.next_id = 1
+        if os.path.exists(path) and os.path.getsize(path):
+            self.dropped_bytes, last_id = recover(path)
+            self.next_id = last_id + 1
+            self.file = open(path, "ab")
+        else:
+            self.file = open(path, "wb")
+            self.file.write(b"XDF:" + _chunk(TAG_FILE_HEADER, FILE_HEADER))
+        self.thread = threading.Thread(target=self._run, name="polarband-recorder", daemon=True)
+        self.thread.start()
+
+    def add_stream(self, info, sensor_time=False):
+        """
+        Adds a stream described by a pylsl StreamInfo (or a StreamOutlet)
+        and returns its Track; with `sensor_time` the Track also records
+        the sensor time of each block.
+        """
+        if hasattr(info, "get_info"):
+            info = info.get_info()
+        stream_id = self._add_header(info.as_xml())
+        sensor_id = None
+        if sensor_time:
+            sensor = StreamInfo(info.name() + "_SensorTime", "SensorTime", 1, IRREGULAR_RATE,
+                                "int64", info.source_id() + "_SensorTime")
+            sensor.desc().append_child("channels").append_child("channel") \
+                  .append_child_value("name", "SensorTime") \
+                  .append_child_value("unit", "ns since 2000-01-01")
+            sensor_id = self._add_header(sensor.as_xml())
+        return Track(self, stream_id, self.headers[stream_id], sensor_id)
+
+    def _add_header(self, xml):
+        stream_id = self.next_id
+        self.next_id += 1
+        self.headers[stream_id] = StreamHeader(stream_id, xml)
+        self.queue.put((stream_id, None, xml.encode("utf-8")))
+        return stream_id
+
+    def close(self):
+        """
+        Writes what is queued and the stream footers, and closes the file.
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        last_sync = time.monotonic()
+        running = True
+        dirty = False
+        while running:
+            try:
+                items = [self.queue.get(timeout=self.fsync_interval)]
+            except queue.Empty:
+                items = []
+            # everything queued meanwhile goes out with one write
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            blocks = []
+            for item in items:
+                if item is None:
+                    running = False
+                    continue
+                blocks.append(self._encode(*item))
+            if blocks:
+                self.file.write(b"".join(blocks))
+                dirty = True
+            now = time.monotonic()
+            if running and dirty and now - last_sync >= self.fsync_interval:
+                self._sync()
+                last_sync = now
+                dirty = False
+        self.file.write(b"".join(self._footer(sid) for sid in self.headers))
+        self._sync()
+        self.file.close()
+
+    def _encode(self, stream_id, stamps, values):
+        if stamps is None:
+            return _chunk(TAG_STREAM_HEADER, struct.pack("<I", stream_id) + values)
+        footer = self.footers.setdefault(stream_id, [stamps[0], stamps[-1], 0])
+        footer[1] = stamps[-1]
+        footer[2] += len(stamps)
+        return samples_chunk(stream_id, values.dtype, stamps, values)
+
+    def _footer(self, stream_id):
+        first, last, count = self.footers.get(stream_id, (0.0, 0.0, 0))
+        xml = ('<?xml version="1.0"?><info><first_timestamp>{0}</first_timestamp>'
+               '<last_timestamp>{1}</last_timestamp><sample_count>{2}</sample_count>'
+               '<clock_offsets><offset><time>{3}</time><value>0</value></offset>'
+               '</clock_offsets></info>').format(first, last, count, local_clock())
+        return _chunk(TAG_STREAM_FOOTER, struct.pack("<I", stream_id) + xml.encode("utf-8"))
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
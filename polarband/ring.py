@@ -0,0 +1,90 @@
+"""
+Fixed-size ring buffers for live display.
+
+A RingBuffer is preallocated once and overwritten in place, so its
+memory does not grow with the length of a session. It has one writer
+(the BLE thread) and readers that take copies at their own pace; a
+reader racing the writer may see the newest samples half written,
+which only matters for the last pixel of a display.
+"""
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    The last `capacity` values of a stream.
+    """
+
+    def __init__(self, capacity, dtype=np.float32):
+        self.data = np.zeros(capacity, dtype)
+        self.count = 0          # total number of values written
+
+    @property
+    def capacity(self):
+        return len(self.data)
+
+    def write(self, values):
+        values = np.asarray(values)
+        n = len(values)
+        cap = len(self.data)
+        if n >= cap:
+            values = values[n - cap:]
+            i = (self.count + n - cap) % cap
+        else:
+            i = self.count % cap
+        m = len(values)
+        first = min(m, cap - i)
+        self.data[i:i + first] = values[:first]
+        self.data[:m - first] = values[first:]
+        self.count += n
+
+    def append(self, value):
+        self.data[self.count % len(self.data)] = value
+        self.count += 1
+
+    def latest(self, n=None, out=None):
+        """
+        The last `n` values (at most the number written), oldest first.
+        """
+        cap = len(self.data)
+        count = self.count
+        n = min(cap if n is None else n, count, cap)
+        if out is None:
+            out = np.empty(n, self.data.dtype)
+        end = count % cap
+        start = end - n
+        if start >= 0:
+            out[:n] = self.data[start:end]
+        else:
+            out[:-start] = self.data[start:]
+            out[-start:n] = self.data[:end]
+        return out[:n]
+
+    def envelope(self, width, n=None):
+        """
+        The last `n` values reduced to `width` columns, as alternating
+        minimum and maximum per column, so that short peaks (R-tops)
+        stay visible however many samples fall on one pixel.
+        """
+        values = self.latest(n)
+        per = len(values) // width
+        if per < 2:
+            return values
+        columns = values[len(values) - per * width:].reshape(width, per)
+        out = np.empty((width, 2), values.dtype)
+        columns.min(axis=1, out=out[:, 0])
+        columns.max(axis=1, out=out[:, 1])
+        return out.ravel()
+
+
+class Scope:
+    """
+    What a live view of one band needs: the last `seconds` of ECG and
+    the last `beats` inter-beat intervals (ms).
+    """
+
+    def __init__(self, srate, seconds=5.0, beats=60):
+        self.seconds = seconds
+        self.ecg = RingBuffer(int(round(srate * seconds)))
+        self.ibi = RingBuffer(beats)
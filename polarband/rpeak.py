@@ -0,0 +1,176 @@
+"""
+Online R-peak detection and IBI computation.
+
+A streaming port of the R-top trigger used offline in getIBI.m and
+in the PRECAR trigger code (A.M. van Roon): a sample above the
+threshold arms the trigger, the first sample that no longer rises
+marks the R-top on the sample before it, whose time is corrected to
+sub-sample precision with
+
+    t = t_top + (next - prev) / 2 / |rc| * dt,
+    rc = max(|prev - top|, |next - top|)
+
+after which the detector is inhibited for MinPeakDistance. The
+threshold follows median + 2 * std as in getIBI.m, but as a running
+estimate updated per notification, so the cost per frame is constant.
+All state is carried across notifications, and every notification is
+handled in work arrays allocated once (grown for a longer block).
+"""
+
+import numpy as np
+
+
+def median_inplace(values):
+    """
+    The median of the float array `values`, as np.median, but without
+    a copy: `values` is left partially sorted.
+    """
+    n = len(values)
+    h = n // 2
+    if n % 2:
+        values.partition(h)
+        return values[h]
+    values.partition((h - 1, h))
+    return (values[h - 1] + values[h]) / 2.0
+
+
+class RPeakDetector:
+    """
+    Incremental R-peak detector for one ECG stream.
+    """
+
+    # seconds of data used to settle the threshold before triggering
+    WARMUP = 2.0
+
+    def __init__(self, srate, min_peak_distance=0.35, std_factor=2.0,
+                 halflife=10.0, inverted=False):
+        self.srate = srate
+        self.min_peak_distance = min_peak_distance
+        self.std_factor = std_factor
+        self.halflife = halflife
+        self.sign = -1.0 if inverted else 1.0
+        self._buffers(256)
+        self.reset()
+
+    def _buffers(self, n):
+        # blocks of up to n samples, after the two carried ones
+        self.xx = np.empty(n + 2)
+        self.tt = np.empty(n + 2)
+        self.flags = np.empty(n + 2, dtype=bool)
+        self.flags2 = np.empty(n + 2, dtype=bool)
+        self.work = np.empty(n)
+
+    def reset(self):
+        """
+        Forgets all state, e.g. after a gap in the data.
+        """
+        self.median = None
+        self.std = 0.0
+        self.seen = 0
+        self.armed = False
+        self.inhibit_until = -np.inf
+        self.last_peak = None
+        # the last two samples (and times) of the previous frame
+        self.carry = np.zeros(2)
+        self.carry_t = np.zeros(2)
+        self.carried = 0
+
+    @property
+    def threshold(self):
+        return self.median + self.std_factor * self.std
+
+    def process(self, samples, stamps):
+        """
+        Feeds one block of samples with their timestamps. Returns a list
+        of (R-top time, IBI in seconds) for the R-tops completed in this
+        block; the very first R-top has no IBI and is not reported.
+        """
+        n = len(samples)
+        if n == 0:
+            return []
+        if n > len(self.work):
+            self._buffers(n)
+        # the carried samples, then this block
+        k = self.carried
+        m = k + n
+        xx, tt = self.xx[:m], self.tt[:m]
+        xx[:k] = self.carry[2 - k:]
+        tt[:k] = self.carry_t[2 - k:]
+        np.multiply(samples, self.sign, out=xx[k:])
+        tt[k:] = stamps
+        self._update_threshold(xx[k:])
+        if self.seen < self.WARMUP * self.srate:
+            self.seen += n
+            self.carried = 0
+            return []
+
+        thr = self.threshold
+        beats = []
+        i = k  # first new sample
+        while i < m:
+            if not self.armed:
+                hits, recent = self.flags[:m - i], self.flags2[:m - i]
+                np.greater(xx[i:], thr, out=hits)
+                np.greater_equal(tt[i:], self.inhibit_until, out=recent)
+                np.logical_and(hits, recent, out=hits)
+                first = int(hits.argmax())
+                if not hits[first]:
+                    break
+                i += first
+                self.armed = True
+                i += 1
+                continue
+            # armed: find the first sample that does not rise any more
+            j = max(i, 1)
+            if j >= m:
+                break
+            falls = self.flags[:m - j]
+            np.less_equal(xx[j:], xx[j - 1:-1], out=falls)
+            first = int(falls.argmax())
+            if not falls[first]:
+                break
+            nxt = j + first
+            top = nxt - 1
+            t = self._refine(xx, tt, top, nxt)
+            if self.last_peak is not None:
+                beats.append((t, t - self.last_peak))
+            self.last_peak = t
+            self.inhibit_until = t + self.min_peak_distance
+            self.armed = False
+            i = nxt + 1
+
+        keep = min(m, 2)
+        self.carry[2 - keep:] = xx[m - keep:]
+        self.carry_t[2 - keep:] = tt[m - keep:]
+        self.carried = keep
+        return beats
+
+    def _refine(self, xx, tt, top, nxt):
+        # van Roon sub-sample correction of the R-top time
+        t = tt[top]
+        if top == 0:
+            return t
+        prev, last, cur = xx[top - 1], xx[top], xx[nxt]
+        rc = max(abs(prev - last), abs(cur - last))
+        if rc != 0:
+            t += (cur - prev) / 2.0 / rc * (tt[nxt] - tt[top])
+        return t
+
+    def _update_threshold(self, x):
+        # a notification does not always hold a QRS complex, so the
+        # spread follows increases quickly and decreases slowly
+        w = self.work[:len(x)]
+        w[:] = x
+        med = median_inplace(w)
+        # x.std(), in the work array
+        np.subtract(x, x.mean(), out=w)
+        np.multiply(w, w, out=w)
+        std = np.sqrt(w.sum() / len(x))
+        if self.median is None:
+            self.median, self.std = med, std
+            return
+        a = 0.5 ** (len(x) / self.srate / self.halflife)
+        self.median = a * self.median + (1 - a) * med
+        if std > self.std:
+            a = a ** 8
+        self.std = a * self.std + (1 - a) * std
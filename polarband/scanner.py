@@ -0,0 +1,78 @@
+"""
+Incremental discovery of Polar bands.
+
+DeviceScanner reports every matching device the moment its first
+advertisement arrives (bleak's detection callback), once per scan,
+instead of waiting for a full BleakScanner.discover(). Devices seen
+within the last `ttl` seconds are remembered and reported right at the
+start of the next scan, so a rescan lists the known bands at once while
+the radio keeps looking for new ones.
+"""
+
+import asyncio
+import time
+
+
+class DeviceScanner:
+    """
+    Scans with `scanner_class` (bleak.BleakScanner or a stand-in) for
+    devices whose name contains `match`; `options` go to the scanner.
+    """
+
+    def __init__(self, scanner_class, match="Polar H10", ttl=60.0, **options):
+        self.scanner_class = scanner_class
+        self.match = match
+        self.ttl = ttl
+        self.options = options
+        self.cache = {}         # address -> (device, advertisement, time last seen)
+
+    def recent(self):
+        """
+        The (device, advertisement) pairs seen within the TTL; forgets
+        the older ones.
+        """
+        now = time.monotonic()
+        for address, (device, adv, seen) in list(self.cache.items()):
+            if now - seen > self.ttl:
+                del self.cache[address]
+        return [(device, adv) for device, adv, seen in self.cache.values()]
+
+    def matches(self, device, adv):
+        name = getattr(adv, "local_name", None) or device.name or ""
+        return self.match in name
+
+    async def scan(self, found, timeout=5.0, stop=None):
+        """
+        Calls found(device, advertisement) for every matching device,
+        cached ones first, each address once. Scans for `timeout`
+        seconds or until the asyncio.Event `stop` is set. Returns the
+        addresses reported.
+        """
+        reported = set()
+
+        def report(device, adv):
+            if device.address not in reported:
+                reported.add(device.address)
+                found(device, adv)
+
+        for device, adv in self.recent():
+            report(device, adv)
+
+        def detected(device, adv):
+            if self.matches(device, adv):
+                self.cache[device.address] = (device, adv, time.monotonic())
+                report(device, adv)
+
+        scanner = self.scanner_class(detection_callback=detected, **self.options)
+        await scanner.start()
+        try:
+            if stop is None:
+                await asyncio.sleep(timeout)
+            else:
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await scanner.stop()
+        return reported
@@ -0,0 +1,299 @@
+"""
+One band from connection to LSL outlets.
+
+A PolarSession owns everything that streams one band: its outlets,
+the pipelines feeding them (optionally behind a QueuedPipeline) and the
+Supervisor that keeps the connection up. run() streams until its stop
+event is set and then flushes, so any number of sessions can run as
+tasks on one event loop and be started and stopped independently.
+
+A connection starts the measurements first. Model, manufacturer and
+battery are read afterwards, in the background, and come from the
+DeviceCache (polarband.devicecache) until then; the PMD control point
+is written without reading its feature list first. Every connection is
+timed per phase, from the connection attempt to the first sample:
+
+    wait          failed attempts and waiting for a connection slot
+                  (see Supervisor)
+    connect       link and service discovery
+    start         PMD start commands and notifications enabled
+    first_sample  from then until the first notification arrived
+"""
+
+import asyncio
+
+from pylsl import local_clock
+
+from .filters import PREVIEW_FACTOR, FilterStage, design, describe
+from .gatt import (MODEL_NBR_UUID, MANUFACTURER_NAME_UUID, BATTERY_LEVEL_UUID, PMD_SERVICE,
+                   PMD_CONTROL, PMD_DATA, DEVICE_INFORMATION_SERVICE, BATTERY_SERVICE,
+                   HEART_RATE_SERVICE)
+from .heartrate import HEART_RATE_MEASUREMENT_UUID
+from .hrv import HrvEngine
+from .outlet import (outlet_chunk_size, start_ecg_stream, start_ibi_stream, start_acc_stream,
+                     start_hr_stream, start_rr_stream, start_marker_stream, start_quality_stream,
+                     start_filtered_stream, start_hrv_stream)
+from .pmd import ACC_RATES, ECG_SAMPLING_FREQ
+from .pipeline import EcgPipeline, AccPipeline, HrPipeline, BandPipeline
+from .profiles import get_profile
+from .quality import QualityEstimator
+from .supervisor import Supervisor
+from .worker import QueuedPipeline
+
+MEASUREMENTS = ("ecg", "acc", "hr")
+
+
+class PolarSession:
+    """
+    Streams the `measurements` of the band at `address` to outlets
+    named after `name`. The outlet settings come from `profile`, or for
+    a measurement in `stream_profiles` from its own (see
+    polarband.profiles); `batch`, `chunk_size` and `max_buffered`
+    override them for all streams. `queue` > 0 decodes on a worker
+    thread; with a `recorder` (polarband.recorder) ECG and ACC are also
+    recorded, and a `scope` (polarband.ring) gets the ECG and IBIs for
+    display. With `quality` the ECG is rated per frame on a
+    NAME_Quality stream (polarband.quality). `filtered` adds the ECG
+    filtered online as NAME_Filtered, `preview` a 10 Hz version of it as
+    NAME_Preview; `filters` sets the filtering (keyword arguments of
+    polarband.filters.design). `hrv` > 0 streams HRV over that many
+    seconds as NAME_HRV (polarband.hrv), from the R-tops of the ECG or
+    else the RR intervals of "hr". A `cache` (DeviceCache) remembers the
+    band between runs; sessions sharing an asyncio.Semaphore as
+    `connect_slots` connect that many at a time.
+    """
+
+    def __init__(self, client_class, address, name, measurements=("ecg",), acc_rate=200,
+                 batch=None, chunk_size=None, max_buffered=None, profile="default",
+                 stream_profiles=None, markers=False, quality=True, filtered=False, preview=False,
+                 filters=None, hrv=0, queue=0, recorder=None, scope=None, cache=None,
+                 connect_slots=None, log=print):
+        # arguments first: nothing is half created on an error
+        for m in measurements:
+            if m not in MEASUREMENTS:
+                raise ValueError("unknown measurement: {0}".format(m))
+        if "acc" in measurements and acc_rate not in ACC_RATES:
+            raise ValueError("ACC sample rate must be one of {0}".format(ACC_RATES))
+        if hrv and "ecg" not in measurements and "hr" not in measurements:
+            raise ValueError("HRV needs the ecg or hr measurement")
+        filters = filters or {}
+        sos = design(ECG_SAMPLING_FREQ, **filters) if "ecg" in measurements and (
+            filtered or preview) else None
+        self.address = address
+        self.name = name
+        self.measurements = list(measurements)
+        self.log = log
+        self.cache = cache
+        self.known = cache.get(address) if cache is not None else {}
+        # model, manufacturer and battery: cached, then read once streaming
+        self.info = {k: self.known[k] for k in ("model", "manufacturer", "battery")
+                     if k in self.known}
+        self.read = False       # device information read in this run
+        self.phases = {}        # seconds per phase of the last connection
+        self.first_frame = None # asyncio.Event: a notification arrived since connecting
+        self.first_arrival = None
+        self.tasks = set()      # the background reads and timing of a connection
+
+        def settings(measurement):
+            # (batch, chunk size, max buffered) of one stream
+            p = get_profile((stream_profiles or {}).get(measurement, profile))
+            return (p.batch if batch is None else batch,
+                    p.chunk_size if chunk_size is None else chunk_size,
+                    p.max_buffered if max_buffered is None else max_buffered)
+
+        for stream in ["markers", "hrv"] + self.measurements:
+            settings(stream)    # an unknown profile raises before any outlet
+
+        def hrv_engine():
+            return HrvEngine(hrv, start_hrv_stream(name + '_HRV', address + '_HRV', hrv,
+                                                   settings("hrv")[2]))
+
+        # each band its own outlets, identified by its address
+        buffered = settings("markers")[2]
+        self.markers = start_marker_stream(name + '_Markers', address + '_Markers',
+                                           buffered) if markers else None
+        pmd = []
+        hr = None
+        if "ecg" in measurements:
+            b, chunk, buffered = settings("ecg")
+            outlet = start_ecg_stream(name, address, chunk or outlet_chunk_size(b), buffered)
+            # R-tops detected online go out on a second, irregular rate stream
+            ibi_outlet = start_ibi_stream(name + '_IBI', address + '_IBI', buffered)
+            estimator = QualityEstimator(start_quality_stream(
+                name + '_Quality', address + '_Quality', buffered)) if quality else None
+            stage = None
+            if sos is not None:
+                # derived streams next to the raw one, which stays as it is
+                text = describe(**filters)
+                stage = FilterStage(
+                    sos,
+                    start_filtered_stream(name + '_Filtered', address + '_Filtered', ECG_SAMPLING_FREQ,
+                                          text, chunk or outlet_chunk_size(b), buffered)
+                    if filtered else None,
+                    start_filtered_stream(name + '_Preview', address + '_Preview',
+                                          ECG_SAMPLING_FREQ / PREVIEW_FACTOR, text, 0, buffered)
+                    if preview else None,
+                    batch=b)
+            track = recorder.add_stream(outlet, sensor_time=True) if recorder else None
+            pmd.append(EcgPipeline(outlet, b, ibi_outlet=ibi_outlet, markers=self.markers,
+                                   scope=scope, track=track, quality=estimator, filters=stage,
+                                   hrv=hrv_engine() if hrv else None))
+        if "acc" in measurements:
+            b, chunk, buffered = settings("acc")
+            outlet = start_acc_stream(name + '_ACC', address + '_ACC', acc_rate, chunk, buffered)
+            track = recorder.add_stream(outlet, sensor_time=True) if recorder else None
+            pmd.append(AccPipeline(outlet, acc_rate, b, markers=self.markers, track=track))
+        if "hr" in measurements:
+            buffered = settings("hr")[2]
+            hr = HrPipeline(start_hr_stream(name + '_HR', address + '_HR', buffered),
+                            start_rr_stream(name + '_RR', address + '_RR', buffered),
+                            hrv=hrv_engine() if hrv and "ecg" not in measurements else None)
+        self.pipeline = BandPipeline(pmd, hr)
+        if queue:
+            # the BLE callback only queues; a worker does the rest
+            self.pipeline = QueuedPipeline(self.pipeline, queue, name="polarband-" + name,
+                                           log=log)
+        for m, status in self.statuses:
+            status.battery = self.info.get("battery")
+        self.supervisor = Supervisor(client_class, address, self._start, self._halt,
+                                     markers=self.markers, log=log,
+                                     statuses=[s for m, s in self.pipeline.statuses],
+                                     client_options=self._client_options, slots=connect_slots)
+
+    @property
+    def statuses(self):
+        """
+        (measurement name, BandStatus) of the PMD pipelines.
+        """
+        return self.pipeline.statuses
+
+    async def run(self, stop):
+        """
+        Streams until the asyncio.Event `stop` is set, then pushes what
+        the pipelines still buffer.
+        """
+        await self.supervisor.run(stop)
+        if isinstance(self.pipeline, QueuedPipeline):
+            await asyncio.get_event_loop().run_in_executor(None, self.pipeline.close)
+        else:
+            self.pipeline.flush()
+
+    def status(self):
+        """
+        The state of the session as a dict, for display or JSON.
+        """
+        status = {"address": self.address, "measurements": self.measurements,
+                  "connected": self.supervisor.connected,
+                  "reconnects": self.supervisor.reconnects,
+                  "streams": {m: s.summary() for m, s in self.statuses}}
+        status.update(self.info)
+        status["connect_phases"] = self.phases
+        if isinstance(self.pipeline, QueuedPipeline):
+            status["queue"] = self.pipeline.stats()
+        return status
+
+    def _client_options(self, failures):
+        # discover only the services used
+        services = []
+        if self.pipeline.start_commands:
+            services.append(PMD_SERVICE)
+        if self.pipeline.hr is not None:
+            services.append(HEART_RATE_SERVICE)
+        services.append(BATTERY_SERVICE)
+        if "model" not in self.info:
+            services.append(DEVICE_INFORMATION_SERVICE)
+        options = {"services": services}
+        if self.known and not failures:
+            # Windows: the GATT table cached by the system, unless that failed
+            options["winrt"] = {"use_cached_services": True}
+        return options
+
+    def _cancel(self):
+        for task in list(self.tasks):
+            task.cancel()
+
+    def _background(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _start(self, client, first):
+        # called on every (re)connection: streaming first, then the rest
+        connected = local_clock()
+        self._cancel()
+        self.first_frame = asyncio.Event()
+        self.first_arrival = None
+        pipeline = self.pipeline
+        # all selected PMD measurements share the one PMD data characteristic
+        for command in pipeline.start_commands:
+            await client.write_gatt_char(PMD_CONTROL, command)
+        if pipeline.start_commands:
+            await client.start_notify(PMD_DATA, self._notified(pipeline.process))
+        if pipeline.hr is not None:
+            await client.start_notify(HEART_RATE_MEASUREMENT_UUID,
+                                      self._notified(pipeline.process_hr))
+        started = local_clock()
+        supervisor = self.supervisor
+        self.phases = {"wait": supervisor.connect_started - supervisor.attempt_started,
+                       "connect": connected - supervisor.connect_started,
+                       "start": started - connected}
+        self.log("{0}: streaming {1}".format(self.name, ",".join(self.measurements)))
+        self._background(self._first_sample(started))
+        if not self.read:
+            self._background(self._read_info(client))
+
+    def _notified(self, process):
+        # the BLE callback (on the event loop): notes the first notification
+        def callback(sender, data):
+            if self.first_arrival is None:
+                self.first_arrival = local_clock()
+                self.first_frame.set()
+            process(data)
+        return callback
+
+    async def _first_sample(self, started, timeout=30.0):
+        # waits for the first notification after (re)connecting
+        try:
+            await asyncio.wait_for(self.first_frame.wait(), timeout)
+        except asyncio.TimeoutError:
+            return
+        first = self.first_arrival
+        self.phases["first_sample"] = max(first - started, 0.0)
+        total = first - self.supervisor.attempt_started
+        for m, status in self.statuses:
+            status.connect_time = total
+        self.log("{0}: first sample {1:.2f} s after connecting ({2})".format(
+            self.name, total, ", ".join("{0} {1:.2f} s".format(k, v)
+                                       for k, v in self.phases.items())))
+
+    async def _read_info(self, client):
+        # static values, once per run, while the band already streams
+        try:
+            info = {}
+            if "model" not in self.info:
+                model = await client.read_gatt_char(MODEL_NBR_UUID)
+                manufacturer = await client.read_gatt_char(MANUFACTURER_NAME_UUID)
+                info["model"] = bytes(model).decode("utf-8", "replace")
+                info["manufacturer"] = bytes(manufacturer).decode("utf-8", "replace")
+            battery = await client.read_gatt_char(BATTERY_LEVEL_UUID)
+            info["battery"] = int(battery[0])
+        except Exception as e:
+            self.log("{0}: device information not read ({1})".format(self.name, e))
+            return
+        self.info.update(info)
+        for m, status in self.statuses:
+            status.battery = info["battery"]
+        self.log("{0}: {1} {2}, battery {3}%".format(
+            self.name, self.info["manufacturer"], self.info["model"], self.info["battery"]))
+        self.read = True
+        if self.cache is not None:
+            self.cache.update(self.address, **info)
+            self.known = self.cache.get(self.address)
+
+    async def _halt(self, client):
+        self._cancel()
+        if self.pipeline.start_commands:
+            await client.stop_notify(PMD_DATA)
+        if self.pipeline.hr is not None:
+            await client.stop_notify(HEART_RATE_MEASUREMENT_UUID)
+        self.log("{0}: stopped".format(self.name))
@@ -0,0 +1,388 @@
+"""
+Simulated Polar H10 bands, for testing without radio.
+
+FakeBleakClient implements the part of bleak.BleakClient that the
+acquisition code uses (connect/disconnect, GATT reads and writes,
+notifications) and answers the PMD start commands with PMD frames at
+the real cadence: 73 ECG samples per frame at 130 Hz, ACC at the
+requested rate, and Heart Rate Measurement notifications once per
+second. The ECG is synthesized, or replayed from an XDF recording
+such as data.xdf. Delivery jitter, dropped notifications and link
+losses can be injected, and any number of bands can be simulated in
+one process. FakeBleakScanner stands in for bleak.BleakScanner.
+"""
+
+import asyncio
+import random
+import time
+
+import numpy as np
+
+from .pmd import (MEASUREMENT_ECG, MEASUREMENT_ACC, ECG_FRAME_SAMPLES, ECG_SAMPLING_FREQ,
+                  ACC_CHANNELS, PMD_START, SETTING_SAMPLE_RATE, encode_ecg,
+                  encode_acc)
+from .heartrate import HEART_RATE_MEASUREMENT_UUID
+from .gatt import PMD_CONTROL, PMD_DATA, MODEL_NBR_UUID, MANUFACTURER_NAME_UUID, BATTERY_LEVEL_UUID
+
+# sensor time of the simulated bands starts here (ns, ~2019 since 2000)
+SENSOR_EPOCH_NS = 600_000_000 * 10**9
+ACC_FRAME_SAMPLES = 36
+# GATT services of an H10: GAP, GATT, device information, battery,
+# heart rate, PMD and Polar's file transfer
+H10_SERVICES = 7
+# connection attempts in progress, over all simulated bands
+_CONNECTING = [0]
+
+
+class SimulatedDisconnect(ConnectionError):
+    """
+    Raised by FakeBleakClient calls on a link that was dropped.
+    """
+
+
+def simulated_addresses(n):
+    """
+    Addresses of `n` simulated bands.
+    """
+    return ["5A:00:00:00:{0:02X}:{1:02X}".format(i // 256, i % 256) for i in range(n)]
+
+
+class SimulatedBand:
+    """
+    Signal source of one simulated band. It outlives the connections
+    to it, so its sensor clock and signal continue across reconnects.
+    """
+
+    def __init__(self, address, replay=None, seed=None, heart_rate=65.0):
+        self.address = address
+        self.rng = np.random.default_rng(seed)
+        self.heart_rate = heart_rate
+        # the sensor clock runs on from a random start, with a drift
+        self.epoch_ns = SENSOR_EPOCH_NS + int(self.rng.integers(0, 10**12))
+        self.drift = self.rng.uniform(-50e-6, 50e-6)
+        self.t0 = time.monotonic()
+        self.ecg_pending = np.empty(0)
+        self.replay = None
+        self.replay_pos = 0
+        if replay is not None:
+            self.replay = _load_replay(replay)
+            self.replay_pos = int(self.rng.integers(0, len(self.replay)))
+        self.template = _beat_template(ECG_SAMPLING_FREQ)
+        self.last_rr = []
+
+    def sensor_now_ns(self):
+        return self.epoch_ns + int((time.monotonic() - self.t0) * 1e9 * (1.0 + self.drift))
+
+    def next_ibi(self):
+        return 60.0 / self.heart_rate * (1.0 + 0.05 * self.rng.standard_normal())
+
+    def ecg(self, n):
+        """
+        Next `n` ECG samples (microvolts).
+        """
+        if self.replay is not None:
+            idx = (self.replay_pos + np.arange(n)) % len(self.replay)
+            self.replay_pos = int(idx[-1] + 1) % len(self.replay)
+            return self.replay[idx]
+        while len(self.ecg_pending) < n:
+            ibi = self.next_ibi()
+            self.last_rr.append(ibi)
+            beat = np.zeros(max(int(round(ibi * ECG_SAMPLING_FREQ)), len(self.template)))
+            beat[:len(self.template)] = self.template
+            self.ecg_pending = np.concatenate((self.ecg_pending, beat))
+        out, self.ecg_pending = self.ecg_pending[:n], self.ecg_pending[n:]
+        return (out + self.rng.normal(0.0, 8.0, n)).astype(np.int32)
+
+    def acc(self, n, rate, sensor_ns):
+        """
+        `n` accelerometer samples (mG) up to `sensor_ns`: gravity plus
+        some sway.
+        """
+        t = sensor_ns * 1e-9 - np.arange(n - 1, -1, -1) / rate
+        sway = 30.0 * np.sin(2 * np.pi * 0.3 * t)
+        xyz = np.stack((sway, 1000.0 + 0.2 * sway, -sway), axis=1)
+        return (xyz + self.rng.normal(0.0, 5.0, (n, ACC_CHANNELS))).astype(np.int16)
+
+    def heart_rate_notification(self):
+        """
+        A Heart Rate Measurement value with the RR intervals since the
+        previous one (or one synthetic RR when replaying).
+        """
+        rr = self.last_rr or [self.next_ibi()]
+        self.last_rr = []
+        hr = int(round(60.0 / np.mean(rr)))
+        data = bytearray([0x16, min(hr, 255)])
+        for r in rr[-4:]:
+            data += int(round(r * 1024)).to_bytes(2, "little")
+        return data
+
+
+_BANDS = {}
+
+
+def get_band(address, **options):
+    """
+    The SimulatedBand behind `address`, created on first use.
+    """
+    if address not in _BANDS:
+        _BANDS[address] = SimulatedBand(address, **options)
+    return _BANDS[address]
+
+
+class FakeDevice:
+    """
+    Stands in for bleak's BLEDevice in scan results.
+    """
+
+    def __init__(self, address, name):
+        self.address = address
+        self.name = name
+
+    def __str__(self):
+        return "{0}: {1}".format(self.address, self.name)
+
+
+class FakeAdvertisement:
+    """
+    Stands in for bleak's AdvertisementData.
+    """
+
+    def __init__(self, local_name, rssi):
+        self.local_name = local_name
+        self.rssi = rssi
+
+
+class FakeBleakScanner:
+    """
+    Stands in for bleak.BleakScanner; finds `count` simulated bands.
+    Started with a detection_callback, every band advertises about
+    twice per second, the first time within `first_advert` seconds.
+    """
+
+    count = 1
+    first_advert = 1.0
+
+    def __init__(self, detection_callback=None, **kwargs):
+        self.detection_callback = detection_callback
+        self.tasks = []
+
+    @classmethod
+    def devices(cls):
+        return [FakeDevice(a, "Polar H10 {0}".format(a[-5:].replace(":", "")))
+                for a in simulated_addresses(cls.count)]
+
+    @classmethod
+    async def discover(cls, timeout=5.0, return_adv=False, **kwargs):
+        await asyncio.sleep(0.1)
+        devices = {d.address: d for d in cls.devices()}
+        if return_adv:
+            return {a: (d, FakeAdvertisement(d.name, -60)) for a, d in devices.items()}
+        return list(devices.values())
+
+    async def start(self):
+        self.tasks = [asyncio.ensure_future(self._advertise(d)) for d in self.devices()]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _advertise(self, device):
+        rand = random.Random(device.address)
+        await asyncio.sleep(rand.uniform(0.0, self.first_advert))
+        while True:
+            if self.detection_callback is not None:
+                self.detection_callback(device, FakeAdvertisement(device.name, rand.randint(-90, -40)))
+            await asyncio.sleep(rand.uniform(0.3, 0.7))
+
+
+class FakeBleakClient:
+    """
+    Stands in for bleak.BleakClient, talking to a SimulatedBand.
+
+    jitter:      mean extra delivery delay (s, exponential), order kept
+    drop:        probability that a notification is lost
+    disconnect:  mean time (s, exponential) until the link drops
+    connect_delay: time (s) a connect takes
+    gatt_delay:  time (s) a GATT read or write takes (a round trip)
+    adapter_connects: connection attempts the adapter takes at once (0:
+                 any); more fail, like BlueZ's "Operation already in progress"
+    discovery_delay: time (s) the discovery of one service takes, for all
+                 services of an H10 or those in `services`; none with
+                 winrt=dict(use_cached_services=True), as on Windows
+    replay:      XDF file to take the ECG from
+    acc_compressed: send delta compressed ACC frames, as an H10 does at
+                 some rates, instead of plain 16 bit ones
+    """
+
+    def __init__(self, address_or_device, disconnected_callback=None, jitter=0.0,
+                 drop=0.0, disconnect=None, connect_delay=0.5, gatt_delay=0.01,
+                 adapter_connects=0, discovery_delay=0.0, services=None, winrt=None,
+                 replay=None, acc_compressed=False, seed=None, **kwargs):
+        self.address = getattr(address_or_device, "address", address_or_device)
+        self.disconnected_callback = disconnected_callback
+        self.jitter = jitter
+        self.drop = drop
+        self.disconnect_after = disconnect
+        self.connect_delay = connect_delay
+        self.gatt_delay = gatt_delay
+        self.adapter_connects = adapter_connects
+        self.acc_compressed = bool(acc_compressed)
+        if (winrt or {}).get("use_cached_services"):
+            self.discovery = 0.0
+        else:
+            self.discovery = discovery_delay * (len(services) if services else H10_SERVICES)
+        self.random = random.Random(seed)
+        self.band = get_band(self.address, replay=replay, seed=seed)
+        self.connected = False
+        self.measurements = {}
+        self.tasks = {}
+        self.watchdog = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.disconnect()
+
+    async def connect(self, **kwargs):
+        if self.adapter_connects and _CONNECTING[0] >= self.adapter_connects:
+            await asyncio.sleep(self.connect_delay / 10)
+            raise SimulatedDisconnect("{0}: operation already in progress".format(self.address))
+        _CONNECTING[0] += 1
+        try:
+            await asyncio.sleep(self.connect_delay + self.discovery)
+        finally:
+            _CONNECTING[0] -= 1
+        self.connected = True
+        if self.disconnect_after:
+            delay = self.random.expovariate(1.0 / self.disconnect_after)
+            self.watchdog = asyncio.ensure_future(self._drop_link(delay))
+        return True
+
+    async def disconnect(self):
+        self._stop_all()
+        if self.watchdog is not None:
+            self.watchdog.cancel()
+        self.connected = False
+        return True
+
+    async def is_connected(self):
+        return self.connected
+
+    def _check(self):
+        if not self.connected:
+            raise SimulatedDisconnect("{0}: not connected".format(self.address))
+
+    async def read_gatt_char(self, uuid):
+        self._check()
+        await asyncio.sleep(self.gatt_delay)
+        uuid = str(uuid).lower()
+        if uuid == MODEL_NBR_UUID:
+            return bytearray(b"H10")
+        if uuid == MANUFACTURER_NAME_UUID:
+            return bytearray(b"Polar Electro Oy")
+        if uuid == BATTERY_LEVEL_UUID:
+            return bytearray([87])
+        return bytearray([0x0F, 0x05, 0x00, 0x00, 0x00, 0x00, 0x00])
+
+    async def write_gatt_char(self, uuid, data, response=True):
+        self._check()
+        await asyncio.sleep(self.gatt_delay)
+        if str(uuid).upper() == PMD_CONTROL and len(data) >= 2 and data[0] == PMD_START:
+            settings = {}
+            for i in range(2, len(data) - 3, 4):
+                settings[data[i]] = int.from_bytes(data[i + 2:i + 4], "little")
+            self.measurements[data[1]] = settings
+
+    async def start_notify(self, uuid, callback, **kwargs):
+        self._check()
+        uuid = str(uuid)
+        if uuid.upper() == PMD_DATA:
+            for measurement, settings in self.measurements.items():
+                key = (uuid.upper(), measurement)
+                self.tasks[key] = asyncio.ensure_future(
+                    self._pmd(measurement, settings, callback))
+        elif uuid.lower() == HEART_RATE_MEASUREMENT_UUID:
+            self.tasks[(uuid.lower(), None)] = asyncio.ensure_future(self._hr(callback))
+
+    async def stop_notify(self, uuid):
+        self._check()
+        uuid = str(uuid)
+        for key in [k for k in self.tasks if k[0] in (uuid.upper(), uuid.lower())]:
+            self.tasks.pop(key).cancel()
+
+    def _stop_all(self):
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks = {}
+
+    async def _drop_link(self, delay):
+        await asyncio.sleep(delay)
+        self._stop_all()
+        self.connected = False
+        if self.disconnected_callback is not None:
+            self.disconnected_callback(self)
+
+    async def _deliver(self, period, make_frame, callback):
+        # frames are produced at the sensor cadence; delivery adds
+        # jitter but never reorders, like a BLE connection
+        loop = asyncio.get_running_loop()
+        due = loop.time()
+        delivered = due
+        while True:
+            due += period
+            frame = make_frame()
+            delivered = max(delivered, due + (self.random.expovariate(1.0 / self.jitter)
+                                              if self.jitter > 0 else 0.0))
+            await asyncio.sleep(max(delivered - loop.time(), 0.0))
+            if self.drop and self.random.random() < self.drop:
+                continue
+            callback(None, frame)
+
+    async def _pmd(self, measurement, settings, callback):
+        band = self.band
+        if measurement == MEASUREMENT_ECG:
+            n, rate = ECG_FRAME_SAMPLES, ECG_SAMPLING_FREQ
+        elif measurement == MEASUREMENT_ACC:
+            n, rate = ACC_FRAME_SAMPLES, settings.get(SETTING_SAMPLE_RATE, 200)
+        else:
+            return
+        # sensor time of the last sample of the next frame
+        sensor = [float(band.sensor_now_ns())]
+
+        def make_frame():
+            sensor[0] += n * 1e9 / rate
+            ns = int(sensor[0])
+            if measurement == MEASUREMENT_ECG:
+                return encode_ecg(band.ecg(n), ns)
+            return encode_acc(band.acc(n, rate, ns), ns, compressed=self.acc_compressed)
+
+        await self._deliver(n / rate / (1.0 + band.drift), make_frame, callback)
+
+    async def _hr(self, callback):
+        await self._deliver(1.0, self.band.heart_rate_notification, callback)
+
+
+def _beat_template(fs):
+    # P, Q, R, S and T waves as gaussians (microvolts), R at 0.25 s
+    t = np.arange(int(0.65 * fs)) / fs - 0.25
+    waves = [(120, -0.16, 0.025), (-150, -0.03, 0.008), (1200, 0.0, 0.010),
+             (-300, 0.03, 0.010), (250, 0.25, 0.045)]
+    return sum(a * np.exp(-0.5 * ((t - mu) / sd) ** 2) for a, mu, sd in waves)
+
+
+def _load_replay(path):
+    from .xdf import iter_samples
+    chunks = [x[:, 0] for header, t, x in iter_samples(path, type="ECG")]
+    if not chunks:
+        raise ValueError("no ECG stream in {0}".format(path))
+    return np.concatenate(chunks).astype(np.int32)
@@ -0,0 +1,107 @@
+"""
+Acquisition status shared between the BLE thread and a user interface.
+
+A BandStatus has exactly one writer, the thread that handles the
+notifications of the band, and any number of readers. Every field is a
+plain attribute that is replaced by a single store, which is atomic in
+CPython, so neither side ever takes a lock or waits for the other: the
+interface polls the status at its own pace and may see a field that is
+one notification newer than another, which is harmless for display.
+StatusReporter prints them periodically for the command line.
+"""
+
+import asyncio
+
+from pylsl import local_clock
+
+
+class BandStatus:
+    """
+    Counters and last values of one band.
+    """
+
+    __slots__ = ("connected", "reconnects", "packets", "samples", "gaps",
+                 "lost_samples", "sample_rate", "battery", "last_packet", "quality",
+                 "connect_time")
+
+    def __init__(self):
+        self.connected = False
+        self.reconnects = 0
+        self.packets = 0            # notifications handled
+        self.samples = 0            # samples pushed
+        self.gaps = 0               # breaks in the sensor time
+        self.lost_samples = 0       # samples missing in those breaks
+        self.sample_rate = 0.0      # as measured in sensor time (Hz)
+        self.battery = None         # percent, when read
+        self.last_packet = 0.0      # local_clock() of the last notification
+        self.quality = None         # signal quality state, when rated
+        self.connect_time = None    # s from connecting to the first sample, last time
+
+    def update(self, n, clock, arrival):
+        """
+        Accounts for one notification of `n` samples timestamped by the
+        SensorClock `clock`.
+        """
+        self.packets += 1
+        self.samples += n
+        if clock.gap:
+            self.gaps += 1
+            self.lost_samples += int(round(clock.gap / clock.sample_interval))
+        self.sample_rate = 1.0 / clock.sample_interval
+        self.last_packet = arrival
+
+    def idle(self, now=None):
+        """
+        Seconds since the last notification (None before the first).
+        """
+        if not self.packets:
+            return None
+        return (local_clock() if now is None else now) - self.last_packet
+
+    def summary(self):
+        """
+        One line for a status display.
+        """
+        if not self.connected:
+            state = "reconnecting" if self.packets else "connecting"
+        else:
+            state = "{0:.1f} Hz".format(self.sample_rate)
+        text = "{0}, {1} packets, {2} dropped".format(state, self.packets, self.lost_samples)
+        if self.quality is not None and self.connected:
+            text += ", " + self.quality
+        if self.battery is not None:
+            text += ", battery {0}%".format(self.battery)
+        return text
+
+
+class StatusReporter:
+    """
+    Prints the status of all bands as one line every `interval`
+    seconds, instead of output per notification.
+    """
+
+    def __init__(self, statuses, interval=5.0, log=print, queues=()):
+        self.statuses = statuses    # [(name, BandStatus), ...]
+        self.queues = queues        # [(name, QueuedPipeline), ...]
+        self.interval = interval
+        self.log = log
+
+    def line(self):
+        parts = ["{0}: {1}".format(name, status.summary()) for name, status in self.statuses]
+        for name, queue in self.queues:
+            stats = queue.stats()
+            parts.append("{0} queue: {1} (max {2}), {3} overflows".format(
+                name, stats["depth"], stats["high_water"], stats["overflows"]))
+        return " | ".join(parts)
+
+    async def run(self, stop):
+        """
+        Reports until the asyncio.Event `stop` is set.
+        """
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                line = self.line()
+                if line:
+                    self.log(line)
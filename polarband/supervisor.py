@@ -0,0 +1,141 @@
+"""
+Connection supervision with automatic reconnect.
+
+A Supervisor keeps one band streaming for as long as it runs: when
+the link drops it reconnects with exponential backoff and restarts
+the measurements, while the pipelines and LSL outlets stay as they
+are, so recorders keep their streams and only see a gap (marked by
+the pipelines from the sensor time, and with 'disconnected' /
+'reconnected' markers when a marker outlet is given). The connection
+state is mirrored into the BandStatus objects given.
+
+Bringing up many bands at once, a shared asyncio.Semaphore (`slots`)
+bounds how many connect at the same time: an adapter handles few
+connection attempts in parallel, and the rest would only time out and
+back off. `attempt_started` tells since when the band is being
+connected (run() began or the link was lost, so failed attempts count)
+and `connect_started` when the successful attempt had its slot, to time
+the phases of a connection.
+"""
+
+import asyncio
+
+from pylsl import local_clock
+
+
+class Supervisor:
+    """
+    Runs start(client, first) on every (re)connection to `address`,
+    and halt(client) when stopped while connected. `client_options`,
+    if given, returns the extra keyword arguments of the client for
+    the number of attempts that failed in a row.
+    """
+
+    def __init__(self, client_class, address, start, halt=None, markers=None,
+                 min_backoff=0.5, max_backoff=30.0, log=print, statuses=(),
+                 client_options=None, slots=None):
+        self.client_class = client_class
+        self.address = address
+        self.start = start
+        self.halt = halt
+        self.markers = markers
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.log = log
+        self.statuses = statuses
+        self.client_options = client_options
+        self.slots = slots
+        self.connected = False
+        self.reconnects = 0
+        self.failures = 0           # attempts failed in a row
+        self.attempt_started = None # local_clock() since when it is connecting
+        self.connect_started = None # and when the last attempt got its slot
+
+    def _set_connected(self, connected):
+        self.connected = connected
+        for status in self.statuses:
+            status.connected = connected
+            status.reconnects = self.reconnects
+
+    def mark(self, text):
+        if self.markers is not None:
+            self.markers.push_sample([text], local_clock())
+
+    async def run(self, stop):
+        """
+        Streams until the asyncio.Event `stop` is set.
+        """
+        first = True
+        backoff = self.min_backoff
+        self.attempt_started = local_clock()
+        while not stop.is_set():
+            lost = asyncio.Event()
+            options = self.client_options(self.failures) if self.client_options else {}
+            holding = False
+            try:
+                if self.slots is not None:
+                    holding = await _acquire(self.slots, stop)
+                    if not holding:
+                        break   # stopped while waiting for a slot
+                self.connect_started = local_clock()
+                async with self.client_class(
+                        self.address, disconnected_callback=lambda client: lost.set(),
+                        **options) as client:
+                    await self.start(client, first)
+                    if holding:
+                        # streaming: the next band may connect
+                        self.slots.release()
+                        holding = False
+                    self.failures = 0
+                    if not first:
+                        self.reconnects += 1
+                        self.mark("reconnected")
+                        self.log("Reconnected: {0}".format(self.address))
+                    first = False
+                    backoff = self.min_backoff
+                    self._set_connected(True)
+                    await _first_of(stop, lost)
+                    if not lost.is_set() and self.halt is not None:
+                        await self.halt(client)
+            except Exception as e:
+                if not self.connected:
+                    self.failures += 1
+                self.log("Error ({0}): {1}".format(self.address, e))
+            finally:
+                if holding:
+                    self.slots.release()
+            if self.connected:
+                self._set_connected(False)
+                self.attempt_started = local_clock()
+                if not stop.is_set():
+                    self.mark("disconnected")
+                    self.log("Connection lost: {0}".format(self.address))
+            if stop.is_set():
+                break
+            try:
+                await asyncio.wait_for(stop.wait(), backoff)
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, self.max_backoff)
+
+
+async def _acquire(slots, stop):
+    # a connection slot; False (and no slot held) when `stop` is set first
+    acquire = asyncio.ensure_future(slots.acquire())
+    stopped = asyncio.ensure_future(stop.wait())
+    await asyncio.wait((acquire, stopped), return_when=asyncio.FIRST_COMPLETED)
+    stopped.cancel()
+    if not acquire.done():
+        acquire.cancel()
+        return False
+    if stop.is_set():
+        slots.release()
+        return False
+    return True
+
+
+async def _first_of(*events):
+    waiters = [asyncio.ensure_future(e.wait()) for e in events]
+    done, pending = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    for w in pending:
+        w.cancel()
@@ -0,0 +1,35 @@
+"""
+Selection of the BLE transport: bleak, or the simulator.
+"""
+
+import functools
+
+
+def parse_options(text):
+    """
+    Parses simulator options given as 'jitter=0.02,drop=0.01,replay=data.xdf'.
+    """
+    options = {}
+    for item in filter(None, (t.strip() for t in text.split(","))):
+        key, _, value = item.partition("=")
+        for kind in (int, float, str):
+            try:
+                options[key] = kind(value)
+                break
+            except ValueError:
+                pass
+    return options
+
+
+def get_transport(simulate=0, **options):
+    """
+    Returns the (client class, scanner class) to use. With `simulate`
+    set, these are the simulator's, finding `simulate` bands and
+    created with `options` (see simulator.FakeBleakClient).
+    """
+    if simulate:
+        from .simulator import FakeBleakClient, FakeBleakScanner
+        FakeBleakScanner.count = int(simulate)
+        return functools.partial(FakeBleakClient, **options), FakeBleakScanner
+    from bleak import BleakClient, BleakScanner
+    return BleakClient, BleakScanner
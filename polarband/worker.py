@@ -0,0 +1,138 @@
+"""
+Decoupling of the BLE callback from decoding and pushing.
+
+A QueuedPipeline stands in for a BandPipeline: its process() and
+process_hr(), called from the BLE notification callback, only take the
+arrival time and append the raw notification to a bounded queue. A
+worker thread per band takes them off and runs the real pipeline, so a
+stall in liblsl (or anything else downstream) delays the worker, not
+the next BLE callback.
+
+The queue is a collections.deque, whose append and popleft are atomic
+in CPython: with one producer (the BLE thread) and one consumer (the
+worker) no lock is taken on the hot path. When the queue is full the
+oldest notification is dropped and counted as an overflow; the
+pipeline then sees the loss as a gap in the sensor time. A flush is
+requested next to the queue, not through it, so it never takes the
+place of a notification.
+"""
+
+import collections
+import threading
+
+from pylsl import local_clock
+
+PMD, HR = 0, 1
+
+
+class QueuedPipeline:
+    """
+    Runs `pipeline` (a BandPipeline) on a worker thread, fed through a
+    queue of at most `maxsize` notifications. Errors of the pipeline go
+    to `log`.
+    """
+
+    def __init__(self, pipeline, maxsize=256, name="polarband-worker", log=print):
+        self.pipeline = pipeline
+        self.maxsize = maxsize
+        self.log = log
+        self.queue = collections.deque(maxlen=maxsize)
+        self.wakeup = threading.Event()
+        self.flush_requested = threading.Event()
+        self.flushed = threading.Event()
+        self.running = True
+        self.high_water = 0
+        self.overflows = 0
+        self.processed = 0
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    # the BandPipeline interface used by the front-ends
+    @property
+    def hr(self):
+        return self.pipeline.hr
+
+    @property
+    def start_commands(self):
+        return self.pipeline.start_commands
+
+    @property
+    def statuses(self):
+        return self.pipeline.statuses
+
+    @property
+    def depth(self):
+        return len(self.queue)
+
+    def _put(self, kind, data, arrival):
+        if arrival is None:
+            arrival = local_clock()
+        depth = len(self.queue)
+        if depth >= self.maxsize:
+            self.overflows += 1     # the deque drops the oldest entry
+            self.high_water = self.maxsize
+        elif depth >= self.high_water:
+            self.high_water = depth + 1
+        self.queue.append((kind, data, arrival))
+        self.wakeup.set()
+
+    def process(self, data, arrival=None):
+        """
+        Queues one PMD data notification.
+        """
+        self._put(PMD, data, arrival)
+
+    def process_hr(self, data, arrival=None):
+        """
+        Queues one Heart Rate Measurement notification.
+        """
+        self._put(HR, data, arrival)
+
+    def flush(self, timeout=5.0):
+        """
+        Waits until the worker has handled everything queued so far,
+        then pushes what the pipelines still buffer.
+        """
+        self.flushed.clear()
+        self.flush_requested.set()
+        self.wakeup.set()
+        self.flushed.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """
+        Flushes and stops the worker.
+        """
+        self.flush(timeout)
+        self.running = False
+        self.wakeup.set()
+        self.thread.join(timeout)
+
+    def stats(self):
+        return {"depth": len(self.queue), "high_water": self.high_water,
+                "overflows": self.overflows, "processed": self.processed}
+
+    def _run(self):
+        pipeline = self.pipeline
+        queue = self.queue
+        while self.running:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            # a flush requested before draining covers all queued before it
+            flush = self.flush_requested.is_set()
+            while queue:
+                kind, data, arrival = queue.popleft()
+                try:
+                    if kind == PMD:
+                        pipeline.process(data, arrival)
+                    else:
+                        pipeline.process_hr(data, arrival)
+                except Exception as e:
+                    self.log("Error in pipeline: {0}".format(e))
+                self.processed += 1
+            if flush:
+                self.flush_requested.clear()
+                try:
+                    pipeline.flush()
+                except Exception as e:
+                    self.log("Error in pipeline: {0}".format(e))
+                self.flushed.set()
@@ -0,0 +1,145 @@
+"""
+Minimal streaming reader for XDF files (https://github.com/sccn/xdf).
+
+Unlike load_xdf, the file is read one chunk at a time, so memory use
+is bounded by the largest chunk, not by the recording. Sample chunks
+in which every sample carries a timestamp (as LabRecorder writes
+them) are decoded with a single structured np.frombuffer.
+"""
+
+import struct
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+TAG_FILE_HEADER = 1
+TAG_STREAM_HEADER = 2
+TAG_SAMPLES = 3
+TAG_CLOCK_OFFSET = 4
+TAG_BOUNDARY = 5
+TAG_STREAM_FOOTER = 6
+
+FORMATS = {
+    "float32": "<f4", "double64": "<f8", "int8": "<i1",
+    "int16": "<i2", "int32": "<i4", "int64": "<i8",
+}
+
+
+class StreamHeader:
+    """
+    The parts of an XDF stream header needed to decode its samples.
+    """
+
+    def __init__(self, stream_id, xml):
+        info = ET.fromstring(xml)
+        self.stream_id = stream_id
+        self.xml = xml
+        self.name = info.findtext("name", "")
+        self.type = info.findtext("type", "")
+        self.source_id = info.findtext("source_id", "")
+        self.channel_count = int(info.findtext("channel_count", "1"))
+        self.channel_format = info.findtext("channel_format", "float32")
+        self.srate = float(info.findtext("nominal_srate", "0"))
+
+    def matches(self, name=None, type=None, stream_id=None):
+        return ((name is None or self.name == name)
+                and (type is None or self.type == type)
+                and (stream_id is None or self.stream_id == stream_id))
+
+
+def _read_varlen(f):
+    nbytes = f.read(1)
+    if not nbytes:
+        return None
+    return int.from_bytes(f.read(nbytes[0]), "little")
+
+
+def iter_chunks(path):
+    """
+    Yields (tag, content bytes) for every chunk in the file.
+    """
+    with open(path, "rb") as f:
+        if f.read(4) != b"XDF:":
+            raise ValueError("{0} is not an XDF file".format(path))
+        while True:
+            length = _read_varlen(f)
+            if length is None or length < 2:
+                return
+            content = f.read(length)
+            if len(content) < length:
+                return  # truncated file: stop at the last whole chunk
+            yield struct.unpack("<H", content[:2])[0], content[2:]
+
+
+def _decode_samples(header, content, last_stamp):
+    # content: stream id (4 bytes) already stripped
+    count_bytes = content[0]
+    n = int.from_bytes(content[1:1 + count_bytes], "little")
+    body = memoryview(content)[1 + count_bytes:]
+    cc = header.channel_count
+    fmt = FORMATS.get(header.channel_format)
+    dt = 1.0 / header.srate if header.srate > 0 else 0.0
+
+    if fmt is not None:
+        record = np.dtype([("flag", "u1"), ("t", "<f8"), ("x", fmt, (cc,))])
+        if len(body) == n * record.itemsize:
+            rec = np.frombuffer(body, dtype=record, count=n)
+            if n == 0 or (rec["flag"] == 8).all():
+                return rec["t"].copy(), rec["x"].copy()
+        values = np.empty((n, cc), dtype=fmt)
+    else:
+        values = np.empty((n, cc), dtype=object)
+
+    stamps = np.empty(n)
+    pos = 0
+    size = np.dtype(fmt).itemsize * cc if fmt else 0
+    for i in range(n):
+        if body[pos] == 8:
+            last_stamp = struct.unpack_from("<d", body, pos + 1)[0]
+            pos += 9
+        else:
+            last_stamp = last_stamp + dt
+            pos += 1
+        stamps[i] = last_stamp
+        if fmt is not None:
+            values[i] = np.frombuffer(body, dtype=fmt, count=cc, offset=pos)
+            pos += size
+        else:
+            for c in range(cc):
+                nb = body[pos]
+                length = int.from_bytes(body[pos + 1:pos + 1 + nb], "little")
+                pos += 1 + nb
+                values[i, c] = bytes(body[pos:pos + length]).decode("utf-8", "replace")
+                pos += length
+    return stamps, values
+
+
+def iter_samples(path, name=None, type=None, stream_id=None):
+    """
+    Yields (stream header, timestamps, samples x channels) for every
+    Samples chunk of the streams matching name/type/stream_id.
+    """
+    headers = {}
+    last = {}
+    for tag, content in iter_chunks(path):
+        if tag == TAG_STREAM_HEADER:
+            sid = struct.unpack("<I", content[:4])[0]
+            headers[sid] = StreamHeader(sid, content[4:])
+            last[sid] = 0.0
+        elif tag == TAG_SAMPLES:
+            sid = struct.unpack("<I", content[:4])[0]
+            header = headers.get(sid)
+            if header is None or not header.matches(name, type, stream_id):
+                continue
+            stamps, values = _decode_samples(header, content[4:], last[sid])
+            if len(stamps):
+                last[sid] = stamps[-1]
+            yield header, stamps, values
+
+
+def stream_headers(path):
+    """
+    Lists the stream headers in the file.
+    """
+    return [StreamHeader(struct.unpack("<I", c[:4])[0], c[4:])
+            for tag, c in iter_chunks(path) if tag == TAG_STREAM_HEADER]
@@ -0,0 +1,60 @@
+"""
+Daemon.command replies to every command, whatever fails.
+"""
+
+import asyncio
+
+import pytest
+
+from polarband.daemon import Daemon
+
+CONFIG = """
+[daemon]
+control = 127.0.0.1:0
+cache = none
+simulate = 1
+
+[Band]
+address = 00:00:00:00:00:01
+autostart = no
+"""
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    path = tmp_path / "polardaemon.cfg"
+    path.write_text(CONFIG)
+    logged = []
+    d = Daemon(str(path), log=logged.append)
+    d.logged = logged
+    return d
+
+
+def test_unexpected_errors_are_replied_and_logged(daemon, monkeypatch):
+    assert asyncio.run(daemon.command("start Nobody")) == {"ok": False,
+                                                            "error": "unknown band: Nobody"}
+
+    def fail(name):
+        raise RuntimeError("adapter gone")
+    monkeypatch.setattr(daemon, "start", fail)
+    reply = asyncio.run(daemon.command("start Band"))
+    assert reply == {"ok": False, "error": "RuntimeError: adapter gone"}
+    assert any("adapter gone" in line for line in daemon.logged)
+
+
+def test_failed_start_leaves_no_band_registered(daemon):
+    class BrokenMetrics:
+        removed = []
+
+        def add(self, name, pipeline):
+            raise OSError("metrics full")
+
+        def remove(self, name):
+            self.removed.append(name)
+
+    daemon.metrics = BrokenMetrics()
+    reply = asyncio.run(daemon.command("start Band"))
+    assert reply["ok"] is False and "metrics full" in reply["error"]
+    assert daemon.sessions == {}
+    assert daemon.metrics.removed == ["Band"]
+    assert daemon.status()["Band"]["running"] is False
@@ -0,0 +1,73 @@
+"""
+SosFilter and Decimator against straightforward per-sample references.
+"""
+
+import numpy as np
+import pytest
+
+from polarband.filters import (SosFilter, Decimator, design, parse_filters, lowpass_fir, _run,
+                               MAX_BLOCK)
+from polarband.pmd import ECG_SAMPLING_FREQ
+
+FS = ECG_SAMPLING_FREQ
+
+
+@pytest.mark.parametrize("options", [{}, {"bandpass": (5.0, 15.0)}, {"highpass": None, "notch": 60.0},
+                                     {"highpass": 1.0, "notch": None, "bandpass": (0.5, 40.0)}])
+def test_sos_filter_matches_per_sample_cascade(options):
+    sos = design(FS, **options)
+    rng = np.random.default_rng(0)
+    x = rng.normal(0, 500, 3000) + 1000
+    f = SosFilter(sos)
+    pos, blocks = 0, []
+    while pos < len(x):
+        n = int(rng.choice([1, 2, 73, 74, 200, MAX_BLOCK + 37]))
+        blocks.append(f.process(x[pos:pos + n]))
+        pos += n
+    z = f.zi * x[0]
+    reference = _run(sos, x, z)
+    assert np.allclose(np.concatenate(blocks), reference, rtol=0, atol=1e-9 * np.abs(x).max())
+
+
+def test_decimator_matches_full_convolution():
+    rng = np.random.default_rng(1)
+    x = rng.normal(0, 1, 2000)
+    t = np.arange(len(x)) / FS
+    d = Decimator(13)
+    ys, ts = [], []
+    pos = 0
+    while pos < len(x):
+        n = int(rng.choice([1, 5, 73, 300]))
+        y, y_t = d.process(x[pos:pos + n], t[pos:pos + n])
+        ys.append(y)
+        ts.append(y_t)
+        pos += n
+    taps = lowpass_fir(13)
+    full = np.convolve(x, taps, mode="valid")[::13]
+    centre = (len(taps) - 1) // 2
+    y = np.concatenate(ys)
+    assert np.allclose(y, full[:len(y)], atol=1e-12)
+    assert np.allclose(np.concatenate(ts), t[centre::13][:len(y)])
+
+
+@pytest.mark.parametrize("options", [{"highpass": 80.0}, {"highpass": -1.0}, {"highpass": 65.0},
+                                     {"notch": 65.0}, {"notch": 70.0}, {"notch": -50.0},
+                                     {"bandpass": (5.0, 100.0)}, {"bandpass": (15.0, 5.0)},
+                                     {"bandpass": (0.0, 15.0)}])
+def test_design_rejects_frequencies_outside_nyquist(options):
+    with pytest.raises(ValueError):
+        design(FS, **options)
+
+
+def test_design_sections_are_stable():
+    for options in ({}, {"highpass": 64.0, "notch": 64.0}, {"bandpass": (0.1, 64.0)}):
+        for section in design(FS, **options):
+            poles = np.roots(section[3:])
+            assert np.all(np.abs(poles) < 1.0)
+
+
+def test_parse_filters():
+    assert parse_filters("highpass=0.5,notch=none,bandpass=5-15") == {
+        "highpass": 0.5, "notch": None, "bandpass": (5.0, 15.0)}
+    with pytest.raises(ValueError):
+        parse_filters("lowpass=5")
@@ -0,0 +1,90 @@
+"""
+HrvEngine, updated per beat, against a full recompute over the window.
+"""
+
+import math
+
+import numpy as np
+
+from polarband.hrv import HrvEngine, LF_BAND
+
+
+def recompute(window_beats, engine):
+    # (time s, IBI ms, successive difference ms or NaN) of the beats in the window
+    times = np.array([b[0] for b in window_beats])
+    ibis = np.array([b[1] for b in window_beats])
+    d = np.array([b[2] for b in window_beats[1:]])
+    d = d[~np.isnan(d)]
+    rmssd = math.sqrt(np.mean(d * d)) if len(d) else float("nan")
+    pnn50 = 100.0 * np.mean(np.abs(d) > 50.0) if len(d) else float("nan")
+    sdnn = np.std(ibis, ddof=1)
+    span = times[-1] - times[0]
+    if span < 1.0 / LF_BAND[0]:
+        return [rmssd, sdnn, pnn50, float("nan"), float("nan"), float("nan")]
+    y = ibis - ibis.mean()
+    wt = np.outer(engine.omega, times - times[0])
+    tau = np.arctan2(np.sin(2 * wt).sum(1), np.cos(2 * wt).sum(1)) / 2
+    a = wt - tau[:, None]
+    c, s = np.cos(a), np.sin(a)
+    p = 0.5 * ((c @ y) ** 2 / (c * c).sum(1) + (s @ y) ** 2 / (s * s).sum(1))
+    scale = 2.0 * span * engine.df / len(ibis)
+    lf = p[engine.freqs < LF_BAND[1]].sum() * scale
+    hf = p.sum() * scale - lf
+    return [rmssd, sdnn, pnn50, lf, hf, lf / hf]
+
+
+def close(a, b):
+    return all((math.isnan(x) and math.isnan(y)) or abs(x - y) <= 1e-9 * max(abs(y), 1.0)
+               for x, y in zip(a, b))
+
+
+def test_engine_matches_recompute_with_artefacts():
+    rng = np.random.default_rng(0)
+    window = 40.0
+    engine = HrvEngine(window)
+    accepted = []
+    last = None
+    t = 0.0
+    checked = 0
+    for k in range(600):
+        ibi = 0.8 + 0.04 * math.sin(2 * math.pi * 0.1 * t) + rng.normal(0, 0.03)
+        if rng.random() < 0.03:
+            ibi = 2.5       # artefact: skipped, breaks the successive differences
+        t += ibi
+        values = engine.beat(t, ibi)
+        if not engine.min_ibi <= ibi <= engine.max_ibi:
+            last = None
+            assert values is None
+            continue
+        ms = ibi * 1000.0
+        d = ms - last if last is not None and any(b[0] > t - window for b in accepted) \
+            else float("nan")
+        last = ms
+        accepted.append((t, ms, d))
+        in_window = [b for b in accepted if b[0] > t - window]
+        if values is None:
+            assert len(in_window) < engine.min_beats
+            continue
+        assert close(values, recompute(in_window, engine))
+        checked += 1
+    assert checked > 500
+
+
+def test_reset_and_missing_differences_give_nan():
+    engine = HrvEngine(30.0)
+    t = 0.0
+    for k in range(60):
+        t += 0.8 + 0.05 * (k % 3)
+        engine.beat(t, 0.8 + 0.05 * (k % 3))
+    assert not math.isnan(engine.values[0])
+    engine.reset()
+    assert all(math.isnan(v) for v in engine.values)
+    # beats separated by artefacts: no successive difference in the window
+    for k in range(4):
+        t += 0.8
+        values = engine.beat(t, 0.8)
+        t += 2.5
+        engine.beat(t, 2.5)
+    assert values is not None
+    assert math.isnan(values[0]) and math.isnan(values[2])
+    assert not math.isnan(values[1])
@@ -0,0 +1,124 @@
+"""
+decode_ecg and decode_acc against straightforward per-sample, per-bit references.
+"""
+
+import numpy as np
+import pytest
+
+from polarband.pmd import (decode_ecg, encode_ecg, decode_acc, encode_acc, ACC_CHANNELS,
+                           MEASUREMENT_ACC, FRAME_COMPRESSED, PMD_HEADER_SIZE)
+
+
+def signed(value, bits):
+    return value - (1 << bits) if value & (1 << (bits - 1)) else value
+
+
+def reference_ecg(data):
+    body = data[PMD_HEADER_SIZE:]
+    return [signed(int.from_bytes(body[i:i + 3], "little"), 24)
+            for i in range(0, len(body) - 2, 3)]
+
+
+def reference_acc(data, resolution=16):
+    # one sample, one bit at a time
+    frame_type, body = data[PMD_HEADER_SIZE - 1], bytes(data[PMD_HEADER_SIZE:])
+    if not frame_type & FRAME_COMPRESSED:
+        width = (frame_type & 0x7F) + 1
+        values = [signed(int.from_bytes(body[i:i + width], "little"), 8 * width)
+                  for i in range(0, len(body) - width + 1, width)]
+        n = len(values) // ACC_CHANNELS
+        return [values[k * ACC_CHANNELS:(k + 1) * ACC_CHANNELS] for k in range(n)]
+    size = (resolution + 7) // 8
+    if len(body) < size * ACC_CHANNELS:
+        return []
+    sample = [signed(int.from_bytes(body[i * size:(i + 1) * size], "little"), 8 * size)
+              for i in range(ACC_CHANNELS)]
+    samples = [list(sample)]
+    offset = size * ACC_CHANNELS
+    while offset + 2 <= len(body):
+        bits, count = body[offset], body[offset + 1]
+        offset += 2
+        nbytes = (bits * count * ACC_CHANNELS + 7) // 8
+        if count == 0 or bits == 0 or offset + nbytes > len(body):
+            break
+        position = 8 * offset
+        for k in range(count):
+            for axis in range(ACC_CHANNELS):
+                value = 0
+                for b in range(bits):
+                    value |= ((body[position // 8] >> (position % 8)) & 1) << b
+                    position += 1
+                sample[axis] += signed(value, bits)
+            samples.append(list(sample))
+        offset += nbytes
+    return samples
+
+
+def reference_compressed(ref, blocks, resolution=16):
+    # ref: 3 values; blocks: (bits, count x 3 deltas), packed LSB first
+    size = (resolution + 7) // 8
+    body = b"".join((v & ((1 << 8 * size) - 1)).to_bytes(size, "little") for v in ref)
+    for bits, deltas in blocks:
+        stream = [(int(d) >> b) & 1 for d in np.asarray(deltas).reshape(-1) for b in range(bits)]
+        stream += [0] * (-len(stream) % 8)
+        body += bytes([bits, len(deltas)])
+        body += bytes(sum(stream[i + b] << b for b in range(8)) for i in range(0, len(stream), 8))
+    header = bytes([MEASUREMENT_ACC]) + (123456789).to_bytes(8, "little") + bytes([FRAME_COMPRESSED])
+    return bytearray(header + body)
+
+
+def test_ecg_matches_reference():
+    rng = np.random.default_rng(0)
+    samples = rng.integers(-(1 << 23), 1 << 23, 73)
+    data = encode_ecg(samples, 42)
+    assert reference_ecg(data) == samples.tolist()
+    assert decode_ecg(data).tolist() == samples.tolist()
+
+
+@pytest.mark.parametrize("width", [1, 2, 3])
+def test_plain_acc_matches_reference(width):
+    rng = np.random.default_rng(width)
+    values = rng.integers(-(1 << (8 * width - 1)), 1 << (8 * width - 1), (20, ACC_CHANNELS))
+    body = b"".join((int(v) & ((1 << 8 * width) - 1)).to_bytes(width, "little")
+                    for v in values.reshape(-1))
+    data = bytearray(bytes([MEASUREMENT_ACC]) + bytes(8) + bytes([width - 1]) + body + b"\x01")
+    assert reference_acc(data) == values.tolist()
+    assert decode_acc(data).tolist() == values.tolist()
+
+
+def test_compressed_acc_matches_reference():
+    rng = np.random.default_rng(2)
+    for trial in range(50):
+        ref = rng.integers(-(1 << 15), 1 << 15, ACC_CHANNELS).tolist()
+        blocks = []
+        for b in range(int(rng.integers(0, 4))):
+            bits = int(rng.integers(1, 17))
+            count = int(rng.integers(1, 40))
+            blocks.append((bits, rng.integers(-(1 << (bits - 1)), 1 << (bits - 1) if bits > 1 else 1,
+                                              (count, ACC_CHANNELS))))
+        data = reference_compressed(ref, blocks)
+        expected = reference_acc(data)
+        assert len(expected) == 1 + sum(len(d) for bits, d in blocks)
+        assert decode_acc(data).tolist() == expected
+        # a frame cut anywhere decodes like the reference does
+        cut = data[:int(rng.integers(PMD_HEADER_SIZE, len(data) + 1))]
+        assert decode_acc(cut).tolist() == reference_acc(cut)
+
+
+def test_truncated_and_empty_compressed_acc():
+    header = bytes([MEASUREMENT_ACC]) + bytes(8) + bytes([FRAME_COMPRESSED])
+    for body in (b"", b"\x01", b"\x01\x02\x03\x04\x05"):
+        samples = decode_acc(bytearray(header + body))
+        assert samples.shape == (0, ACC_CHANNELS)
+        assert samples.dtype == np.int32
+    assert decode_acc(bytearray(header + bytes(6))).tolist() == [[0, 0, 0]]
+    assert decode_acc(bytearray(header)).shape == (0, ACC_CHANNELS)
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_encode_acc_round_trip(compressed):
+    rng = np.random.default_rng(3)
+    samples = np.cumsum(rng.integers(-300, 300, (36, ACC_CHANNELS)), axis=0) + 1000
+    data = encode_acc(samples, 7, compressed=compressed)
+    assert reference_acc(data) == samples.tolist()
+    assert decode_acc(data).tolist() == samples.tolist()